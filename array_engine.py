@@ -0,0 +1,423 @@
+"""
+Array-backed version of the round-robin simulation of elo.py.
+
+Skills, elo ratings and k factors are stored as numpy vectors instead of Player objects. All the outcomes of a journey
+are drawn in one batch (they only depend on the skills) and the elo updates are then applied in the exact same order
+as the nested loops of simulate_elo_static. With the same seed, both paths give the same elo histories.
+"""
+
+import numpy as np
+from expected_score import expected_scores
+
+# Same resolution as Player.play, so both engines turn the same random draw into the same result
+PRECISION = 10000
+
+
+def conflict_free_levels(first, second, nb_players):
+    """Groups games in levels where no player plays twice, keeping the order of the games of each player: applying
+    the levels one after the other, each as one array operation, gives the same ratings as the sequential loop.
+
+    Arguments:
+        first {list} -- Index of the first player of each game
+        second {list} -- Index of the second player of each game
+        nb_players {int} -- Number of players, above every index
+
+    Returns:
+        list -- Indices of the games of each level, as arrays
+    """
+    # Level of a game = 1 + the highest level of the previous games of both players
+    last_level = [-1] * nb_players
+    levels = []
+    for i, j in zip(first, second):
+        level = max(last_level[i], last_level[j]) + 1
+        last_level[i] = level
+        last_level[j] = level
+        levels.append(level)
+    if not levels:
+        return []
+    levels = np.array(levels, dtype=np.intp)
+    order = np.argsort(levels, kind="stable")
+    bounds = np.searchsorted(levels[order], np.arange(levels.max() + 2))
+    return [order[bounds[l] : bounds[l + 1]] for l in range(len(bounds) - 1)]
+
+
+class RoundRobinSchedule(object):
+    """
+    The games of one journey (each player plays once against each other player), in the order used by elo.py:
+    (0, 1), (0, 2), ..., (0, n-1), (1, 2), ...
+
+    The games are grouped by levels. Two games of the same level never share a player, so a whole level can be
+    applied as one array operation while giving exactly the same result as the sequential loop.
+    """
+
+    def __init__(self, nb_players):
+        self.nb_players = nb_players
+        pairs = [(i, j) for i in range(nb_players) for j in range(i + 1, nb_players)]
+        self.nb_games = len(pairs)
+        self.i = np.array([p[0] for p in pairs], dtype=np.intp)
+        self.j = np.array([p[1] for p in pairs], dtype=np.intp)
+        self.levels = conflict_free_levels(self.i.tolist(), self.j.tolist(), nb_players)
+
+        # Index of the game in each player's own history during the journey. Player i has already played the games
+        # (0, i) ... (i-1, i) and (i, i+1) ... (i, j-1) before (i, j), player j has played (0, j) ... (i-1, j).
+        self.game_index_i = self.j - 1
+        self.game_index_j = self.i.copy()
+
+
+class ArrayPlayers(object):
+    """
+    Array-backed equivalent of a list of Player objects
+    """
+
+    def __init__(self, names, skills, elo, k_factor):
+        self.names = list(names)
+        self.skill = np.asarray(skills, dtype=float)
+        self.elo = np.full(len(self.skill), elo, dtype=float)
+        self.k_factor = np.full(len(self.skill), k_factor, dtype=float)
+
+    def __len__(self):
+        return len(self.skill)
+
+    def __repr__(self):
+        return "ArrayPlayers: {} players, skills {}, elo ratings {}".format(
+            len(self), self.skill, self.elo
+        )
+
+
+def play_journeys(
+    players,
+    schedule,
+    nb_journeys,
+    rng,
+    divider,
+    history,
+    start=0,
+    on_journey=None,
+    expected_table=None,
+):
+    """Plays 'nb_journeys' round-robin journeys and updates the ratings in place.
+
+    Arguments:
+        players {ArrayPlayers} -- The players
+        schedule {RoundRobinSchedule} -- Schedule built for len(players) players
+        nb_journeys {int} -- Number of journeys to play
+        rng {np.random.Generator} -- Source of randomness
+        divider {float} -- Elo divider (400 in the usual formula)
+        history {np.ndarray} -- (games x players) matrix, row 'start' must already hold the current ratings
+
+    Keyword Arguments:
+        start {int} -- Row of 'history' holding the ratings before the first journey (default: {0})
+        on_journey {function} -- Called after each journey with the row of 'history' holding the new ratings.
+        If it returns True, no more journeys are played (default: {None})
+        expected_table {expected_score.ExpectedScoreTable} -- If not None, the expected scores are looked up in
+        this table instead of being computed like Player.expected_result (default: {None})
+
+    Returns:
+        int -- Row of 'history' holding the ratings after the last journey
+    """
+    proba_of_wining = players.skill[schedule.i] / (
+        players.skill[schedule.i] + players.skill[schedule.j]
+    )
+    threshold = PRECISION * proba_of_wining
+    elo = players.elo
+    k_factor = players.k_factor
+    for journey in range(nb_journeys):
+        # Same test as Player.play: a loss if rand >= precision * proba_of_wining
+        rand = rng.integers(0, PRECISION + 1, size=schedule.nb_games)
+        results = (rand < threshold).astype(float)
+        for level in schedule.levels:
+            i = schedule.i[level]
+            j = schedule.j[level]
+            expected = expected_scores(
+                elo[i] - elo[j], divider, expected_table, exact=True
+            )
+            delta_points = k_factor[i] * (results[level] - expected)
+            elo[i] = elo[i] + delta_points
+            elo[j] = elo[j] - delta_points
+            history[start + 1 + schedule.game_index_i[level], i] = elo[i]
+            history[start + 1 + schedule.game_index_j[level], j] = elo[j]
+        start += len(players) - 1
+        if on_journey is not None and on_journey(start):
+            break
+    return start
+
+
+def play_kernel_journeys(
+    kernel,
+    state,
+    skills,
+    schedule,
+    nb_journeys,
+    rng,
+    history=None,
+    start=0,
+    on_journey=None,
+    predictions=None,
+):
+    """Plays 'nb_journeys' round-robin journeys with any rating kernel of rating_kernels.py. The games are drawn like
+    play_journeys: with the same seed both play the same games, and the elo kernel gives the same ratings.
+
+    Arguments:
+        kernel {rating_kernels.RatingKernel} -- The rating system
+        state {dict} -- State of the players (kernel.new_state), updated in place
+        skills {list} -- Skill of each player
+        schedule {RoundRobinSchedule} -- Schedule built for len(skills) players
+        nb_journeys {int} -- Number of journeys to play
+        rng {np.random.Generator} -- Source of randomness
+
+    Keyword Arguments:
+        history {np.ndarray} -- If not None, (games x players) matrix receiving the ratings, see play_journeys
+        (default: {None})
+        start {int} -- Row of 'history' holding the ratings before the first journey (default: {0})
+        on_journey {function} -- See play_journeys (default: {None})
+        predictions {rating_kernels.PredictionScore} -- If not None, receives the expected result of every game
+        before it is applied (default: {None})
+
+    Returns:
+        int -- Row of 'history' holding the ratings after the last journey
+    """
+    skill = np.asarray(skills, dtype=float)
+    threshold = PRECISION * skill[schedule.i] / (skill[schedule.i] + skill[schedule.j])
+    for journey in range(nb_journeys):
+        rand = rng.integers(0, PRECISION + 1, size=schedule.nb_games)
+        results = (rand < threshold).astype(float)
+        for level in schedule.levels:
+            i = schedule.i[level]
+            j = schedule.j[level]
+            if predictions is not None:
+                predictions.add(kernel.expected(state, i, j), results[level])
+            kernel.update(state, i, j, results[level])
+            if history is not None:
+                history[start + 1 + schedule.game_index_i[level], i] = kernel.ratings(
+                    state, i
+                )
+                history[start + 1 + schedule.game_index_j[level], j] = kernel.ratings(
+                    state, j
+                )
+        start += len(skill) - 1
+        if on_journey is not None and on_journey(start):
+            break
+    return start
+
+
+def simulate_replicates(
+    skills,
+    stages,
+    nb_replicates,
+    rng,
+    divider,
+    starting_elo,
+    percentiles=(5, 25, 50, 75, 95),
+    tracker=None,
+    stop_when_converged=False,
+    expected_table=None,
+):
+    """Simulates 'nb_replicates' independent round-robin seasons at once and returns per-player statistics.
+
+    The ratings are stored as a (replicates x players) matrix, so each level of the schedule updates every replicate
+    with one array operation. The ratings after each game of a journey are kept until the end of the journey and the
+    statistics over the replicates are computed once per journey, so the full histories of every replicate are never
+    stored.
+
+    Arguments:
+        skills {list} -- Skill of each player
+        stages {list} -- (nb_journeys, k_factor) for each stage of the season, e.g. [(2, 100), (20, 25)] for
+        2 journeys of placement games followed by 20 journeys of normal games
+        nb_replicates {int} -- Number of independent seasons
+        rng {np.random.Generator} -- Source of randomness
+        divider {float} -- Elo divider (400 in the usual formula)
+        starting_elo {float} -- Elo of every player at the start of the season
+
+    Keyword Arguments:
+        percentiles {tuple} -- Percentiles to compute (default: {(5, 25, 50, 75, 95)})
+        tracker {convergence.ConvergenceTracker} -- If not None, updated with the (replicates x players) ratings
+        after each journey (default: {None})
+        stop_when_converged {bool} -- Stops as soon as the tracker says that every replicate converged, the
+        returned matrices then end at that journey (default: {False})
+        expected_table {expected_score.ExpectedScoreTable} -- If not None, the expected scores are looked up in
+        this table (default: {None})
+
+    Returns:
+        dict -- "mean" and "std" are (games x players) matrices, "percentiles" maps each percentile to a
+        (games x players) matrix, "correct_order" is the fraction of replicates where the elo ratings are sorted like
+        the skills, measured at the start and at the end of each journey, "journey_rows" gives the history row of
+        those measures and "final" is the (replicates x players) matrix of the final elo ratings.
+    """
+    skills = np.asarray(skills, dtype=float)
+    nb_players = len(skills)
+    schedule = RoundRobinSchedule(nb_players)
+    nb_rows = 1 + sum(nb_journeys for nb_journeys, k in stages) * (nb_players - 1)
+    mean = np.empty((nb_rows, nb_players))
+    std = np.empty((nb_rows, nb_players))
+    quantiles = np.empty((len(percentiles), nb_rows, nb_players))
+    elo = np.full((nb_replicates, nb_players), starting_elo, dtype=float)
+    mean[0] = starting_elo
+    std[0] = 0
+    quantiles[:, 0] = starting_elo
+
+    by_skill = np.argsort(skills, kind="stable")
+    correct_order = [np.mean(np.all(np.diff(elo[:, by_skill], axis=1) > 0, axis=1))]
+    journey_rows = [0]
+
+    threshold = (
+        PRECISION * skills[schedule.i] / (skills[schedule.i] + skills[schedule.j])
+    )
+    # Elo of each player after each of their games of the current journey: replicates x games x players
+    journey_elo = np.empty((nb_replicates, nb_players - 1, nb_players))
+    start = 0
+    stopped = False
+    for nb_journeys, k_factor in stages:
+        for journey in range(nb_journeys):
+            if stopped:
+                break
+            rand = rng.integers(
+                0, PRECISION + 1, size=(nb_replicates, schedule.nb_games)
+            )
+            results = (rand < threshold).astype(float)
+            for level in schedule.levels:
+                i = schedule.i[level]
+                j = schedule.j[level]
+                expected = expected_scores(
+                    elo[:, i] - elo[:, j], divider, expected_table
+                )
+                delta_points = k_factor * (results[:, level] - expected)
+                elo[:, i] += delta_points
+                elo[:, j] -= delta_points
+                journey_elo[:, schedule.game_index_i[level], i] = elo[:, i]
+                journey_elo[:, schedule.game_index_j[level], j] = elo[:, j]
+            rows = slice(start + 1, start + nb_players)
+            mean[rows] = journey_elo.mean(axis=0)
+            std[rows] = journey_elo.std(axis=0)
+            quantiles[:, rows] = np.percentile(journey_elo, percentiles, axis=0)
+            start += nb_players - 1
+            correct_order.append(
+                np.mean(np.all(np.diff(elo[:, by_skill], axis=1) > 0, axis=1))
+            )
+            journey_rows.append(start)
+            if tracker is not None:
+                stopped = tracker.update(elo, start) and stop_when_converged
+
+    return {
+        "mean": mean[: start + 1],
+        "std": std[: start + 1],
+        "percentiles": dict(zip(percentiles, quantiles[:, : start + 1])),
+        "correct_order": np.array(correct_order),
+        "journey_rows": np.array(journey_rows),
+        "final": elo,
+    }
+
+
+def replicate_journeys(
+    skills, stages, nb_replicates, rng, divider, starting_elo, expected_table=None
+):
+    """Plays 'nb_replicates' independent round-robin seasons at once like simulate_replicates, but only yields the
+    ratings after each journey instead of computing statistics: nothing is kept between two journeys.
+
+    Arguments:
+        skills {list} -- Skill of each player
+        stages {list} -- (number of journeys, K factor) pairs played one after the other
+        nb_replicates {int} -- Number of seasons
+        rng {np.random.Generator} -- Source of randomness
+        divider {float} -- Elo divider
+        starting_elo {float} -- Elo of every player before the first journey
+
+    Keyword Arguments:
+        expected_table {expected_score.ExpectedScoreTable} -- See simulate_replicates (default: {None})
+
+    Yields:
+        tuple -- (row, elo) where row is the number of games played by each player so far, 0 before the first
+        journey, and elo the (replicates x players) ratings, updated in place by the next journey
+    """
+    skills = np.asarray(skills, dtype=float)
+    nb_players = len(skills)
+    schedule = RoundRobinSchedule(nb_players)
+    elo = np.full((nb_replicates, nb_players), starting_elo, dtype=float)
+    threshold = (
+        PRECISION * skills[schedule.i] / (skills[schedule.i] + skills[schedule.j])
+    )
+    row = 0
+    yield row, elo
+    for nb_journeys, k_factor in stages:
+        for journey in range(nb_journeys):
+            rand = rng.integers(
+                0, PRECISION + 1, size=(nb_replicates, schedule.nb_games)
+            )
+            results = (rand < threshold).astype(float)
+            for level in schedule.levels:
+                i = schedule.i[level]
+                j = schedule.j[level]
+                expected = expected_scores(
+                    elo[:, i] - elo[:, j], divider, expected_table
+                )
+                delta_points = k_factor * (results[:, level] - expected)
+                elo[:, i] += delta_points
+                elo[:, j] -= delta_points
+            row += nb_players - 1
+            yield row, elo
+
+
+def simulate_elohell(
+    nb_players,
+    nb_placement,
+    nb_games,
+    winrate,
+    rng,
+    starting_elo,
+    k_factor_placements,
+    k_factor,
+    history=None,
+    chunk_size=100000,
+):
+    """Elo hell version of the simulation: every player has a fixed winrate against opponents of his own elo.
+
+    The expected result against an opponent of the same elo is always 0.5, so every game moves the elo by exactly
+    +K/2 or -K/2. The results are drawn in batches and each trajectory is the cumulative sum of its steps, with the
+    same draws in the same order as the Player path (all the placement games of player 0, of player 1..., then all
+    the normal games of player 0, of player 1...).
+
+    Arguments:
+        nb_players {int} -- Number of players
+        nb_placement {int} -- Number of placement games of each player (played with k_factor_placements)
+        nb_games {int} -- Total number of games of each player, placement games included
+        winrate {float} -- Probability of winning each game
+        rng {np.random.Generator} -- Source of randomness
+        starting_elo {float} -- Elo of every player before the first game
+        k_factor_placements {float} -- K factor of the placement games
+        k_factor {float} -- K factor of the normal games
+
+    Keyword Arguments:
+        history {np.ndarray} -- If not None, (1 + max(nb_games, nb_placement)) x nb_players matrix (or np.memmap)
+        receiving the trajectories: all the placement games are played even if there are more than nb_games. Without it only the final ratings are computed (default: {None})
+        chunk_size {int} -- Number of players drawn at once, only limits the memory used (default: {100000})
+
+    Returns:
+        np.ndarray -- Final elo of each player
+    """
+    elo = np.full(nb_players, starting_elo, dtype=float)
+    if history is not None:
+        history[0] = elo
+    threshold = PRECISION * winrate
+    row = 0
+    for nb_mode_games, k in (
+        (nb_placement, k_factor_placements),
+        (nb_games - nb_placement, k_factor),
+    ):
+        if nb_mode_games <= 0:
+            continue
+        # Consecutive chunks of players use consecutive draws, so chunking does not change the results
+        for first in range(0, nb_players, chunk_size):
+            last = min(first + chunk_size, nb_players)
+            rand = rng.integers(
+                0, PRECISION + 1, size=(last - first, nb_mode_games), dtype=np.int32
+            )
+            # Same test as Player.play_forced_winrate: a loss if rand >= precision * winrate
+            steps = np.where(rand < threshold, k * 0.5, -k * 0.5)
+            if history is not None:
+                steps[:, 0] += elo[first:last]
+                trajectories = np.cumsum(steps, axis=1)
+                history[row + 1 : row + 1 + nb_mode_games, first:last] = trajectories.T
+                elo[first:last] = trajectories[:, -1]
+            else:
+                elo[first:last] += steps.sum(axis=1)
+        row += nb_mode_games
+    return elo
@@ -0,0 +1,552 @@
+"""
+Benchmarks of the hot paths of the simulations, on fixed seeds and a ladder of sizes.
+
+Each benchmark prepares its inputs, then its run is timed 'repeats' times (the best time is kept, the median is
+reported too) and run once more under tracemalloc for the peak memory it allocates (numpy arrays included). The
+throughput is counted in games (or points, evaluations, frames) per second; the rendering benchmarks also report the
+time per frame.
+
+The results are written as JSON with the versions of Python, numpy and the commit they ran on, and can be compared
+against a saved baseline: a throughput lower than the baseline by more than the tolerance, or a peak memory higher by
+more than the memory tolerance, is flagged as a regression (and the exit status is 1).
+"""
+
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+import numpy as np
+
+
+def _players(nb_players, seed):
+    import simulation
+
+    rng = np.random.default_rng(seed)
+    return [
+        simulation.Player(i, skill, elo=elo)
+        for i, (skill, elo) in enumerate(
+            zip(range(10, 10 + nb_players), rng.normal(1500, 200, nb_players))
+        )
+    ]
+
+
+def player_update(size, seed):
+    """Player.expected_result and Player.update on 'size' games between 100 players"""
+    players = _players(100, seed)
+    rng = np.random.default_rng(seed)
+    first = rng.integers(0, 100, size)
+    second = (first + rng.integers(1, 100, size)) % 100
+    pairs = [(players[i], players[j]) for i, j in zip(first.tolist(), second.tolist())]
+    results = rng.integers(0, 2, size).tolist()
+
+    def run():
+        for (player, other), result in zip(pairs, results):
+            player.expected_result(other)
+            player.update(other, result)
+
+    return run, size
+
+
+def _season(size, seed, engine="player", elohell=False, expected_table=None):
+    """A round-robin season of 'size' players, each playing about 2000 games, 100 of them placements"""
+    import simulation
+
+    nb_games = 2000
+
+    def run():
+        simulation.play_season(
+            size,
+            nb_games,
+            100,
+            10,
+            5,
+            elohell=elohell,
+            engine=engine,
+            seed=seed,
+            expected_table=expected_table,
+        )
+
+    if elohell:
+        return run, size * nb_games
+    # Same number of journeys as play_season: every pair of players plays once per journey
+    nb_journeys = math.ceil(100 / (size - 1)) + math.ceil((nb_games - 100) / (size - 1))
+    return run, nb_journeys * size * (size - 1) // 2
+
+
+def static_player(size, seed):
+    """The round-robin loop of simulate_elo_static with Player objects"""
+    return _season(size, seed)
+
+
+def static_numpy(size, seed):
+    """The round-robin loop of simulate_elo_static with the numpy engine"""
+    return _season(size, seed, engine="numpy")
+
+
+def static_numpy_table(size, seed):
+    """static_numpy with the expected results looked up in an interpolated table of 1 point buckets"""
+    from expected_score import ExpectedScoreTable
+
+    return _season(size, seed, engine="numpy", expected_table=ExpectedScoreTable())
+
+
+def elohell_player(size, seed):
+    """The elohell path of simulate_elo_static with Player objects"""
+    return _season(size, seed, elohell=True)
+
+
+def elohell_numpy(size, seed):
+    """The elohell path of simulate_elo_static with the numpy engine"""
+    return _season(size, seed, engine="numpy", elohell=True)
+
+
+def _replay(size, seed, kernel=None):
+    """'size' random matches between 10000 players, replayed in chunks of 100000 by replay.StreamingElo or by
+    replay.KernelRatings with the kernel 'kernel' of rating_kernels.py"""
+    import replay
+    import rating_kernels
+
+    skills = np.arange(10, 10010)
+    first, second, results = rating_kernels.random_log(
+        size, skills, np.random.default_rng(seed)
+    )
+
+    def run():
+        if kernel is None:
+            ratings = replay.StreamingElo()
+        else:
+            ratings = replay.KernelRatings(rating_kernels.KERNELS[kernel]())
+        for chunk in range(0, size, 100000):
+            end = chunk + 100000
+            ratings.play(first[chunk:end], second[chunk:end], results[chunk:end])
+
+    return run, size
+
+
+def replay_scalar(size, seed):
+    """The scalar elo loop of replay.StreamingElo"""
+    return _replay(size, seed)
+
+
+def replay_elo_kernel(size, seed):
+    """replay.KernelRatings with the elo kernel"""
+    return _replay(size, seed, "elo")
+
+
+def replay_glicko2_kernel(size, seed):
+    """replay.KernelRatings with the Glicko-2 kernel"""
+    return _replay(size, seed, "glicko2")
+
+
+def replay_trueskill_kernel(size, seed):
+    """replay.KernelRatings with the TrueSkill-style kernel"""
+    return _replay(size, seed, "trueskill")
+
+
+def create_team_and_play(size, seed):
+    """elo_hell.create_team_and_play, 'size' games"""
+    import elo_hell
+
+    def run():
+        rng = np.random.default_rng(seed)
+        for i in range(size):
+            elo_hell.create_team_and_play(rng=rng)
+
+    return run, size
+
+
+def simulate_duel(size, seed):
+    """tennis.simulate_duel, 'size' matchs of 101 points, counted in points"""
+    import tennis
+
+    def run():
+        tennis.simulate_duel(0.51, size, 101, np.random.default_rng(seed), False)
+
+    return run, size * 101
+
+
+def expected_win_rate(size, seed):
+    """bga.expected_win_rate called on 'size' elo differences one at a time, like bga.main"""
+    import bga
+
+    deltas = np.random.default_rng(seed).uniform(-800, 800, size)
+
+    def run():
+        [bga.expected_win_rate(delta) for delta in deltas]
+
+    return run, size
+
+
+def expected_win_rate_array(size, seed):
+    """bga.expected_win_rate on an array of 'size' elo differences"""
+    import bga
+
+    deltas = np.random.default_rng(seed).uniform(-800, 800, size)
+
+    def run():
+        bga.expected_win_rate(deltas)
+
+    return run, size
+
+
+def _agg():
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def plot_static(size, seed):
+    """The plot of simulate_elo_static, one frame per run
+
+    elo.plot_static_season is drawn on an Agg canvas for a numpy season of 'size' players.
+    """
+    import elo
+    import simulation
+
+    plt = _agg()
+    season = simulation.play_season(size, 2000, 100, 10, 5, engine="numpy", seed=seed)
+
+    def run():
+        figure = plt.figure()
+        elo.plot_static_season(
+            season["history"], season["names"], season["placement_games"]
+        )
+        figure.canvas.draw()
+        plt.close(figure)
+
+    return run, 1
+
+
+def live_frames(size, seed):
+    """Frames of the live display of the dynamic mode
+
+    live_plot.LiveRenderer draws 100 frames of one journey each on an Agg canvas, for 'size' players.
+    """
+    import live_plot
+    import simulation
+
+    plt = _agg()
+    nb_frames = 100
+    history = simulation.play_season(
+        size, nb_frames * (size - 1), 0, 10, 5, engine="numpy", seed=seed
+    )["history"]
+    blocks = np.array_split(history[1:], nb_frames)
+    names = [str(p) for p in range(size)]
+
+    def run():
+        renderer = live_plot.LiveRenderer(names, history[0])
+        for block in blocks:
+            renderer.append(block)
+            renderer.draw()
+        plt.close(renderer.figure)
+
+    return run, nb_frames
+
+
+# name -> (benchmark, unit, ladder of sizes)
+BENCHMARKS = {
+    "player_update": (player_update, "games", (10000, 100000, 1000000)),
+    "static_player": (static_player, "games", (5, 10, 20)),
+    "static_numpy": (static_numpy, "games", (5, 10, 20, 50)),
+    "static_numpy_table": (static_numpy_table, "games", (5, 10, 20, 50)),
+    "elohell_player": (elohell_player, "games", (5, 10, 20)),
+    "elohell_numpy": (elohell_numpy, "games", (50, 500, 5000)),
+    "replay_scalar": (replay_scalar, "games", (10000, 100000, 1000000)),
+    "replay_elo_kernel": (replay_elo_kernel, "games", (10000, 100000, 1000000)),
+    "replay_glicko2_kernel": (
+        replay_glicko2_kernel,
+        "games",
+        (10000, 100000, 1000000),
+    ),
+    "replay_trueskill_kernel": (
+        replay_trueskill_kernel,
+        "games",
+        (10000, 100000, 1000000),
+    ),
+    "create_team_and_play": (create_team_and_play, "games", (1000, 10000, 50000)),
+    "simulate_duel": (simulate_duel, "points", (100, 1000, 5000)),
+    "expected_win_rate": (expected_win_rate, "evaluations", (1000, 10000, 100000)),
+    "expected_win_rate_array": (
+        expected_win_rate_array,
+        "evaluations",
+        (10000, 100000, 1000000),
+    ),
+    "plot_static": (plot_static, "frames", (5, 10, 20)),
+    "live_frames": (live_frames, "frames", (2, 5, 10)),
+}
+
+
+def run_benchmark(name, size, seed=0, repeats=3, memory=True):
+    """Times one benchmark at one size.
+
+    Arguments:
+        name {str} -- Key of BENCHMARKS
+        size {int} -- Size of the benchmark, one of its ladder or any other
+
+    Keyword Arguments:
+        seed {int} -- Seed of the inputs and of the simulations (default: {0})
+        repeats {int} -- Number of timed runs (default: {3})
+        memory {bool} -- Also measures the peak memory with one more run under tracemalloc (default: {True})
+
+    Returns:
+        dict -- "benchmark", "size", "unit", "units" (work done by a run), "seconds" (best run), "median",
+        "per_second" (units per second of the best run), "peak_memory" (bytes allocated at the peak of a run, None
+        if not measured) and, for the rendering benchmarks, "seconds_per_frame"
+    """
+    benchmark, unit, ladder = BENCHMARKS[name]
+    timings = []
+    for repeat in range(repeats):
+        # The inputs are prepared again for each run so that a run never sees the state left by the previous one
+        run, units = benchmark(size, seed)
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    peak_memory = None
+    if memory:
+        run, units = benchmark(size, seed)
+        tracemalloc.start()
+        try:
+            run()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    best = min(timings)
+    result = {
+        "benchmark": name,
+        "size": size,
+        "unit": unit,
+        "units": units,
+        "seconds": best,
+        "median": statistics.median(timings),
+        "per_second": units / best,
+        "peak_memory": peak_memory,
+    }
+    if unit == "frames":
+        result["seconds_per_frame"] = best / units
+    return result
+
+
+def environment():
+    """Returns what the results depend on besides the code: versions, machine and commit"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def run_suite(
+    names=None, seed=0, repeats=3, memory=True, ladder_steps=None, verbose=True
+):
+    """Runs benchmarks over their ladder of sizes.
+
+    Keyword Arguments:
+        names {list} -- Benchmarks to run, all of BENCHMARKS if None (default: {None})
+        seed {int} -- See run_benchmark (default: {0})
+        repeats {int} -- See run_benchmark (default: {3})
+        memory {bool} -- See run_benchmark (default: {True})
+        ladder_steps {int} -- Only runs the first 'ladder_steps' sizes of each ladder, all of them if None
+        (default: {None})
+        verbose {bool} -- Prints each result as it comes (default: {True})
+
+    Returns:
+        dict -- "environment", "settings" and "results" (list of the dicts of run_benchmark)
+    """
+    if names is None:
+        names = list(BENCHMARKS)
+    results = []
+    for name in names:
+        for size in BENCHMARKS[name][2][:ladder_steps]:
+            result = run_benchmark(name, size, seed, repeats, memory)
+            results.append(result)
+            if verbose:
+                print(format_result(result), flush=True)
+    return {
+        "environment": environment(),
+        "settings": {"seed": seed, "repeats": repeats},
+        "results": results,
+    }
+
+
+def format_result(result):
+    line = "{:<24} {:>8} {:>12.0f} {}/s  {:8.4f}s".format(
+        result["benchmark"],
+        result["size"],
+        result["per_second"],
+        result["unit"],
+        result["seconds"],
+    )
+    if "seconds_per_frame" in result:
+        line += "  {:7.1f} ms/frame".format(1000 * result["seconds_per_frame"])
+    if result["peak_memory"] is not None:
+        line += "  peak {:.1f} MiB".format(result["peak_memory"] / 2**20)
+    return line
+
+
+def compare(suite, baseline, tolerance=0.1, memory_tolerance=0.2):
+    """Compares the results of a suite with a baseline, benchmark by benchmark and size by size.
+
+    Arguments:
+        suite {dict} -- Returned by run_suite
+        baseline {dict} -- Same, e.g. loaded from a saved JSON file
+
+    Keyword Arguments:
+        tolerance {float} -- Relative slowdown of the throughput flagged as a regression (default: {0.1})
+        memory_tolerance {float} -- Relative growth of the peak memory flagged as a regression (default: {0.2})
+
+    Returns:
+        list -- One dict per benchmark and size found in both: "benchmark", "size", "speedup" (throughput relative
+        to the baseline), "memory_ratio" (None if not measured in both) and "regressions" (list of "throughput"
+        and/or "memory")
+    """
+    reference = {
+        (result["benchmark"], result["size"]): result for result in baseline["results"]
+    }
+    comparisons = []
+    for result in suite["results"]:
+        key = (result["benchmark"], result["size"])
+        if key not in reference:
+            continue
+        old = reference[key]
+        speedup = result["per_second"] / old["per_second"]
+        memory_ratio = None
+        if result["peak_memory"] is not None and old["peak_memory"]:
+            memory_ratio = result["peak_memory"] / old["peak_memory"]
+        regressions = []
+        if speedup < 1 - tolerance:
+            regressions.append("throughput")
+        if memory_ratio is not None and memory_ratio > 1 + memory_tolerance:
+            regressions.append("memory")
+        comparisons.append(
+            {
+                "benchmark": result["benchmark"],
+                "size": result["size"],
+                "speedup": speedup,
+                "memory_ratio": memory_ratio,
+                "regressions": regressions,
+            }
+        )
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the simulation hot paths and compares them with a saved baseline"
+    )
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help="Benchmarks to run (all by default), see --list",
+    )
+    parser.add_argument("--list", action="store_true", help="Lists the benchmarks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument(
+        "--quick",
+        type=int,
+        default=None,
+        metavar="STEPS",
+        help="Only runs the first STEPS sizes of each ladder",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skips the peak memory measurement (one run less per size)",
+    )
+    parser.add_argument(
+        "--output", default=None, help="Writes the results to this JSON file"
+    )
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help="JSON results of a previous run to compare with",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Relative throughput loss flagged as a regression",
+    )
+    parser.add_argument(
+        "--memory-tolerance",
+        type=float,
+        default=0.2,
+        help="Relative peak memory growth flagged as a regression",
+    )
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error("unknown benchmarks: {}".format(", ".join(unknown)))
+
+    if args.list:
+        for name, (benchmark, unit, ladder) in BENCHMARKS.items():
+            print(
+                "{:<24} {:<12} sizes {}: {}".format(
+                    name, unit, list(ladder), benchmark.__doc__.splitlines()[0]
+                )
+            )
+        return
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    suite = run_suite(
+        args.benchmarks or None,
+        args.seed,
+        args.repeats,
+        not args.no_memory,
+        args.quick,
+    )
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(suite, f, indent=2)
+
+    if baseline is not None:
+        comparisons = compare(suite, baseline, args.tolerance, args.memory_tolerance)
+        print(
+            "Compared with {} (commit {}):".format(
+                args.baseline, baseline["environment"].get("commit")
+            )
+        )
+        for comparison in comparisons:
+            print(
+                "{:<24} {:>8} {:6.2f}x throughput{}{}".format(
+                    comparison["benchmark"],
+                    comparison["size"],
+                    comparison["speedup"],
+                    (
+                        ""
+                        if comparison["memory_ratio"] is None
+                        else ", {:5.2f}x peak memory".format(comparison["memory_ratio"])
+                    ),
+                    (
+                        "  REGRESSION ({})".format(", ".join(comparison["regressions"]))
+                        if comparison["regressions"]
+                        else ""
+                    ),
+                )
+            )
+        if any(comparison["regressions"] for comparison in comparisons):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,50 @@
-import matplotlib.pyplot as plt
 import numpy as np
+from expected_score import expected_score, expected_scores, compensation_ratio
 
 
 def expected_win_rate(delta_elo):
-    return 1 - 1 / (1 + 10 ** (delta_elo / 400))
+    """Expected win rate of a player 'delta_elo' points above their opponent, for a number or an array"""
+    if np.ndim(delta_elo) == 0:
+        return expected_score(delta_elo)
+    return expected_scores(delta_elo)
 
 
-print(expected_win_rate(583.81 - 332.54))
+def main():
+    import matplotlib.pyplot as plt
 
-# ELO difference range: from 0 to 800
-delta_elos = np.arange(0, 501, 1)
-win_rates = [100 * expected_win_rate(delta) for delta in delta_elos]
+    print(expected_win_rate(583.81 - 332.54))
 
-print(expected_win_rate(583.81 - 332.54))
+    # ELO difference range: from 0 to 800
+    delta_elos = np.arange(0, 501, 1)
+    win_rates = 100 * expected_win_rate(delta_elos)
 
-plt.figure(figsize=(10, 6))
-plt.plot(delta_elos, win_rates)
-plt.xlabel("ELO Difference (Player - Opponent)")
-plt.ylabel("Expected Win Rate")
-plt.title("Expected Win Rate vs ELO Difference (BoardGameArena)")
-plt.xticks(np.arange(0, 501, 25))
-plt.yticks(np.arange(50, 100, 1))  # Ticks for win rates at intervals of 0.1
-# Adding a finer grid for better readability
-plt.grid(True, which="both", linestyle="-", linewidth=0.5)
-plt.show()
+    print(expected_win_rate(583.81 - 332.54))
 
-nb_wins_to_match_a_loss = [
-    (1 / (1 - expected_win_rate(delta)) - 1) for delta in delta_elos
-]
+    plt.figure(figsize=(10, 6))
+    plt.plot(delta_elos, win_rates)
+    plt.xlabel("ELO Difference (Player - Opponent)")
+    plt.ylabel("Expected Win Rate")
+    plt.title("Expected Win Rate vs ELO Difference (BoardGameArena)")
+    plt.xticks(np.arange(0, 501, 25))
+    plt.yticks(np.arange(50, 100, 1))  # Ticks for win rates at intervals of 0.1
+    # Adding a finer grid for better readability
+    plt.grid(True, which="both", linestyle="-", linewidth=0.5)
+    plt.show()
 
-plt.figure(figsize=(10, 6))
-plt.plot(delta_elos, nb_wins_to_match_a_loss)
-plt.xlabel("ELO Difference (Player - Opponent)")
-plt.ylabel("Number of wins")
-plt.title("Number of wins to compensate a loss")
-plt.xticks(np.arange(0, 501, 25))
-plt.yticks(np.arange(0, 20, 1))  # Ticks for win rates at intervals of 0.1
+    nb_wins_to_match_a_loss = compensation_ratio(delta_elos)
 
+    plt.figure(figsize=(10, 6))
+    plt.plot(delta_elos, nb_wins_to_match_a_loss)
+    plt.xlabel("ELO Difference (Player - Opponent)")
+    plt.ylabel("Number of wins")
+    plt.title("Number of wins to compensate a loss")
+    plt.xticks(np.arange(0, 501, 25))
+    plt.yticks(np.arange(0, 20, 1))  # Ticks for win rates at intervals of 0.1
 
-# Adding a finer grid for better readability
-plt.grid(True, which="both", linestyle="-", linewidth=0.5)
-plt.show()
+    # Adding a finer grid for better readability
+    plt.grid(True, which="both", linestyle="-", linewidth=0.5)
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
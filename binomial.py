@@ -0,0 +1,53 @@
+"""
+Binomial distributions for large numbers of trials, shared by tennis.py (points won in a match) and elo_hell.py
+(games won in a season).
+"""
+
+import numpy as np
+
+
+def log_pmf(nb_trials, proba):
+    """Returns the log of the probability of 0, 1, ..., nb_trials successes out of nb_trials.
+
+    The pmf is built from the ratio between two consecutive terms, so it stays accurate for millions of trials
+    where the binomial coefficients themselves would overflow.
+
+    Arguments:
+        nb_trials {int} -- Number of trials
+        proba {float or np.ndarray} -- Probability of success of each trial. With an array of probabilities,
+        the result has one row per probability.
+    """
+    p = np.asarray(proba, dtype=float)[..., np.newaxis]
+    k = np.arange(1, nb_trials + 1)
+    with np.errstate(divide="ignore"):
+        log_p = np.log(p)
+        log_q = np.log1p(-p)
+        first = nb_trials * log_q
+        ratios = np.log((nb_trials - k + 1) / k) + (log_p - log_q)
+    log_pmf = np.empty(p.shape[:-1] + (nb_trials + 1,))
+    log_pmf[..., :1] = first
+    with np.errstate(invalid="ignore"):
+        log_pmf[..., 1:] = first + np.cumsum(ratios, axis=-1)
+        # The rounding errors of the cumulative sum add up over millions of trials, normalizing removes most of them
+        log_pmf -= log_sum_exp(log_pmf)[..., np.newaxis]
+    # p = 0 or p = 1 give inf - inf above, the pmf is then trivial
+    log_pmf[p[..., 0] == 0] = np.where(np.arange(nb_trials + 1) == 0, 0, -np.inf)
+    log_pmf[p[..., 0] == 1] = np.where(
+        np.arange(nb_trials + 1) == nb_trials, 0, -np.inf
+    )
+    return log_pmf
+
+
+def pmf(nb_trials, proba):
+    """Same as log_pmf, without the log"""
+    return np.exp(log_pmf(nb_trials, proba))
+
+
+def log_sum_exp(values, axis=-1):
+    """Returns log(sum(exp(values))) along 'axis' without underflowing when the values are very negative"""
+    highest = np.max(values, axis=axis, keepdims=True)
+    highest[~np.isfinite(highest)] = 0
+    with np.errstate(divide="ignore"):
+        return np.squeeze(highest, axis=axis) + np.log(
+            np.sum(np.exp(values - highest), axis=axis)
+        )
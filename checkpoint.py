@@ -0,0 +1,200 @@
+"""
+Checkpoints of long simulations, to resume them after a crash or a Ctrl-C.
+
+A checkpoint is a single .npz file holding the state of a simulation at the end of a journey: the elo ratings and
+K factors of the players, their histories so far, the journey index and the state of the random generator, plus the
+settings of the run so that a checkpoint can't be resumed with different ones. Resuming plays exactly the games the
+interrupted run would have played, so the trajectory is the same as without the interruption.
+
+The file is written atomically (to a temporary file in the same directory, then renamed over the previous
+checkpoint), so a crash while writing leaves the previous checkpoint intact. The simulation only pauses to copy the
+small arrays: the writing itself is done by a background thread.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import threading
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+
+
+def _restore_rng(state):
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+
+def save_checkpoint(path, state, settings):
+    """Writes a checkpoint atomically.
+
+    Arguments:
+        path {str} -- Checkpoint file, replaced if it exists
+        state {dict} -- Arrays and numbers to save. "rng" must be the state of the bit generator
+        (rng.bit_generator.state) and a list of 1D arrays is saved as the matrix of its columns
+        settings {dict} -- JSON serializable settings of the run, checked by load_checkpoint
+    """
+    arrays = {
+        "version": CHECKPOINT_VERSION,
+        "settings": json.dumps(settings, sort_keys=True),
+    }
+    for key, value in state.items():
+        if key == "rng":
+            value = json.dumps(value)
+        elif isinstance(value, list):
+            value = np.stack(value, axis=1)
+        arrays[key] = value
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path, settings=None):
+    """Reads a checkpoint written by save_checkpoint.
+
+    Keyword Arguments:
+        settings {dict} -- If not None, a ValueError is raised if the checkpoint was written with other settings
+        (default: {None})
+
+    Returns:
+        dict -- The saved state: numbers as Python numbers, arrays as arrays and "rng" as a np.random.Generator
+        continuing the saved random stream
+    """
+    with np.load(path) as data:
+        if int(data["version"]) != CHECKPOINT_VERSION:
+            raise ValueError(
+                "{} was written by another version ({}) of checkpoint.py".format(
+                    path, int(data["version"])
+                )
+            )
+        saved_settings = json.loads(str(data["settings"]))
+        if settings is not None and saved_settings != json.loads(
+            json.dumps(settings, sort_keys=True)
+        ):
+            raise ValueError(
+                "{} was written by a run with other settings: {}".format(
+                    path, saved_settings
+                )
+            )
+        state = {}
+        for key in data.files:
+            if key in ("version", "settings"):
+                continue
+            value = data[key]
+            if key == "rng":
+                value = _restore_rng(json.loads(str(value)))
+            elif value.ndim == 0:
+                value = value.item()
+            state[key] = value
+    return state
+
+
+class Checkpointer(object):
+    """
+    Writes a checkpoint at most once every 'interval' seconds, at the end of a journey.
+
+    Used as a context manager, it also catches the first Ctrl-C: the current journey is finished, a last checkpoint
+    is written and KeyboardInterrupt is raised from there. A second Ctrl-C interrupts right away.
+    """
+
+    def __init__(self, path, settings=None, interval=60.0):
+        """
+        Arguments:
+            path {str} -- Checkpoint file, None disables the checkpoints
+
+        Keyword Arguments:
+            settings {dict} -- Settings of the run, saved with every checkpoint (default: {None})
+            interval {float} -- Minimum time in seconds between two checkpoints (default: {60.0})
+        """
+        self.path = path
+        self.settings = settings or {}
+        self.interval = interval
+        self.last_save = time.perf_counter()
+        self.nb_saved = 0
+        self.stop_requested = False
+        self._thread = None
+        self._error = None
+        self._previous_handler = None
+
+    def __enter__(self):
+        if (
+            self.path is not None
+            and threading.current_thread() is threading.main_thread()
+        ):
+            self._previous_handler = signal.signal(signal.SIGINT, self._on_sigint)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGINT, self._previous_handler)
+            self._previous_handler = None
+        self.wait()
+
+    def _on_sigint(self, signum, frame):
+        if self.stop_requested:
+            raise KeyboardInterrupt
+        self.stop_requested = True
+        print(
+            "Interrupted, finishing the journey to write a checkpoint (Ctrl-C again to stop now)",
+            file=sys.stderr,
+        )
+
+    def _write(self, state):
+        try:
+            save_checkpoint(self.path, state, self.settings)
+        except Exception as error:
+            self._error = error
+
+    def wait(self):
+        """Waits for the checkpoint being written, if any, and raises the error it met"""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def save(self, state):
+        """Starts writing a checkpoint in the background, after the previous one is written. The arrays of
+        'state' must not be modified until then"""
+        self.wait()
+        self._thread = threading.Thread(target=self._write, args=(state,))
+        self._thread.start()
+        self.last_save = time.perf_counter()
+        self.nb_saved += 1
+
+    def journey_done(self, make_state):
+        """Called at the end of each journey, saves the state returned by make_state() if a checkpoint is due
+
+        Arguments:
+            make_state {function} -- Returns the state to save (see save_checkpoint), only called if needed
+        """
+        if self.path is None:
+            return
+        if (
+            not self.stop_requested
+            and time.perf_counter() - self.last_save < self.interval
+        ):
+            return
+        self.save(make_state())
+        if self.stop_requested:
+            self.wait()
+            print(
+                "Checkpoint written to {}, --resume continues the run".format(
+                    self.path
+                ),
+                file=sys.stderr,
+            )
+            raise KeyboardInterrupt
+
+    def discard(self):
+        """Removes the checkpoint once the run is over"""
+        self.wait()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,172 @@
+"""
+Streaming convergence metrics of a season, updated once per journey.
+
+ConvergenceTracker follows how well the elo ratings sort the players by skill while the season is played, instead of
+eyeballing the plot afterwards: the average elo, the Spearman (and optionally Kendall) rank correlation between the
+skills and the elo ratings, and the standard deviation of each player's elo over the last journeys. A season has
+converged when the rank correlation stays above a threshold for a whole window of journeys, which lets the simulations
+stop themselves and report the number of games needed by each K factor schedule.
+
+Every metric works on one season (a vector of elo ratings) or on many seasons at once (a seasons x players matrix,
+see array_engine.simulate_replicates).
+"""
+
+import numpy as np
+
+
+def average_ranks(values):
+    """Returns the ranks (0 for the lowest) of the values along the last axis, tied values sharing their average rank.
+
+    Arguments:
+        values {np.ndarray} -- Vector, or matrix ranked row by row
+    """
+    values = np.asarray(values, dtype=float)
+    flat = values.reshape(-1, values.shape[-1])
+    nb_rows, length = flat.shape
+    order = np.argsort(flat, axis=1, kind="stable")
+    sorted_values = np.take_along_axis(flat, order, axis=1)
+    # Tie groups, numbered across all the rows so that one bincount handles every row
+    new_group = np.ones(flat.shape, dtype=bool)
+    new_group[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    groups = np.cumsum(new_group).reshape(flat.shape) - 1
+    positions = np.broadcast_to(np.arange(length, dtype=float), flat.shape)
+    mean_position = np.bincount(
+        groups.ravel(), weights=positions.ravel()
+    ) / np.bincount(groups.ravel())
+    ranks = np.empty(flat.shape)
+    np.put_along_axis(ranks, order, mean_position[groups], axis=1)
+    return ranks.reshape(values.shape)
+
+
+def spearman(skills, elo):
+    """Returns the Spearman rank correlation between the skills and the elo ratings (of each season for a matrix).
+    0 when the ratings are all equal, e.g. at the start of the season."""
+    skill_ranks = average_ranks(skills)
+    skill_ranks = skill_ranks - skill_ranks.mean()
+    elo_ranks = average_ranks(elo)
+    elo_ranks = elo_ranks - elo_ranks.mean(axis=-1, keepdims=True)
+    norms = np.sqrt(np.sum(elo_ranks**2, axis=-1) * np.sum(skill_ranks**2))
+    covariance = np.sum(elo_ranks * skill_ranks, axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(norms > 0, covariance / norms, 0.0)
+
+
+def kendall_tau(skills, elo, chunk_size=1024):
+    """Returns Kendall's tau-a between the skills and the elo ratings of one season: the fraction of concordant pairs
+    of players minus the fraction of discordant ones. O(players^2), computed by chunks of players.
+    """
+    skills = np.asarray(skills, dtype=float)
+    elo = np.asarray(elo, dtype=float)
+    nb_players = len(skills)
+    total = 0
+    for start in range(0, nb_players, chunk_size):
+        rows = slice(start, start + chunk_size)
+        total += np.sum(
+            np.sign(skills[rows, np.newaxis] - skills)
+            * np.sign(elo[rows, np.newaxis] - elo)
+        )
+    # Every pair was counted twice
+    return total / float(nb_players * (nb_players - 1))
+
+
+class ConvergenceTracker(object):
+    """
+    Convergence metrics of one season or of many seasons at once, updated journey by journey
+    """
+
+    def __init__(self, skills, threshold=0.95, window=10, kendall=False):
+        """
+        Arguments:
+            skills {list} -- Skill of each player
+
+        Keyword Arguments:
+            threshold {float} -- A season has converged when its Spearman correlation stays at or above the
+            threshold (default: {0.95})
+            window {int} -- ... for 'window' consecutive journeys. It is also the number of journeys of the rolling
+            standard deviation (default: {10})
+            kendall {bool} -- Also computes Kendall's tau, O(players^2) per journey and one season only
+            (default: {False})
+        """
+        self.skills = np.asarray(skills, dtype=float)
+        self.threshold = threshold
+        self.window = window
+        self.kendall = kendall
+        self.games = []
+        self.average = []
+        self.spearman = []
+        self.kendall_tau = []
+        self.rolling_std = []
+        # Last 'window' elo ratings, as a ring buffer with running sums for the rolling standard deviation
+        self._recent = None
+        self._sum = None
+        self._sum_of_squares = None
+        self._streak = None
+        self.converged_at = None
+
+    def update(self, elo, nb_games):
+        """Adds the elo ratings after a journey.
+
+        Arguments:
+            elo {np.ndarray} -- Elo of each player, or (seasons x players) matrix
+            nb_games {int} -- Number of games played by each player so far
+
+        Returns:
+            bool -- True once every season has converged
+        """
+        elo = np.array(elo, dtype=float)
+        if self._recent is None:
+            self._recent = np.empty((self.window,) + elo.shape)
+            self._sum = np.zeros(elo.shape)
+            self._sum_of_squares = np.zeros(elo.shape)
+            self._streak = np.zeros(elo.shape[:-1], dtype=np.int64)
+            self.converged_at = np.full(elo.shape[:-1], -1, dtype=np.int64)
+        position = len(self.games) % self.window
+        if len(self.games) >= self.window:
+            self._sum -= self._recent[position]
+            self._sum_of_squares -= self._recent[position] ** 2
+        self._recent[position] = elo
+        self._sum += elo
+        self._sum_of_squares += elo**2
+        count = min(len(self.games) + 1, self.window)
+        variance = np.maximum(
+            self._sum_of_squares / count - (self._sum / count) ** 2, 0
+        )
+
+        correlation = spearman(self.skills, elo)
+        self.games.append(nb_games)
+        self.average.append(elo.mean(axis=-1))
+        self.spearman.append(correlation)
+        self.rolling_std.append(np.sqrt(variance).mean(axis=-1))
+        if self.kendall:
+            self.kendall_tau.append(kendall_tau(self.skills, elo))
+
+        # A season converged at the first journey of its first window of 'window' journeys above the threshold
+        self._streak = np.where(correlation >= self.threshold, self._streak + 1, 0)
+        newly = (self._streak == self.window) & (self.converged_at < 0)
+        if np.any(newly):
+            self.converged_at[newly] = self.games[-self.window]
+        return self.converged()
+
+    def converged(self):
+        return self.converged_at is not None and bool(np.all(self.converged_at >= 0))
+
+    def fraction_converged(self):
+        """Fraction of the seasons that converged"""
+        if self.converged_at is None:
+            return 0.0
+        return float(np.mean(self.converged_at >= 0))
+
+    def metrics(self):
+        """Returns the metrics of every journey as arrays: "games", "average", "spearman", "rolling_std",
+        "kendall_tau" (if computed) and "converged_at" (games needed by each season, -1 if it didn't converge)
+        """
+        metrics = {
+            "games": np.array(self.games),
+            "average": np.array(self.average),
+            "spearman": np.array(self.spearman),
+            "rolling_std": np.array(self.rolling_std),
+            "converged_at": self.converged_at,
+        }
+        if self.kendall:
+            metrics["kendall_tau"] = np.array(self.kendall_tau)
+        return metrics
@@ -0,0 +1,225 @@
+"""
+Decimation of long elo histories before plotting.
+
+A line with a million points looks the same as a line with a few thousand well chosen points, but takes far longer
+to draw. Two methods are available:
+- min_max_indices: splits the series into buckets (about one per pixel) and keeps the lowest and the highest point of
+  each bucket, so every peak stays visible. It is fully vectorized and works on a (games x players) matrix at once.
+- lttb_indices: largest triangle three buckets, keeps one point per bucket, the one forming the largest triangle with
+  its neighbours. Smoother looking for the same number of points.
+MinMaxDecimator does the min/max decimation incrementally, for the dynamic display.
+"""
+
+import numpy as np
+
+
+def min_max_indices(y, max_points, keep=()):
+    """Returns the sorted indices of the points to keep to draw 'y' with about 'max_points' points.
+
+    Arguments:
+        y {np.ndarray} -- Series (1D) or matrix of series (2D, one series per column)
+        max_points {int} -- Maximum number of points kept per series (2 per bucket)
+
+    Keyword Arguments:
+        keep {tuple} -- Indices always kept, e.g. the end of the placement games (default: {()})
+
+    Returns:
+        np.ndarray -- 1D array of indices for a 1D series, list of 1D arrays (one per column) for a matrix
+    """
+    y = np.asarray(y)
+    if y.ndim == 2:
+        if len(y) <= max_points:
+            return [
+                min_max_indices(y[:, s], max_points, keep) for s in range(y.shape[1])
+            ]
+        width, nb_buckets = _buckets(len(y), max_points)
+        full = y[: width * nb_buckets].reshape(nb_buckets, width, y.shape[1])
+        offsets = np.arange(nb_buckets)[:, np.newaxis] * width
+        lows = offsets + np.argmin(full, axis=1)
+        highs = offsets + np.argmax(full, axis=1)
+        return [
+            _merge(lows[:, s], highs[:, s], len(y), width * nb_buckets, keep)
+            for s in range(y.shape[1])
+        ]
+    if len(y) <= max_points:
+        return np.arange(len(y))
+    width, nb_buckets = _buckets(len(y), max_points)
+    full = y[: width * nb_buckets].reshape(nb_buckets, width)
+    offsets = np.arange(nb_buckets) * width
+    lows = offsets + np.argmin(full, axis=1)
+    highs = offsets + np.argmax(full, axis=1)
+    return _merge(lows, highs, len(y), width * nb_buckets, keep)
+
+
+def _buckets(length, max_points):
+    """Returns the width and the number of the full buckets"""
+    width = max(1, int(np.ceil(2.0 * length / max(max_points, 2))))
+    return width, length // width
+
+
+def _merge(lows, highs, length, covered, keep):
+    # The first and the last points are always kept, as well as the points after the last full bucket
+    indices = np.concatenate(
+        (
+            [0, length - 1],
+            lows,
+            highs,
+            np.arange(covered, length),
+            [k for k in keep if 0 <= k < length],
+        )
+    )
+    return np.unique(indices.astype(np.intp))
+
+
+def lttb_indices(y, max_points, x=None, keep=()):
+    """Returns the sorted indices of the points kept by the largest triangle three buckets algorithm.
+
+    Arguments:
+        y {np.ndarray} -- 1D series
+        max_points {int} -- Number of points to keep (at least 3)
+
+    Keyword Arguments:
+        x {np.ndarray} -- Abscissas of the points, 0, 1, 2... if None (default: {None})
+        keep {tuple} -- Indices always kept (default: {()})
+    """
+    y = np.asarray(y, dtype=float)
+    length = len(y)
+    if length <= max_points or max_points < 3:
+        return np.arange(length)
+    x = np.arange(length, dtype=float) if x is None else np.asarray(x, dtype=float)
+    # The first and the last points have their own buckets
+    edges = np.linspace(1, length - 1, max_points - 1).astype(np.intp)
+    indices = np.empty(max_points, dtype=np.intp)
+    indices[0] = 0
+    indices[-1] = length - 1
+    selected = 0
+    for b in range(max_points - 2):
+        start, end = edges[b], edges[b + 1]
+        # Average point of the next bucket
+        next_end = edges[b + 2] if b + 2 < len(edges) else length
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[selected] - next_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (next_y - y[selected])
+        )
+        selected = start + int(np.argmax(areas))
+        indices[b + 1] = selected
+    if len(keep):
+        indices = np.unique(
+            np.concatenate((indices, [k for k in keep if 0 <= k < length]))
+        )
+    return indices
+
+
+def decimate(x, y, max_points, method="minmax", keep=()):
+    """Returns (x, y) reduced to about 'max_points' points. max_points=None or 0 disables the decimation.
+
+    Keyword Arguments:
+        method {str} -- "minmax" or "lttb" (default: {"minmax"})
+        keep {tuple} -- Indices always kept (default: {()})
+    """
+    if not max_points or len(y) <= max_points:
+        return x, y
+    if method == "lttb":
+        indices = lttb_indices(y, max_points, x=x, keep=keep)
+    else:
+        indices = min_max_indices(y, max_points, keep=keep)
+    return np.asarray(x)[indices], np.asarray(y)[indices]
+
+
+class MinMaxDecimator(object):
+    """
+    Incremental min/max decimation of several series growing together (one column per player).
+
+    The points are grouped into buckets of 'width' points, each bucket keeping its lowest and highest point. When
+    there are too many buckets, neighbouring buckets are merged and the width doubles: merging min/max buckets is
+    exact, so the result is the same as decimating the whole series again, for a cost proportional to the new points.
+    """
+
+    def __init__(self, nb_series, max_points=4000):
+        self.nb_series = nb_series
+        self.max_buckets = max(1, max_points // 2)
+        self.width = 1
+        capacity = self.max_buckets + 1
+        self.low_x = np.empty((capacity, nb_series))
+        self.low_y = np.empty((capacity, nb_series))
+        self.high_x = np.empty((capacity, nb_series))
+        self.high_y = np.empty((capacity, nb_series))
+        self.nb_buckets = 0
+        # Points that don't fill a bucket yet
+        self.tail_x = np.empty(0)
+        self.tail_y = np.empty((0, nb_series))
+
+    def append(self, x, rows):
+        """Appends new points: x is a 1D array, rows a (points x series) matrix"""
+        x = np.concatenate((self.tail_x, x))
+        rows = np.concatenate((self.tail_y, rows))
+        while True:
+            nb_full = len(x) // self.width
+            free = len(self.low_x) - self.nb_buckets
+            nb_new = min(nb_full, free)
+            if nb_new > 0:
+                used = nb_new * self.width
+                blocks = rows[:used].reshape(nb_new, self.width, self.nb_series)
+                columns = np.arange(self.nb_series)
+                lows = np.argmin(blocks, axis=1)
+                highs = np.argmax(blocks, axis=1)
+                first = np.arange(nb_new)[:, np.newaxis] * self.width
+                new = slice(self.nb_buckets, self.nb_buckets + nb_new)
+                self.low_x[new] = x[first + lows]
+                self.high_x[new] = x[first + highs]
+                rows_index = np.arange(nb_new)[:, np.newaxis]
+                self.low_y[new] = blocks[rows_index, lows, columns]
+                self.high_y[new] = blocks[rows_index, highs, columns]
+                self.nb_buckets += nb_new
+                x = x[used:]
+                rows = rows[used:]
+            if self.nb_buckets > self.max_buckets:
+                self._merge()
+                continue
+            if len(x) < self.width:
+                break
+        self.tail_x = x
+        self.tail_y = rows
+
+    def _merge(self):
+        """Merges the buckets two by two and doubles their width"""
+        pairs = self.nb_buckets // 2
+        for values, positions, pick in (
+            (self.low_y, self.low_x, np.less_equal),
+            (self.high_y, self.high_x, np.greater_equal),
+        ):
+            first = values[0 : 2 * pairs : 2]
+            second = values[1 : 2 * pairs : 2]
+            take_first = pick(first, second)
+            merged_values = np.where(take_first, first, second)
+            merged_positions = np.where(
+                take_first, positions[0 : 2 * pairs : 2], positions[1 : 2 * pairs : 2]
+            )
+            values[:pairs] = merged_values
+            positions[:pairs] = merged_positions
+        if self.nb_buckets % 2:
+            # The last bucket has no neighbour to merge with yet, it stays as it is (narrower than the others)
+            for array in (self.low_x, self.low_y, self.high_x, self.high_y):
+                array[pairs] = array[self.nb_buckets - 1]
+            pairs += 1
+        self.nb_buckets = pairs
+        self.width *= 2
+
+    def series(self, s):
+        """Returns the decimated (x, y) of series 's', in the order of x"""
+        low_x = self.low_x[: self.nb_buckets, s]
+        high_x = self.high_x[: self.nb_buckets, s]
+        low_first = low_x <= high_x
+        x = np.empty(2 * self.nb_buckets + len(self.tail_x))
+        y = np.empty(len(x))
+        x[0 : 2 * self.nb_buckets : 2] = np.where(low_first, low_x, high_x)
+        x[1 : 2 * self.nb_buckets : 2] = np.where(low_first, high_x, low_x)
+        low_y = self.low_y[: self.nb_buckets, s]
+        high_y = self.high_y[: self.nb_buckets, s]
+        y[0 : 2 * self.nb_buckets : 2] = np.where(low_first, low_y, high_y)
+        y[1 : 2 * self.nb_buckets : 2] = np.where(low_first, high_y, low_y)
+        x[2 * self.nb_buckets :] = self.tail_x
+        y[2 * self.nb_buckets :] = self.tail_y[:, s]
+        return x, y
@@ -1,136 +1,126 @@
 import sys
 import os
-import matplotlib
 import math
-import random
+import json
 import argparse
-import matplotlib.pyplot as plt
 import numpy as np
 import time
+import atexit
+import decimate
+import fan_chart
+import live_plot
+import profiling
+import rating_kernels
+from expected_score import ExpectedScoreTable
+
+# The simulation itself lives in simulation.py, which never imports matplotlib. The names are kept here for the
+# scripts that import them from elo.py.
+from simulation import (
+    K_FACTOR_PLACEMENTS,
+    K_FACTOR,
+    DIVIDER,
+    STARTING_ELO,
+    FORCED_WINRATE,
+    draw,
+    Player,
+    play_season,
+    play_replicates,
+    replicate_stages,
+    dynamic_journeys,
+    load_dynamic_checkpoint,
+)
+
+
+def plot_static_season(
+    history,
+    names,
+    actual_placement_games,
+    converged_at=-1,
+    convergence_threshold=0.95,
+    max_points=4000,
+):
+    """Plots the elo history of every player of a season on the current figure, without showing it
 
-# FIDE (chess) use K=40 for placement games and K=20 afterwads (or k=10 for high elo): https://en.wikipedia.org/wiki/Elo_rating_system
-# LOL (season 2) seems to use K=100 for placement games and K=25 afterwards: https://leagueoflegends.fandom.com/wiki/Elo_rating_system
-# BoardGameArena uses K = 60, then K=40, then K=20 after the end of placement games: https://boardgamearena.com/faq?anchor=faq_account_elo
-K_FACTOR_PLACEMENTS = 100
-K_FACTOR = 25
-DIVIDER = 400
-STARTING_ELO = 1200
-FORCED_WINRATE = 0.536
-"""
-0.536 is the theoretical winrate of a player in elo hell. 
-Elo hell is here defined as: 
-- Any other player has a probability of ruining the game of 0.1 (a.k.a. inter) in a 5vs5 game
-- If both teams have an equal number of inters, then the probability of wining the game is 0.5
-"""
-
-
-class Player(object):
-    """
-    Represents a player, its skill and its current elo points
+    Arguments:
+        history {np.ndarray} -- (games x players) matrix of elo ratings
+        names {list} -- Name of each player
+        actual_placement_games {int} -- Where the placement games end on the plot
+
+    Keyword Arguments:
+        converged_at {int} -- Game where the season converged, -1 if it didn't (default: {-1})
+        convergence_threshold {float} -- Shown in the legend of the convergence line (default: {0.95})
+        max_points {int} -- See simulate_elo_static (default: {4000})
     """
+    import matplotlib.pyplot as plt
 
-    def __init__(
-        self,
-        name,
-        skill,
-        elo=STARTING_ELO,
-        k_factor=K_FACTOR_PLACEMENTS,
-        is_inter=False,
-    ):
-        self.name = name
-        self.skill = skill
-        self.elo = elo
-        self.k_factor = k_factor
-        self.elo_history = [elo]
-        self.is_inter = is_inter
-
-    def __repr__(self):
-        s = "Player name : {}, actual skill = {} elo rating {}".format(
-            self.name, self.skill, self.elo
+    nb_players = history.shape[1]
+    nb_games = np.arange(0, len(history), 1)
+
+    plt.rcParams["figure.figsize"] = (13, 10)
+    ax = plt.subplot(111)
+    ax.annotate(
+        "End of placement games",
+        xy=(actual_placement_games, STARTING_ELO),
+        xycoords="data",
+        xytext=(actual_placement_games, STARTING_ELO + 50),
+        verticalalignment="top",
+        arrowprops=dict(facecolor="black", shrink=0.05),
+    )
+
+    # The end of the placement games stays visible whatever the decimation
+    keep = (min(actual_placement_games, len(history) - 1), max(converged_at, 0))
+    if converged_at >= 0:
+        ax.axvline(
+            converged_at,
+            color="grey",
+            linestyle=":",
+            label="Converged (Spearman >= {})".format(convergence_threshold),
         )
-        return s
-
-    def expected_result(self, other):
-        """Returns the expected value of the match against an other player (0 means a guaranteed loss, 1 means a guaranteed win)
-
-        Arguments:
-            other {Player} -- The second player
-        """
-        return float(1) / (1 + math.pow(10, float(other.elo - self.elo) / DIVIDER))
-
-    def play(self, other):
-        """Returns the result (0 if loss, 1 if won) of a game against an other player
-
-        Arguments:
-            other {Player} -- The second player
-        """
-        proba_of_wining = float(self.skill) / (self.skill + other.skill)
-        precision = 10000
-        rand = random.randint(0, precision)
-        if rand >= precision * proba_of_wining:
-            # Loss
-            return 0
-        return 1
-
-    def play_forced_winrate(self, winrate):
-        proba_of_wining = winrate
-        precision = 10000
-        rand = random.randint(0, precision)
-        if rand >= precision * proba_of_wining:
-            # Loss
-            return 0
-        return 1
-
-    def play_and_update(
-        self, other, elohell=False, forced_win_rate=FORCED_WINRATE, verbose=False
-    ):
-        """Plays against an other player and updates both elo ratings depending on the output of the match
-
-        Arguments:
-            other {Player} -- Other player
-
-        Keyword Arguments:
-            elohell {bool} -- If true, a fixed winrate will be used instead (default: {False})
-            forced_win_rate {[type]} -- Only used if elohell==True (default: {FORCED_WINRATE})
-            verbose {bool} -- More prints (default: {False})
-        """
-        if not (elohell):
-            result = self.play(other)
-        else:
-            result = self.play_forced_winrate(forced_win_rate)
-        self.update(other, result, verbose=verbose)
-
-    def update(self, other, result, verbose=False):
-        """Updates this player's ELO and the 'other' player's ELO depending on the 'result' of a game.
-
-        Arguments:
-            other {Player} -- Other player
-            result {Float} -- Result of the game. 1.0 for a win against the 'other' player, 0.0 for a loss,
-            0.5 for a draw.
-
-        Keyword Arguments:
-            elohell {bool} -- If true, a fixed winrate will be used instead (default: {False})
-            forced_win_rate {[type]} -- Only used if elohell==True (default: {FORCED_WINRATE})
-            verbose {bool} -- More prints (default: {False})
-        """
-        expected = self.expected_result(other)
-        delta_points = self.k_factor * (result - expected)
-        self.elo = self.elo + delta_points
-        self.elo_history.append(self.elo)
-        other.elo = other.elo - delta_points
-        other.elo_history.append(other.elo)
-
-        if verbose:
-            print(
-                "{} vs {}. Expected by skill={}, expected by elo={}, result={}, delta_points={}".format(
-                    self.name,
-                    other.name,
-                    float(self.skill) / (self.skill + other.skill),
-                    expected,
-                    result,
-                    delta_points,
-                )
-            )
+    if max_points and len(history) > max_points:
+        kept = decimate.min_max_indices(history, max_points, keep=keep)
+    else:
+        kept = [nb_games] * nb_players
+    for p in range(nb_players):
+        plt.plot(nb_games[kept[p]], history[kept[p], p], label=names[p], linewidth=3)
+
+    # Caculating the average elo. This value should be constant in the normal mode but it's not because the same match will appear
+    # in different positions of each player's elo_history. So just use this as a debugg tool.
+    average_elo = history.mean(axis=1)
+    plt.plot(
+        *decimate.decimate(nb_games, average_elo, max_points, keep=keep),
+        label="AVERAGE ELO",
+        linewidth=6
+    )
+
+    leg = plt.legend(loc=1, ncol=2, mode="expand", shadow=True, fancybox=True)
+    leg.get_frame().set_alpha(0.5)
+
+
+def show_and_wait(sleep_time):
+    """Shows the current figure, waits 'sleep_time' seconds and closes it"""
+    import matplotlib.pyplot as plt
+
+    profiling.watch_canvas(plt.gcf().canvas)
+    with profiling.phase("show"):
+        plt.show(block=False)
+    time.sleep(sleep_time)
+    plt.close()
+
+
+def make_kernel(name, nb_players, nb_placement):
+    """Returns the rating kernel 'name' of rating_kernels.py for --kernel. The elo kernel switches to K_FACTOR after
+    the same placement games as play_season, which only plays whole journeys, so it gives the same histories
+    """
+    if name == "elo":
+        placement_games = math.ceil(nb_placement / float(nb_players - 1)) * (
+            nb_players - 1
+        )
+        return rating_kernels.EloKernel(
+            [(0, K_FACTOR_PLACEMENTS), (placement_games, K_FACTOR)],
+            DIVIDER,
+            STARTING_ELO,
+        )
+    return rating_kernels.KERNELS[name]()
 
 
 def simulate_elo_static(
@@ -142,52 +132,160 @@ def simulate_elo_static(
     sleep_time=1,
     elohell=False,
     verbose=False,
+    engine="player",
+    seed=None,
+    history_dtype=np.float64,
+    trajectory_file=None,
+    max_points=4000,
+    convergence_threshold=0.95,
+    convergence_window=10,
+    stop_when_converged=False,
+    kendall=False,
+    checkpoint_file=None,
+    checkpoint_interval=60.0,
+    resume=False,
+    expected_table=None,
+    kernel=None,
 ):
-    players = []
-    for i in range(nb_players):
-        skill = min_skill + i * delta_skill
-        players.append(
-            Player("Elo of PlayerSkill(" + str(skill) + ")", skill, STARTING_ELO)
-        )
+    """Simulates a season, plots every player's elo history and returns them as a (games x players) matrix
 
-    normal_games = nb_games - nb_placement
-    # A journey consists of playing each player once. Each player will play journeys completely so the nb_games and nb_placement might not be respected
-    nb_journeys = math.ceil(nb_placement / float(nb_players - 1))
-    if not (elohell):
-        actual_placement_games = nb_journeys * nb_players
-    else:
-        actual_placement_games = nb_placement
-    for mode in range(2):
-        # Playing the placement games with a high K (mode==0) then playing the normal games with a lower K (mode==1)
-        if not (elohell):
-            actual_games = nb_journeys * nb_players
-            for journey in range(nb_journeys):
-                for i in range(nb_players):
-                    # Each player will play against each other the same amount of times
-                    player1 = players[i]
-                    for j in range(nb_players):
-                        if j <= i:
-                            continue
-                        player2 = players[j]
-                        player1.play_and_update(player2, verbose=verbose)
-        else:
-            # In elohell mode players don't play against each other, they have a fixed winrate and play each 'actual_games' games against oponents of the same elo they are actually in
-            for p in players:
-                for i in range(nb_placement if mode == 0 else normal_games):
-                    p.play_and_update(
-                        Player("FakePlayer", 10, elo=p.elo),
-                        elohell=elohell,
-                        forced_win_rate=FORCED_WINRATE,
-                        verbose=verbose,
+    The simulation is done by simulation.play_season, see it for the other arguments.
+
+    Keyword Arguments:
+        max_points {int} -- Each line is decimated to about 'max_points' points before being plotted, keeping the
+        lowest and highest elo of every bucket of games (see decimate.py). 0 plots every game (default: {4000})
+    """
+    with profiling.phase("season"):
+        season = play_season(
+            nb_players,
+            nb_games,
+            nb_placement,
+            min_skill,
+            delta_skill,
+            elohell=elohell,
+            verbose=verbose,
+            engine=engine,
+            seed=seed,
+            history_dtype=history_dtype,
+            trajectory_file=trajectory_file,
+            convergence_threshold=convergence_threshold,
+            convergence_window=convergence_window,
+            stop_when_converged=stop_when_converged,
+            kendall=kendall,
+            checkpoint_file=checkpoint_file,
+            checkpoint_interval=checkpoint_interval,
+            resume=resume,
+            expected_table=expected_table,
+            kernel=kernel,
+        )
+    history = season["history"]
+    names = season["names"]
+    actual_placement_games = season["placement_games"]
+    converged_at = -1
+    metrics = season["metrics"]
+    if metrics is not None and len(metrics["games"]):
+        converged_at = int(metrics["converged_at"])
+        kendall_tau = ""
+        if "kendall_tau" in metrics:
+            kendall_tau = ", Kendall tau {:.3f}".format(metrics["kendall_tau"][-1])
+        print(
+            "After {} games: Spearman correlation between skills and elo {:.3f}{}, {}".format(
+                metrics["games"][-1],
+                metrics["spearman"][-1],
+                kendall_tau,
+                (
+                    "converged after {} games".format(converged_at)
+                    if converged_at >= 0
+                    else "not converged (Spearman >= {} for {} journeys)".format(
+                        convergence_threshold, convergence_window
                     )
-        # Playing the normal games with a lower K
-        for p in players:
-            p.k_factor = K_FACTOR
-        nb_journeys = math.ceil(normal_games / float(nb_players - 1))
+                ),
+            )
+        )
 
     # Making cool graphs about what happened
-    nb_games = np.arange(0, len(players[0].elo_history), 1)
+    with profiling.phase("plot"):
+        plot_static_season(
+            history,
+            names,
+            actual_placement_games,
+            converged_at,
+            convergence_threshold,
+            max_points,
+        )
+    show_and_wait(sleep_time)
+    return history
+
+
+def simulate_elo_replicates(
+    nb_players,
+    nb_games,
+    nb_placement,
+    min_skill,
+    delta_skill,
+    nb_replicates,
+    sleep_time=1,
+    seed=None,
+    max_points=4000,
+    convergence_threshold=0.95,
+    convergence_window=10,
+    stop_when_converged=False,
+    expected_table=None,
+):
+    """Simulates 'nb_replicates' independent seasons at once and plots the mean elo of each player with its
+    5-95% and 25-75% percentile bands. Prints how often the final elo ratings rank the players in the right order
+    and how many games the seasons needed to converge (see simulate_elo_static for the convergence settings).
 
+    Returns:
+        dict -- The statistics computed by array_engine.simulate_replicates
+    """
+    with profiling.phase("season"):
+        result = play_replicates(
+            nb_players,
+            nb_games,
+            nb_placement,
+            min_skill,
+            delta_skill,
+            nb_replicates,
+            seed=seed,
+            convergence_threshold=convergence_threshold,
+            convergence_window=convergence_window,
+            stop_when_converged=stop_when_converged,
+            expected_table=expected_table,
+        )
+    stats = result["stats"]
+    skills = result["skills"]
+    nb_journeys = result["placement_journeys"]
+    actual_placement_games = result["placement_games"]
+    converged_at = result["metrics"]["converged_at"]
+    print(
+        "Players ranked in the right order in {:.1f}% of the {} seasons after the placement games, {:.1f}% at the end".format(
+            100
+            * stats["correct_order"][min(nb_journeys, len(stats["correct_order"]) - 1)],
+            nb_replicates,
+            100 * stats["correct_order"][-1],
+        )
+    )
+    if np.any(converged_at >= 0):
+        print(
+            "{:.1f}% of the seasons converged (Spearman >= {} for {} journeys), after {:.0f} games on median".format(
+                100 * np.mean(converged_at >= 0),
+                convergence_threshold,
+                convergence_window,
+                np.median(converged_at[converged_at >= 0]),
+            )
+        )
+    else:
+        print("No season converged")
+
+    import matplotlib.pyplot as plt
+
+    nb_games = np.arange(0, len(stats["mean"]), 1)
+    # One point every 'step' journeys at most, the mean and the percentiles are smooth enough
+    step = (
+        max(1, int(math.ceil(len(nb_games) / float(max_points)))) if max_points else 1
+    )
+    shown = np.union1d(np.arange(0, len(nb_games), step), [len(nb_games) - 1])
     plt.rcParams["figure.figsize"] = (13, 10)
     ax = plt.subplot(111)
     ax.annotate(
@@ -198,25 +296,125 @@ def simulate_elo_static(
         verticalalignment="top",
         arrowprops=dict(facecolor="black", shrink=0.05),
     )
+    for p in range(nb_players):
+        line = plt.plot(
+            nb_games[shown],
+            stats["mean"][shown, p],
+            label="Mean elo of PlayerSkill(" + str(skills[p]) + ")",
+            linewidth=3,
+        )[0]
+        plt.fill_between(
+            nb_games[shown],
+            stats["percentiles"][5][shown, p],
+            stats["percentiles"][95][shown, p],
+            color=line.get_color(),
+            alpha=0.15,
+        )
+        plt.fill_between(
+            nb_games[shown],
+            stats["percentiles"][25][shown, p],
+            stats["percentiles"][75][shown, p],
+            color=line.get_color(),
+            alpha=0.3,
+        )
+    plt.title("{} seasons, 5-95% and 25-75% percentile bands".format(nb_replicates))
+    leg = plt.legend(loc=1, ncol=2, mode="expand", shadow=True, fancybox=True)
+    leg.get_frame().set_alpha(0.5)
+    show_and_wait(sleep_time)
+    return stats
 
-    for p in players:
-        plt.plot(nb_games, p.elo_history, label=p.name, linewidth=3)
 
-    # Caculating the average elo. This value should be constant in the normal mode but it's not because the same match will appear
-    # in different positions of each player's elo_history. So just use this as a debugg tool.
-    average_elo = []
-    for i in range(len(players[0].elo_history)):
-        avg = 0
-        for p in players:
-            avg += p.elo_history[i]
-        average_elo.append(avg / float(len(players)))
-    plt.plot(nb_games, average_elo, label="AVERAGE ELO", linewidth=6)
+def season_quantiles(
+    nb_players,
+    nb_games,
+    nb_placement,
+    min_skill,
+    delta_skill,
+    batch_size=64,
+    expected_table=None,
+):
+    """Returns the fan_chart.SeasonQuantiles accumulating the seasons of the static mode, with the same journeys and K
+    factors as play_replicates"""
+    skills = [min_skill + i * delta_skill for i in range(nb_players)]
+    return fan_chart.SeasonQuantiles(
+        skills,
+        replicate_stages(nb_players, nb_games, nb_placement),
+        DIVIDER,
+        STARTING_ELO,
+        batch_size=batch_size,
+        expected_table=expected_table,
+    )
 
-    leg = plt.legend(loc=1, ncol=2, mode="expand", shadow=True, fancybox=True)
-    leg.get_frame().set_alpha(0.5)
-    plt.show(block=False)
-    time.sleep(sleep_time)
-    plt.close()
+
+def simulate_elo_fan_chart(
+    nb_players,
+    nb_games,
+    nb_placement,
+    min_skill,
+    delta_skill,
+    sleep_time=1,
+    seed=None,
+    nb_seasons=None,
+    batch_size=64,
+    expected_table=None,
+):
+    """Plays seasons in a background process and redraws a fan chart of every player every 'sleep_time' seconds,
+    summarising all the seasons played so far in a fixed amount of memory (see fan_chart.py).
+
+    Keyword Arguments:
+        nb_seasons {int} -- Stops after this many seasons and keeps the last chart on screen, None to go on until
+        the window is closed (default: {None})
+        batch_size {int} -- Number of seasons played at once (default: {64})
+
+    Returns:
+        tuple -- (number of seasons, (percentiles x journeys x players) quantiles of the last chart)
+    """
+    quantiles = season_quantiles(
+        nb_players,
+        nb_games,
+        nb_placement,
+        min_skill,
+        delta_skill,
+        batch_size,
+        expected_table,
+    )
+    names = ["Elo of PlayerSkill({})".format(skill) for skill in quantiles.skills]
+    placement_games = quantiles.stages[0][0] * (nb_players - 1)
+    result = fan_chart.run(
+        quantiles,
+        names,
+        seed=seed,
+        nb_seasons=nb_seasons,
+        refresh_interval=sleep_time,
+        placement_games=placement_games,
+    )
+    if nb_seasons is not None:
+        import matplotlib.pyplot as plt
+
+        if plt.get_fignums():
+            plt.ioff()
+            plt.show()
+    return result
+
+
+def fan_chart_summary(quantiles):
+    """Returns the final elo percentiles of a fan_chart.SeasonQuantiles as JSON serializable data, for the --no-plot
+    mode"""
+    estimates = quantiles.quantiles()
+    return {
+        "games": int(quantiles.games[-1]),
+        "seasons": quantiles.nb_seasons,
+        "players": [
+            {
+                "skill": skill,
+                "percentiles": {
+                    str(q): float(estimates[k, -1, p])
+                    for k, q in enumerate(quantiles.percentiles)
+                },
+            }
+            for p, skill in enumerate(quantiles.skills)
+        ],
+    }
 
 
 def simulate_elo_dynamic(
@@ -227,70 +425,189 @@ def simulate_elo_dynamic(
     sleep_time=1,
     elohell=False,
     verbose=False,
+    history_last=None,
+    seed=None,
+    engine="player",
+    max_points=4000,
+    checkpoint_file=None,
+    checkpoint_interval=60.0,
+    resume=False,
 ):
+    """Simulates the games journey by journey in a background process and displays every player's elo history.
+
+    The simulation never waits for the display: the display takes all the new elo ratings at most once every
+    'sleep_time' seconds and only redraws the lines (see live_plot.py).
+
+    Keyword Arguments:
+        sleep_time {float} -- Minimum time between two graphical updates (default: {1})
+        history_last {int} -- If not None, only the last 'history_last' elo ratings of each player are kept and
+        displayed (default: {None})
+        seed {int} -- Seed of the random generator, None for a fresh one (default: {None})
+        engine {str} -- "player" or "numpy", see dynamic_journeys (default: {"player"})
+        max_points {int} -- Maximum number of points drawn per line, 0 for no limit (default: {4000})
+        checkpoint_file {str} -- If not None, the simulation saves its state to this file every
+        'checkpoint_interval' seconds, see dynamic_journeys (default: {None})
+        checkpoint_interval {float} -- Minimum time in seconds between two checkpoints (default: {60.0})
+        resume {bool} -- Continues from 'checkpoint_file' if it exists, the display starts there (default: {False})
+    """
     if elohell:
         print("elohell option not implemented yet in the dynamic case")
         return
     print("Initializing displays...")
-    plt.ion()
-    # Set up plot
-    plt.rcParams["figure.figsize"] = (20, 16)
-    figure, ax = plt.subplots(nb_players)
-    common_x = []
-    list_of_y = []
-    for l in range(nb_players):
-        list_of_y.append([])
-    lines = []
-    for l in range(nb_players):
-        # Autoscale ON
-        lines.append(ax[l].plot(common_x, list_of_y[l], "--", linewidth=3)[0])
-        ax[l].set_xlim(0, 10)
-        ax[l].set_ylim(1250, 1750)
-        ax[l].set_autoscalex_on(True)
-        ax[l].set_autoscaley_on(False)
-        ax[l].grid()
-
-    graphSize = 10
-    print("Initialized")
-
-    players = []
-    for i in range(nb_players):
-        skill = min_skill + i * delta_skill
-        players.append(
-            Player("Elo of PlayerSkill(" + str(skill) + ")", skill, STARTING_ELO)
+    names = [
+        "Elo of PlayerSkill(" + str(min_skill + i * delta_skill) + ")"
+        for i in range(nb_players)
+    ]
+    rng = np.random.default_rng(seed)
+    state = None
+    if resume and checkpoint_file is not None:
+        state = load_dynamic_checkpoint(
+            checkpoint_file, nb_players, nb_games, min_skill, delta_skill
         )
+    renderer = live_plot.run(
+        dynamic_journeys,
+        (
+            nb_players,
+            nb_games,
+            min_skill,
+            delta_skill,
+            rng,
+            engine,
+            checkpoint_file,
+            checkpoint_interval,
+            state,
+        ),
+        names,
+        (
+            np.full(nb_players, STARTING_ELO, dtype=float)
+            if state is None
+            else state["elo"]
+        ),
+        frame_interval=sleep_time,
+        history_last=history_last,
+        max_points=max_points,
+        first_game=0 if state is None else state["row"],
+        profiler=profiling.active(),
+    )
+    return renderer
 
-    # A journey consists of playing each player once. Each player will play journeys completely so the nb_games and nb_placement might not be respected
-    nb_journeys = math.ceil(nb_games / float(nb_players - 1))
-    # Playing the normal games with a lower K
-    for p in players:
-        p.k_factor = p.k_factor / 2.0
-    for journey in range(nb_journeys):
-        for i in range(nb_players):
-            # Each player will play against each other the same amount of times
-            player1 = players[i]
-            for j in range(nb_players):
-                if j <= i:
-                    continue
-                player2 = players[j]
-                player1.play_and_update(
-                    player2, elohell=elohell, forced_win_rate=FORCED_WINRATE
-                )
 
-        common_x = np.arange(0, len(players[0].elo_history), 1)
-        for l in range(nb_players):
-            # Update data
-            lines[l].set_xdata(common_x)
-            lines[l].set_ydata(players[l].elo_history)
-            # Need both of these in order to rescale
-            ax[l].relim()
-            ax[l].autoscale_view()
-            ax[l].legend([players[l].name])
+def write_profile(profiler, path):
+    """Writes the report of --profile (JSON and folded stacks) and prints its summary on stderr"""
+    profiler.close()
+    folded_path = profiler.write(path)
+    print(profiler.summary(), file=sys.stderr)
+    print(
+        "Profile written to {} (flamegraph: {})".format(path, folded_path),
+        file=sys.stderr,
+    )
 
-        # We need to draw *and* flush
-        figure.canvas.draw()
-        figure.canvas.flush_events()
-        time.sleep(sleep_time)
+
+def season_summary(season):
+    """Returns the results of simulation.play_season as JSON serializable data, for the --no-plot mode"""
+    history = season["history"]
+    summary = {
+        "games": len(history) - 1,
+        "players": [
+            {
+                "name": name,
+                "skill": skill,
+                "final_elo": float(history[-1, p]),
+                "lowest_elo": float(np.min(history[:, p])),
+                "highest_elo": float(np.max(history[:, p])),
+            }
+            for p, (name, skill) in enumerate(zip(season["names"], season["skills"]))
+        ],
+    }
+    metrics = season["metrics"]
+    if metrics is not None and len(metrics["games"]):
+        summary["convergence"] = {
+            "spearman": float(metrics["spearman"][-1]),
+            "rolling_std": float(metrics["rolling_std"][-1]),
+            "converged_at": int(metrics["converged_at"]),
+        }
+        if "kendall_tau" in metrics:
+            summary["convergence"]["kendall_tau"] = float(metrics["kendall_tau"][-1])
+    return summary
+
+
+def replicates_summary(result):
+    """Returns the results of simulation.play_replicates as JSON serializable data, for the --no-plot mode"""
+    stats = result["stats"]
+    converged_at = result["metrics"]["converged_at"]
+    return {
+        "games": len(stats["mean"]) - 1,
+        "seasons": len(stats["final"]),
+        "correct_order": float(stats["correct_order"][-1]),
+        "fraction_converged": float(np.mean(converged_at >= 0)),
+        "median_games_to_convergence": (
+            float(np.median(converged_at[converged_at >= 0]))
+            if np.any(converged_at >= 0)
+            else None
+        ),
+        "players": [
+            {
+                "skill": skill,
+                "mean_final_elo": float(stats["mean"][-1, p]),
+                "std_final_elo": float(stats["std"][-1, p]),
+                "percentiles": {
+                    str(q): float(values[-1, p])
+                    for q, values in stats["percentiles"].items()
+                },
+            }
+            for p, skill in enumerate(result["skills"])
+        ],
+    }
+
+
+def dynamic_summary(
+    nb_players,
+    nb_games,
+    min_skill,
+    delta_skill,
+    seed=None,
+    engine="player",
+    checkpoint_file=None,
+    checkpoint_interval=60.0,
+    resume=False,
+):
+    """Plays the games of the dynamic mode without displaying them and returns the final elo ratings as JSON
+    serializable data, for the --no-plot mode"""
+    rng = np.random.default_rng(seed)
+    final = np.full(nb_players, STARTING_ELO, dtype=float)
+    nb_rows = 0
+    state = None
+    if resume and checkpoint_file is not None:
+        state = load_dynamic_checkpoint(
+            checkpoint_file, nb_players, nb_games, min_skill, delta_skill
+        )
+    if state is not None:
+        final = state["elo"]
+        nb_rows = state["row"]
+    for block in dynamic_journeys(
+        nb_players,
+        nb_games,
+        min_skill,
+        delta_skill,
+        rng,
+        engine,
+        checkpoint_file,
+        checkpoint_interval,
+        state,
+    ):
+        final = block[-1]
+        nb_rows += len(block)
+    return {
+        "games": nb_rows,
+        "players": [
+            {
+                "name": "Elo of PlayerSkill(" + str(min_skill + i * delta_skill) + ")",
+                "skill": min_skill + i * delta_skill,
+                "final_elo": float(final[i]),
+            }
+            for i in range(nb_players)
+        ],
+    }
 
 
 if __name__ == "__main__":
@@ -320,6 +637,126 @@ if __name__ == "__main__":
         action="store_true",
         help="Mode where the winrate is fixed and players always play against oponents of the same skill",
     )
+    parser.add_argument(
+        "--engine",
+        choices=["player", "numpy"],
+        default="player",
+        help="Simulation engine: Player objects or numpy arrays (same results for the same seed)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed of the random generator. In the static mode each run uses seed, seed + 1, ...",
+    )
+    parser.add_argument(
+        "--replicates",
+        type=int,
+        default=0,
+        help="Static mode only: simulates this many independent seasons at once and plots their mean and percentiles",
+    )
+    parser.add_argument(
+        "--fan-chart",
+        type=int,
+        nargs="?",
+        const=0,
+        default=None,
+        metavar="SEASONS",
+        help="Static mode only: plays seasons in the background and redraws a fan chart of every player (5-95%% and 25-75%% bands, median) every SLEEPTIME seconds, with streaming quantiles. Stops after SEASONS seasons, or when the window is closed without SEASONS",
+    )
+    parser.add_argument(
+        "--fan-batch",
+        type=int,
+        default=64,
+        help="Number of seasons played at once by --fan-chart",
+    )
+    parser.add_argument(
+        "--history-dtype",
+        choices=["float64", "float32"],
+        default="float64",
+        help="Type used to store the elo histories in the static mode, float32 halves the memory",
+    )
+    parser.add_argument(
+        "--history-last",
+        type=int,
+        default=None,
+        help="Dynamic mode only: keeps and displays only the last HISTORY_LAST elo ratings of each player",
+    )
+    parser.add_argument(
+        "--trajectory-file",
+        default=None,
+        help="Static mode with the numpy engine only: streams the elo histories to this memory-mapped file (see trajectories.py)",
+    )
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=4000,
+        help="Each elo history is decimated to about MAX_POINTS points before being plotted (keeping the lowest and highest elo of every bucket of games), 0 plots every game",
+    )
+    parser.add_argument(
+        "--convergence-threshold",
+        type=float,
+        default=0.95,
+        help="Static mode only: a season has converged when the Spearman correlation between skills and elo stays at or above this value",
+    )
+    parser.add_argument(
+        "--convergence-window",
+        type=int,
+        default=10,
+        help="... for this many journeys",
+    )
+    parser.add_argument(
+        "--kendall",
+        action="store_true",
+        help="Static mode only: also computes Kendall's tau between skills and elo after each journey, O(players^2) per journey",
+    )
+    parser.add_argument(
+        "--stop-when-converged",
+        action="store_true",
+        help="Static mode only: stops each season as soon as it converged",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="Single season (static mode) or dynamic mode: saves the state of the simulation to this file every --checkpoint-interval seconds and on Ctrl-C (see checkpoint.py)",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=60,
+        help="Minimum time in seconds between two checkpoints",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continues from the --checkpoint file, with the same results as an uninterrupted run",
+    )
+    parser.add_argument(
+        "--expected-table",
+        type=float,
+        default=None,
+        metavar="RESOLUTION",
+        help="Static mode with the numpy engine or replicates: looks the expected results up in a table of elo gaps every RESOLUTION points, interpolated (faster, but not exactly the results of the player engine anymore)",
+    )
+    parser.add_argument(
+        "--kernel",
+        choices=sorted(rating_kernels.KERNELS),
+        default=None,
+        help="Static mode with the numpy engine only: rates the players with this kernel of rating_kernels.py (elo gives the same histories as without --kernel)",
+    )
+    parser.add_argument(
+        "--no-plot",
+        action="store_true",
+        help="Batch mode: runs once without importing matplotlib and prints the results as JSON",
+    )
+
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="profile.json",
+        default=None,
+        help="Times the phases of the run (random draws, expected results, updates, history appends, plotting, canvas draws) and writes the report to PROFILE (profile.json) and the folded stacks for flame graphs next to it. Prints a live throughput line in the dynamic mode",
+    )
 
     # Not used here but might be useful. No -v => args.verbosity=0, -v => args.verbosity=1, -vv => args.verbosity=2, etc.
     parser.add_argument("-v", "--verbosity", action="count", default=0)
@@ -327,13 +764,148 @@ if __name__ == "__main__":
 
     if args.elohell:
         print(
-            "Warning: the elohell option completely changes this program's behaviour, don't get fooled. Players don't play against each other anymore."
+            "Warning: the elohell option completely changes this program's behaviour, don't get fooled. Players don't play against each other anymore.",
+            file=sys.stderr,
         )
 
     if args.nb_players <= 1 and not (args.elohell):
         print("At least 2 players are needed")
         sys.exit()
-    if args.static:
+    if args.static and args.replicates > 0 and args.elohell:
+        print("elohell option not implemented yet with replicates")
+        sys.exit()
+    if args.static and args.fan_chart is not None and args.elohell:
+        print("elohell option not implemented yet with fan charts")
+        sys.exit()
+    if args.fan_chart is not None and args.fan_chart < 0:
+        parser.error("--fan-chart takes a positive number of seasons")
+    if args.fan_batch <= 0:
+        parser.error("--fan-batch must be positive")
+    if args.history_last is not None and args.history_last < 1:
+        parser.error("--history-last must be positive")
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume needs --checkpoint")
+    if args.profile is not None:
+        profiler = profiling.Profiler()
+        profiling.instrument(profiler)
+        # Also written when the endless static mode is stopped with Ctrl-C
+        atexit.register(write_profile, profiler, args.profile)
+    if args.static and args.replicates > 0 and args.checkpoint is not None:
+        print("checkpoints are not written with replicates, ignoring it")
+    expected_table = None
+    if args.expected_table is not None:
+        if args.expected_table <= 0:
+            parser.error("--expected-table must be positive")
+        expected_table = ExpectedScoreTable(args.expected_table, divider=DIVIDER)
+    kernel = None
+    if args.kernel is not None:
+        kernel = make_kernel(args.kernel, args.nb_players, args.nb_placements)
+    if args.no_plot:
+        if args.static and args.fan_chart is not None:
+            if not args.fan_chart:
+                parser.error("--fan-chart needs a number of seasons with --no-plot")
+            summary = fan_chart_summary(
+                fan_chart.accumulate(
+                    season_quantiles(
+                        args.nb_players,
+                        args.nb_games,
+                        args.nb_placements,
+                        args.min_skill,
+                        args.delta_skill,
+                        args.fan_batch,
+                        expected_table,
+                    ),
+                    args.fan_chart,
+                    np.random.default_rng(args.seed),
+                )
+            )
+        elif args.static and args.replicates > 0:
+            summary = replicates_summary(
+                play_replicates(
+                    args.nb_players,
+                    args.nb_games,
+                    args.nb_placements,
+                    args.min_skill,
+                    args.delta_skill,
+                    args.replicates,
+                    seed=args.seed,
+                    convergence_threshold=args.convergence_threshold,
+                    convergence_window=args.convergence_window,
+                    stop_when_converged=args.stop_when_converged,
+                    expected_table=expected_table,
+                )
+            )
+        elif args.static:
+            summary = season_summary(
+                play_season(
+                    args.nb_players,
+                    args.nb_games,
+                    args.nb_placements,
+                    args.min_skill,
+                    args.delta_skill,
+                    elohell=args.elohell,
+                    engine=args.engine,
+                    seed=args.seed,
+                    history_dtype=np.dtype(args.history_dtype),
+                    trajectory_file=args.trajectory_file,
+                    convergence_threshold=args.convergence_threshold,
+                    convergence_window=args.convergence_window,
+                    stop_when_converged=args.stop_when_converged,
+                    kendall=args.kendall,
+                    checkpoint_file=args.checkpoint,
+                    checkpoint_interval=args.checkpoint_interval,
+                    resume=args.resume,
+                    expected_table=expected_table,
+                    kernel=kernel,
+                )
+            )
+        elif args.elohell:
+            print("elohell option not implemented yet in the dynamic case")
+            sys.exit()
+        else:
+            summary = dynamic_summary(
+                args.nb_players,
+                args.nb_games,
+                args.min_skill,
+                args.delta_skill,
+                seed=args.seed,
+                engine=args.engine,
+                checkpoint_file=args.checkpoint,
+                checkpoint_interval=args.checkpoint_interval,
+                resume=args.resume,
+            )
+        print(json.dumps(summary))
+    elif args.static and args.fan_chart is not None:
+        simulate_elo_fan_chart(
+            args.nb_players,
+            args.nb_games,
+            args.nb_placements,
+            args.min_skill,
+            args.delta_skill,
+            args.sleeptime,
+            seed=args.seed,
+            nb_seasons=args.fan_chart or None,
+            batch_size=args.fan_batch,
+            expected_table=expected_table,
+        )
+    elif args.static and args.replicates > 0:
+        simulate_elo_replicates(
+            args.nb_players,
+            args.nb_games,
+            args.nb_placements,
+            args.min_skill,
+            args.delta_skill,
+            args.replicates,
+            args.sleeptime,
+            seed=args.seed,
+            max_points=args.max_points,
+            convergence_threshold=args.convergence_threshold,
+            convergence_window=args.convergence_window,
+            stop_when_converged=args.stop_when_converged,
+            expected_table=expected_table,
+        )
+    elif args.static:
+        run = 0
         while True:
             simulate_elo_static(
                 args.nb_players,
@@ -344,7 +916,23 @@ if __name__ == "__main__":
                 args.sleeptime,
                 elohell=args.elohell,
                 verbose=args.verbosity,
+                engine=args.engine,
+                seed=None if args.seed is None else args.seed + run,
+                history_dtype=np.dtype(args.history_dtype),
+                trajectory_file=args.trajectory_file,
+                max_points=args.max_points,
+                convergence_threshold=args.convergence_threshold,
+                convergence_window=args.convergence_window,
+                stop_when_converged=args.stop_when_converged,
+                kendall=args.kendall,
+                checkpoint_file=args.checkpoint,
+                checkpoint_interval=args.checkpoint_interval,
+                # Only the first season continues from the checkpoint
+                resume=args.resume and run == 0,
+                expected_table=expected_table,
+                kernel=kernel,
             )
+            run += 1
     else:
         simulate_elo_dynamic(
             args.nb_players,
@@ -354,4 +942,11 @@ if __name__ == "__main__":
             args.sleeptime,
             elohell=args.elohell,
             verbose=False,
+            history_last=args.history_last,
+            seed=args.seed,
+            engine=args.engine,
+            max_points=args.max_points,
+            checkpoint_file=args.checkpoint,
+            checkpoint_interval=args.checkpoint_interval,
+            resume=args.resume,
         )
@@ -1,13 +1,11 @@
 import sys
 import os
-import matplotlib
 import math
 import random
 import argparse
-import matplotlib.pyplot as plt
 import numpy as np
 import time
-
+import binomial
 
 """
     We'll use the elo settings that are estimated on this page: 
@@ -40,20 +38,23 @@ import time
     With a linear interpolation (questionable) from season 2 data, that meant going from elo ~1335 to elo ~1505.
     This is a rough approximate but it will be used as an illustration further on.
 """
+K_FACTOR_PLACEMENTS = 100
 K_FACTOR = 25
 STARTING_ELO = 1200
 PROBA_OF_INTER = 0.1
+# Elo needed to go from Silver I to Gold I, see above
+SILVER_I_TO_GOLD_I = 1505 - 1335
 
 
-def create_team_and_play(proba_of_inter=PROBA_OF_INTER):
+def create_team_and_play(proba_of_inter=PROBA_OF_INTER, rng=None):
     nb_inters_our_team = 0
     nb_inters_their_team = 0
     # Creating 4 teammates that might or might not be inters
     for i in range(4):
-        nb_inters_our_team += randomize_is_inter(proba_of_inter)
+        nb_inters_our_team += randomize_is_inter(proba_of_inter, rng)
     # Creating 5 oponents that might or might not be inters
     for i in range(5):
-        nb_inters_their_team += randomize_is_inter(proba_of_inter)
+        nb_inters_their_team += randomize_is_inter(proba_of_inter, rng)
     if nb_inters_our_team < nb_inters_their_team:
         # We win
         return 1
@@ -62,12 +63,17 @@ def create_team_and_play(proba_of_inter=PROBA_OF_INTER):
         return 0
     else:
         # Coin flip because everyone has the same skill
-        return random.randint(0, 1)
+        if rng is None:
+            return random.randint(0, 1)
+        return int(rng.integers(0, 2))
 
 
-def randomize_is_inter(proba_of_inter):
+def randomize_is_inter(proba_of_inter, rng=None):
     precision = 10000
-    rand = random.randint(0, precision)
+    if rng is None:
+        rand = random.randint(0, precision)
+    else:
+        rand = rng.integers(0, precision + 1)
     if rand >= precision * proba_of_inter:
         # Normal human being
         return 0
@@ -75,10 +81,216 @@ def randomize_is_inter(proba_of_inter):
     return 1
 
 
-def main():
+def binomial_pmf(nb_players, proba_of_inter):
+    """Returns the probability of having 0, 1, ..., nb_players inters among nb_players players.
+
+    Arguments:
+        nb_players {int} -- Number of players that might be inters
+        proba_of_inter {float or np.ndarray} -- Probability of each player being an inter. With an array of
+        probabilities, the result has one row per probability.
+    """
+    p = np.asarray(proba_of_inter, dtype=float)[..., np.newaxis]
+    k = np.arange(nb_players + 1)
+    coefficients = np.array([math.comb(nb_players, i) for i in k], dtype=float)
+    return coefficients * p**k * (1 - p) ** (nb_players - k)
+
+
+def exact_winrate(proba_of_inter=PROBA_OF_INTER, nb_teammates=4, nb_opponents=5):
+    """Returns the exact winrate of create_team_and_play: we win when our team has fewer inters than theirs and
+    flip a coin when both teams have the same number of inters.
+
+    Keyword Arguments:
+        proba_of_inter {float or np.ndarray} -- Probability of any other player being an inter. An array gives an
+        array of winrates (default: {PROBA_OF_INTER})
+        nb_teammates {int} -- Number of teammates, we are never the inter (default: {4})
+        nb_opponents {int} -- Number of opponents (default: {5})
+    """
+    ours = binomial_pmf(nb_teammates, proba_of_inter)
+    theirs = binomial_pmf(nb_opponents, proba_of_inter)
+    # P(their team has more than k inters), for k = 0 ... nb_teammates
+    more_than = 1 - np.cumsum(theirs, axis=-1)
+    size = min(nb_teammates, nb_opponents) + 1
+    padded = np.zeros(ours.shape[:-1] + (nb_teammates + 1,))
+    padded[..., : more_than.shape[-1]] = more_than[..., : nb_teammates + 1]
+    ties = np.sum(ours[..., :size] * theirs[..., :size], axis=-1)
+    winrate = np.sum(ours * padded, axis=-1) + 0.5 * ties
+    if np.ndim(proba_of_inter) == 0:
+        return float(winrate)
+    return winrate
+
+
+def winrate_grid(probas_of_inter, team_sizes):
+    """Returns the exact winrates for every team size and every probability of inter.
+
+    Arguments:
+        probas_of_inter {list} -- Probabilities of any other player being an inter
+        team_sizes {list} -- Sizes of both teams (5 for a 5vs5 game: 4 teammates and 5 opponents)
+
+    Returns:
+        np.ndarray -- (team sizes x probabilities) matrix of winrates
+    """
+    return np.array(
+        [
+            exact_winrate(np.asarray(probas_of_inter, dtype=float), size - 1, size)
+            for size in team_sizes
+        ]
+    )
+
+
+def simulate_winrate(
+    nb_games, proba_of_inter=PROBA_OF_INTER, nb_teammates=4, nb_opponents=5, rng=None
+):
+    """Monte Carlo version of exact_winrate: draws the number of inters of 'nb_games' pairs of teams at once.
+
+    Arguments:
+        nb_games {int} -- Number of games to simulate
+
+    Keyword Arguments:
+        proba_of_inter {float} -- Probability of any other player being an inter (default: {PROBA_OF_INTER})
+        nb_teammates {int} -- Number of teammates (default: {4})
+        nb_opponents {int} -- Number of opponents (default: {5})
+        rng {np.random.Generator} -- Source of randomness, a fresh one if None (default: {None})
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    nb_inters_our_team = rng.binomial(nb_teammates, proba_of_inter, nb_games)
+    nb_inters_their_team = rng.binomial(nb_opponents, proba_of_inter, nb_games)
+    coin_flips = rng.integers(0, 2, nb_games)
+    wins = (nb_inters_our_team < nb_inters_their_team) | (
+        (nb_inters_our_team == nb_inters_their_team) & (coin_flips == 1)
+    )
+    return np.count_nonzero(wins) / float(nb_games)
+
+
+def rating_distribution(
+    nb_games,
+    nb_placement=0,
+    winrate=None,
+    k_factor_placements=K_FACTOR_PLACEMENTS,
+    k_factor=K_FACTOR,
+    starting_elo=STARTING_ELO,
+):
+    """Returns the exact distribution of the elo of a player in elo hell after 'nb_games' games, without simulating.
+
+    Every game moves the elo by exactly +-K/2 (see elo.py), so the elo lives on a lattice. With w1 wins out of the
+    nb_placement placement games and w2 wins out of the normal games, the elo is
+    starting_elo + k_factor_placements * (w1 - nb_placement / 2) + k_factor * (w2 - (nb_games - nb_placement) / 2).
+    w1 and w2 follow binomial distributions, which are placed on the lattice and convolved with an FFT, so millions
+    of games only take a fraction of a second. Probabilities below ~1e-15 are lost in the rounding errors of the FFT.
+
+    Arguments:
+        nb_games {int} -- Number of games, placement games included
+
+    Keyword Arguments:
+        nb_placement {int} -- Number of placement games, at most nb_games are played (default: {0})
+        winrate {float} -- Probability of winning each game, exact_winrate() if None (default: {None})
+        k_factor_placements {int} -- K factor of the placement games (default: {K_FACTOR_PLACEMENTS})
+        k_factor {int} -- K factor of the normal games (default: {K_FACTOR})
+        starting_elo {float} -- Elo before the first game (default: {STARTING_ELO})
+
+    Returns:
+        tuple -- (elos, probabilities), both arrays indexed by the points of the lattice
+    """
+    if nb_games < 0 or nb_placement < 0:
+        raise ValueError(
+            "The numbers of games can't be negative, got nb_games={} and nb_placement={}".format(
+                nb_games, nb_placement
+            )
+        )
+    # Only the first nb_games games are played, all of them placements if there are more placements
+    nb_placement = min(nb_placement, nb_games)
+    if winrate is None:
+        winrate = exact_winrate()
+    if not (float(k_factor_placements).is_integer() and float(k_factor).is_integer()):
+        raise ValueError("The lattice needs integer K factors")
+    k_factor_placements = int(k_factor_placements)
+    k_factor = int(k_factor)
+    nb_normal = nb_games - nb_placement
+    unit = math.gcd(k_factor_placements, k_factor)
+    placement_spacing = k_factor_placements // unit
+    normal_spacing = k_factor // unit
+
+    # Probability of each lattice index (k_factor_placements * w1 + k_factor * w2) / unit
+    placement = np.zeros(placement_spacing * nb_placement + 1)
+    placement[::placement_spacing] = binomial.pmf(nb_placement, winrate)
+    normal = np.zeros(normal_spacing * nb_normal + 1)
+    normal[::normal_spacing] = binomial.pmf(nb_normal, winrate)
+    if nb_placement == 0:
+        probabilities = normal
+    else:
+        length = len(placement) + len(normal) - 1
+        size = 1 << (length - 1).bit_length()
+        probabilities = np.fft.irfft(
+            np.fft.rfft(placement, size) * np.fft.rfft(normal, size), size
+        )[:length]
+        # The FFT leaves tiny negative values where the probability is 0
+        np.clip(probabilities, 0, None, out=probabilities)
+
+    elos = (
+        starting_elo
+        + unit * np.arange(len(probabilities))
+        - (k_factor_placements * nb_placement + k_factor * nb_normal) / 2.0
+    )
+    return elos, probabilities
+
+
+def probability_above(
+    delta_elo,
+    nb_games,
+    nb_placement=0,
+    winrate=None,
+    k_factor_placements=K_FACTOR_PLACEMENTS,
+    k_factor=K_FACTOR,
+):
+    """Returns the probability that the elo of a player in elo hell is at least 'delta_elo' above its starting elo
+    after 'nb_games' games (see rating_distribution)"""
+    elos, probabilities = rating_distribution(
+        nb_games, nb_placement, winrate, k_factor_placements, k_factor, starting_elo=0
+    )
+    return float(min(1.0, np.sum(probabilities[elos >= delta_elo])))
+
+
+def climb_probability(delta_elo, nb_games, winrate=None, k_factor=K_FACTOR):
+    """Returns the probability that a player in elo hell (after the placement games) climbs at least 'delta_elo'
+    above its current elo at some point within 'nb_games' games.
+
+    The elo is a random walk of steps +-k_factor/2. By the reflection principle, a path ending at c > a (in steps)
+    has (q/p)^(c-a) times the probability of its mirror image, which ends below a after touching a. So
+    P(max >= a) = P(end >= a) + sum over c > a of (q/p)^(c-a) * P(end = c), computed in log space.
+
+    Arguments:
+        delta_elo {float} -- Elo to climb, e.g. SILVER_I_TO_GOLD_I
+        nb_games {int} -- Number of games played
+
+    Keyword Arguments:
+        winrate {float} -- Probability of winning each game, exact_winrate() if None (default: {None})
+        k_factor {float} -- K factor of the games (default: {K_FACTOR})
+    """
+    if winrate is None:
+        winrate = exact_winrate()
+    steps = max(0, math.ceil(delta_elo / (k_factor / 2.0)))
+    if steps == 0:
+        return 1.0
+    if winrate <= 0 or winrate >= 1:
+        return float(winrate >= 1 and nb_games >= steps)
+    wins = np.arange(nb_games + 1)
+    # Position of the walk at the end, in steps of k_factor / 2
+    end = 2 * wins - nb_games
+    log_pmf = binomial.log_pmf(nb_games, winrate)
+    log_ratio = math.log1p(-winrate) - math.log(winrate)
+    above = end >= steps
+    terms = np.concatenate(
+        (log_pmf[above], log_pmf[end > steps] + (end[end > steps] - steps) * log_ratio)
+    )
+    if len(terms) == 0:
+        return 0.0
+    return float(min(1.0, np.exp(binomial.log_sum_exp(terms))))
+
+
+def brute_force_winrate(nb_games=1000000):
     nb_wins = 0
     nb_losses = 0
-    for i in range(1000000):
+    for i in range(nb_games):
         if create_team_and_play():
             nb_wins += 1
         else:
@@ -90,6 +302,59 @@ def main():
     )
     # After 1000000 simulations, the result was:
     # Nb wins 535868, nb losses 464132, winrate 0.535868
+    return nb_wins / (nb_wins + nb_losses)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Calculates the expected winrate of a player in elo hell"
+    )
+    parser.add_argument(
+        "--brute-force",
+        action="store_true",
+        help="Also plays 1000000 games one at a time, like the first version of this program",
+    )
+    args = parser.parse_args()
+
+    print(
+        "Exact winrate with a probability of inter of {}: {}".format(
+            PROBA_OF_INTER, exact_winrate()
+        )
+    )
+    nb_games = 10000000
+    print(
+        "Winrate over {} simulated games: {}".format(
+            nb_games, simulate_winrate(nb_games)
+        )
+    )
+    if args.brute_force:
+        brute_force_winrate()
+
+    start = time.perf_counter()
+    probas = np.linspace(0, 0.5, 501)
+    team_sizes = range(1, 11)
+    grid = winrate_grid(probas, team_sizes)
+    print(
+        "Winrates for {} probabilities of inter and {} team sizes computed in {:.4f}s".format(
+            len(probas), len(team_sizes), time.perf_counter() - start
+        )
+    )
+    for size, winrates in zip(team_sizes, grid):
+        print(
+            "{}vs{}: winrate {:.4f} with 5% of inters, {:.4f} with 10%, {:.4f} with 20%".format(
+                size, size, winrates[50], winrates[100], winrates[200]
+            )
+        )
+
+    for nb_games in (100, 1000, 10000, 1000000):
+        print(
+            "Probability of climbing {} elo (Silver I to Gold I) within {} games: {:.4f}, {:.4f} to be at least that high after the last one".format(
+                SILVER_I_TO_GOLD_I,
+                nb_games,
+                climb_probability(SILVER_I_TO_GOLD_I, nb_games),
+                probability_above(SILVER_I_TO_GOLD_I, nb_games),
+            )
+        )
 
 
 if __name__ == "__main__":
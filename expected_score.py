@@ -0,0 +1,157 @@
+"""
+The expected score of the elo system, its inverse and the compensation ratio, on single numbers and on whole arrays
+of rating gaps.
+
+The expected score of a player against an opponent 'gap' elo points below them is 1 / (1 + 10 ** (-gap / divider)).
+elo_gap gives the gap needed for a target expected score (win rate), and compensation_ratio the number of wins that
+compensate one loss against the same opponent: a win earns K * (1 - E), a loss costs K * E, so the ratio is
+E / (1 - E) = 10 ** (gap / divider).
+
+expected_score is the scalar version used by Player.expected_result. expected_scores works on arrays: with
+exact=True it rounds like math.pow, which keeps the array engine bit for bit identical to the Player path, otherwise
+it uses numpy's vectorized power.
+
+ExpectedScoreTable precomputes the expected scores of quantized gaps for the array hot loops. The interpolated lookup
+(error below 1e-6 with 1 point buckets) costs a single np.interp call on the small arrays of a round-robin journey and
+bucket arithmetic on larger ones: up to 10 times faster than the exact expected_scores and about as fast as numpy's
+power. The nearest bucket lookup (error below 1e-3) is about 1.6 times faster than numpy's power on large arrays.
+Results computed with a table are not identical to the Player path anymore.
+"""
+
+import math
+import itertools
+import numpy as np
+
+DIVIDER = 400
+# Below this many gaps, np.interp (one call, but a binary search per gap) is faster than the bucket arithmetic
+INTERP_MAX_SIZE = 256
+
+
+def pow10(exponents):
+    """Returns 10**exponents, element-wise, with the same rounding as math.pow.
+
+    numpy's pow can use SIMD implementations that differ from the libm one in the last bit, which would break the
+    bit for bit equivalence with the Player path.
+
+    Arguments:
+        exponents {np.ndarray} -- 1D array of exponents
+    """
+    return np.fromiter(
+        map(math.pow, itertools.repeat(10.0), exponents.tolist()),
+        dtype=float,
+        count=len(exponents),
+    )
+
+
+def expected_score(gap, divider=DIVIDER):
+    """Returns the expected score (0 means a guaranteed loss, 1 a guaranteed win) of a player rated 'gap' elo points
+    above their opponent, for a single gap
+
+    Arguments:
+        gap {float} -- Elo of the player minus elo of the opponent
+
+    Keyword Arguments:
+        divider {float} -- Elo divider (default: {DIVIDER})
+    """
+    return 1.0 / (1 + math.pow(10, -gap / divider))
+
+
+def expected_scores(gaps, divider=DIVIDER, table=None, exact=False):
+    """Same as expected_score for an array of gaps.
+
+    Arguments:
+        gaps {np.ndarray} -- Elo of the players minus elo of their opponents
+
+    Keyword Arguments:
+        divider {float} -- Elo divider (default: {DIVIDER})
+        table {ExpectedScoreTable} -- If not None, the scores are looked up in this table, built for the same
+        divider (default: {None})
+        exact {bool} -- Rounds like expected_score (1D arrays only) instead of using numpy's power. Ignored with a
+        table (default: {False})
+    """
+    if table is not None:
+        if table.divider != divider:
+            raise ValueError(
+                "table built for a divider of {}, not {}".format(table.divider, divider)
+            )
+        return table.lookup(gaps)
+    exponents = -np.asarray(gaps, dtype=float) / divider
+    if exact:
+        return 1.0 / (1 + pow10(exponents))
+    return 1.0 / (1 + np.power(10.0, exponents))
+
+
+def elo_gap(score, divider=DIVIDER):
+    """Returns the elo gap giving an expected score (a win rate) of 'score', the inverse of expected_scores
+
+    Arguments:
+        score {float or np.ndarray} -- Expected score(s), strictly between 0 and 1
+    """
+    score = np.asarray(score, dtype=float)
+    return divider * np.log10(score / (1 - score))
+
+
+def compensation_ratio(gap, divider=DIVIDER):
+    """Returns the number of wins against an opponent 'gap' elo points below needed to compensate one loss against
+    them, E / (1 - E) with E their expected score
+
+    Arguments:
+        gap {float or np.ndarray} -- Elo of the player minus elo of the opponent
+    """
+    return np.power(10.0, np.asarray(gap, dtype=float) / divider)
+
+
+class ExpectedScoreTable(object):
+    """
+    Expected scores of the gaps between -max_gap and max_gap, every 'resolution' elo points
+    """
+
+    def __init__(self, resolution=1.0, max_gap=3200, divider=DIVIDER, interpolate=True):
+        """
+        Keyword Arguments:
+            resolution {float} -- Width of the gap buckets in elo points (default: {1.0})
+            max_gap {float} -- Larger gaps get the score of max_gap, 10**-8 away from 0 or 1 with the default
+            divider (default: {3200})
+            divider {float} -- Elo divider (default: {DIVIDER})
+            interpolate {bool} -- Interpolates linearly between the buckets, otherwise takes the nearest one
+            (default: {True})
+        """
+        self.resolution = float(resolution)
+        self.divider = divider
+        self.interpolate = interpolate
+        self.nb_buckets = int(math.ceil(max_gap / self.resolution))
+        self.max_gap = self.nb_buckets * self.resolution
+        self.gaps = np.arange(-self.nb_buckets, self.nb_buckets + 1) * self.resolution
+        self.scores = expected_scores(self.gaps, divider)
+        # Slope towards the next bucket, 0 after the last one so that max_gap itself is looked up exactly
+        self.slopes = np.append(np.diff(self.scores), 0.0)
+
+    def lookup(self, gaps):
+        """Returns the expected scores of an array of gaps"""
+        gaps = np.asarray(gaps, dtype=float)
+        if self.interpolate and gaps.size <= INTERP_MAX_SIZE:
+            return np.interp(gaps, self.gaps, self.scores)
+        position = gaps * (1 / self.resolution)
+        if not self.interpolate:
+            index = np.rint(position).astype(np.intp)
+            index += self.nb_buckets
+            np.clip(index, 0, 2 * self.nb_buckets, out=index)
+            return self.scores.take(index)
+        position += self.nb_buckets
+        np.clip(position, 0, 2 * self.nb_buckets, out=position)
+        index = position.astype(np.intp)
+        # Only the fraction of a bucket is left in 'position'
+        position -= index
+        scores = self.slopes.take(index)
+        scores *= position
+        scores += self.scores.take(index)
+        return scores
+
+    def max_error(self):
+        """Returns the largest difference with expected_scores, at the middle of the buckets"""
+        middles = (np.arange(-self.nb_buckets, self.nb_buckets) + 0.5) * self.resolution
+        return float(
+            np.max(
+                np.abs(self.lookup(middles) - expected_scores(middles, self.divider))
+            )
+        )
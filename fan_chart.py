@@ -0,0 +1,332 @@
+"""
+Fan charts of thousands of seasons for the static mode of elo.py (--fan-chart), instead of one plot per season.
+
+A background process plays the seasons in batches (array_engine.replicate_journeys) and feeds the elo of every player
+after every journey to streaming quantile sketches (quantile_sketch.py), so the memory doesn't grow with the number of
+seasons: only one batch of seasons and the markers of the sketches are kept. A snapshot of the quantiles is sent to
+the display at most once per refresh interval, and the display redraws one fan chart per player at that fixed rate:
+the 5-95% and 25-75% bands and the median of the elo after each journey.
+"""
+
+import sys
+import math
+import time
+import queue
+import multiprocessing
+import numpy as np
+import array_engine
+import profiling
+from quantile_sketch import P2Quantiles, PERCENTILES
+
+# Sent through the queue when the requested number of seasons has been played, with the last snapshot
+_DONE = "done"
+
+
+class SeasonQuantiles(object):
+    """
+    Streaming quantiles of the elo of every player after every journey, over many seasons played in batches
+    """
+
+    def __init__(
+        self,
+        skills,
+        stages,
+        divider,
+        starting_elo,
+        percentiles=PERCENTILES,
+        batch_size=64,
+        expected_table=None,
+    ):
+        """
+        Arguments:
+            skills {list} -- Skill of each player
+            stages {list} -- (number of journeys, K factor) pairs, see array_engine.replicate_journeys
+            divider {float} -- Elo divider
+            starting_elo {float} -- Elo of every player at the start of a season
+
+        Keyword Arguments:
+            percentiles {tuple} -- Percentiles to estimate (default: {PERCENTILES})
+            batch_size {int} -- Number of seasons played at once (default: {64})
+            expected_table {expected_score.ExpectedScoreTable} -- See array_engine.simulate_replicates
+            (default: {None})
+        """
+        self.skills = list(skills)
+        self.stages = list(stages)
+        self.divider = divider
+        self.starting_elo = starting_elo
+        self.batch_size = batch_size
+        self.expected_table = expected_table
+        nb_players = len(self.skills)
+        nb_points = 1 + sum(nb_journeys for nb_journeys, k in self.stages)
+        # Games played by each player at each point of the charts
+        self.games = np.arange(nb_points) * (nb_players - 1)
+        self.sketch = P2Quantiles((nb_points, nb_players), percentiles)
+        self.nb_seasons = 0
+        self._batch = np.empty((nb_points, batch_size, nb_players))
+
+    @property
+    def percentiles(self):
+        return self.sketch.percentiles
+
+    def play_batch(self, rng, nb_seasons=None):
+        """Plays 'nb_seasons' seasons (batch_size by default, at most) and adds them to the quantiles"""
+        if nb_seasons is None:
+            nb_seasons = self.batch_size
+        batch = self._batch[:, :nb_seasons]
+        for point, (row, elo) in enumerate(
+            array_engine.replicate_journeys(
+                self.skills,
+                self.stages,
+                nb_seasons,
+                rng,
+                self.divider,
+                self.starting_elo,
+                self.expected_table,
+            )
+        ):
+            batch[point] = elo
+        for season in range(nb_seasons):
+            self.sketch.add(batch[:, season])
+        self.nb_seasons += nb_seasons
+
+    def quantiles(self):
+        """Returns the (percentiles x points x players) estimates"""
+        return self.sketch.quantiles()
+
+
+def accumulate(season_quantiles, nb_seasons, rng):
+    """Plays batches of seasons until 'nb_seasons' seasons have been added"""
+    while season_quantiles.nb_seasons < nb_seasons:
+        season_quantiles.play_batch(
+            rng,
+            min(
+                season_quantiles.batch_size,
+                nb_seasons - season_quantiles.nb_seasons,
+            ),
+        )
+    return season_quantiles
+
+
+def _accumulate(season_quantiles, seed, nb_seasons, snapshots, stop_event, interval):
+    rng = np.random.default_rng(seed)
+    last_send = time.perf_counter()
+    while nb_seasons is None or season_quantiles.nb_seasons < nb_seasons:
+        if stop_event.is_set():
+            return
+        batch_size = season_quantiles.batch_size
+        if nb_seasons is not None:
+            batch_size = min(batch_size, nb_seasons - season_quantiles.nb_seasons)
+        season_quantiles.play_batch(rng, batch_size)
+        now = time.perf_counter()
+        if now - last_send < interval:
+            continue
+        if _replace(
+            snapshots, (season_quantiles.nb_seasons, season_quantiles.quantiles())
+        ):
+            last_send = now
+    _drain(snapshots)
+    snapshots.put((_DONE, season_quantiles.nb_seasons, season_quantiles.quantiles()))
+
+
+def _drain(snapshots):
+    """Removes the snapshot the display hasn't taken yet, if any"""
+    try:
+        snapshots.get_nowait()
+    except queue.Empty:
+        pass
+
+
+def _replace(snapshots, snapshot):
+    """Sends a snapshot in place of the one the display hasn't taken yet, so the newest one wins. Returns False in the
+    rare case the previous snapshot was still on its way to the queue and the new one couldn't be sent
+    """
+    _drain(snapshots)
+    try:
+        snapshots.put_nowait(snapshot)
+    except queue.Full:
+        return False
+    return True
+
+
+class FanChart(object):
+    """
+    One fan chart per player: bands between the symmetric percentiles, outer ones lighter, and the median
+    """
+
+    def __init__(self, names, games, percentiles, placement_games=None):
+        """
+        Arguments:
+            names {list} -- Name of each player, used as title of their chart
+            games {np.ndarray} -- Games played at each point of the charts
+            percentiles {tuple} -- Sorted percentiles of the quantiles that will be drawn
+
+        Keyword Arguments:
+            placement_games {int} -- If not None, a vertical line marks the end of the placement games
+            (default: {None})
+        """
+        import matplotlib.pyplot as plt
+
+        self.plt = plt
+        self.games = games
+        self.percentiles = tuple(percentiles)
+        nb_players = len(names)
+        nb_columns = int(math.ceil(math.sqrt(nb_players)))
+        nb_rows = int(math.ceil(nb_players / float(nb_columns)))
+        plt.ion()
+        self.figure, axes = plt.subplots(
+            nb_rows,
+            nb_columns,
+            squeeze=False,
+            sharex=True,
+            sharey=True,
+            figsize=(20, 16),
+        )
+        self.axes = list(axes.flat[:nb_players])
+        for ax in axes.flat[nb_players:]:
+            ax.set_visible(False)
+        for ax, name in zip(self.axes, names):
+            ax.set_title(name)
+            ax.grid(True)
+            if placement_games is not None:
+                ax.axvline(x=placement_games, color="k", linestyle="--", linewidth=1)
+        # (lower, upper) indices of the percentiles of each band, from the outermost one
+        nb_bands = len(self.percentiles) // 2
+        self.bands = [
+            (band, len(self.percentiles) - 1 - band) for band in range(nb_bands)
+        ]
+        self.median = None
+        if len(self.percentiles) % 2:
+            self.median = nb_bands
+        self.artists = []
+        self.nb_frames = 0
+        plt.show(block=False)
+
+    def is_open(self):
+        return self.plt.fignum_exists(self.figure.number)
+
+    def draw(self, quantiles, nb_seasons):
+        """Redraws every chart from the (percentiles x points x players) quantiles"""
+        for artist in self.artists:
+            artist.remove()
+        self.artists = []
+        for l, ax in enumerate(self.axes):
+            for b, (low, high) in enumerate(self.bands):
+                self.artists.append(
+                    ax.fill_between(
+                        self.games,
+                        quantiles[low, :, l],
+                        quantiles[high, :, l],
+                        color="C0",
+                        alpha=0.2 + 0.3 * b / max(len(self.bands) - 1, 1),
+                        linewidth=0,
+                        label="{:g}-{:g}%".format(
+                            self.percentiles[low], self.percentiles[high]
+                        ),
+                    )
+                )
+            if self.median is not None:
+                self.artists.extend(
+                    ax.plot(
+                        self.games,
+                        quantiles[self.median, :, l],
+                        color="C0",
+                        label="{:g}%".format(self.percentiles[self.median]),
+                    )
+                )
+        if self.nb_frames == 0:
+            self.axes[0].legend(loc=2)
+        low = np.nanmin(quantiles)
+        high = np.nanmax(quantiles)
+        margin = 0.05 * max(high - low, 1)
+        # The axes are shared
+        self.axes[0].set_xlim(self.games[0], self.games[-1])
+        self.axes[0].set_ylim(low - margin, high + margin)
+        self.figure.suptitle(
+            "{} seasons, elo after each journey, percentiles {}".format(
+                nb_seasons, "/".join("{:g}".format(p) for p in self.percentiles)
+            )
+        )
+        self.figure.canvas.draw_idle()
+        self.figure.canvas.flush_events()
+        self.nb_frames += 1
+
+
+def run(
+    season_quantiles,
+    names,
+    seed=None,
+    nb_seasons=None,
+    refresh_interval=1.0,
+    placement_games=None,
+    verbose=True,
+):
+    """Accumulates seasons in a background process and redraws the fan charts every 'refresh_interval' seconds.
+
+    Arguments:
+        season_quantiles {SeasonQuantiles} -- Quantiles to accumulate, copied to the background process
+        names {list} -- Name of each player
+
+    Keyword Arguments:
+        seed {int} -- Seed of the random generator of the seasons, None for a fresh one (default: {None})
+        nb_seasons {int} -- Stops after this many seasons, None to go on until the window is closed
+        (default: {None})
+        refresh_interval {float} -- Time between two redraws in seconds (default: {1.0})
+        placement_games {int} -- See FanChart (default: {None})
+        verbose {bool} -- Prints the number of seasons per second at the end (default: {True})
+
+    Returns:
+        tuple -- (number of seasons, (percentiles x points x players) quantiles) of the last snapshot drawn,
+        (0, None) if the window was closed before the first one
+    """
+    chart = FanChart(
+        names, season_quantiles.games, season_quantiles.percentiles, placement_games
+    )
+    profiling.watch_canvas(chart.figure.canvas)
+    # Only the latest snapshot matters
+    snapshots = multiprocessing.Queue(1)
+    stop_event = multiprocessing.Event()
+    process = multiprocessing.Process(
+        target=_accumulate,
+        args=(
+            season_quantiles,
+            seed,
+            nb_seasons,
+            snapshots,
+            stop_event,
+            refresh_interval,
+        ),
+        daemon=True,
+    )
+    start = time.perf_counter()
+    process.start()
+    last = (0, None)
+    done = False
+    while not done:
+        frame_start = time.perf_counter()
+        try:
+            snapshot = snapshots.get(timeout=refresh_interval)
+            if snapshot[0] == _DONE:
+                snapshot = snapshot[1:]
+                done = True
+            last = snapshot
+            chart.draw(snapshot[1], snapshot[0])
+        except queue.Empty:
+            chart.figure.canvas.flush_events()
+        if not chart.is_open():
+            break
+        remaining = refresh_interval - (time.perf_counter() - frame_start)
+        if remaining > 0 and not done:
+            time.sleep(remaining)
+    stop_event.set()
+    process.join(1)
+    if process.is_alive():
+        process.terminate()
+    if verbose and last[0]:
+        elapsed = time.perf_counter() - start
+        print(
+            "{} seasons in {:.1f}s ({:.0f} seasons/s)".format(
+                last[0], elapsed, last[0] / elapsed
+            ),
+            file=sys.stderr,
+        )
+    return last
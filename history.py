@@ -0,0 +1,121 @@
+"""
+Compact storage for the elo history of a player.
+
+A Python list of floats costs a pointer plus a boxed float per entry and keeps reallocating while it grows.
+RatingHistory stores the ratings in a preallocated numpy array of the chosen dtype and still reads like a list
+(len, indexing, slicing, iteration, np.asarray). It can also keep only the last N ratings as a ring buffer.
+"""
+
+import numpy as np
+
+
+class RatingHistory(object):
+    """
+    List-like history of elo ratings backed by a preallocated typed array
+    """
+
+    __slots__ = ("_values", "_start", "_size", "nb_appended", "last")
+
+    def __init__(self, capacity=16, dtype=np.float64, last=None):
+        """
+        Keyword Arguments:
+            capacity {int} -- Number of ratings to preallocate, e.g. 1 + the number of games of the season. The array
+            doubles its size if more ratings are appended (default: {16})
+            dtype {np.dtype} -- np.float32 halves the memory, np.float64 keeps the exact ratings (default: {np.float64})
+            last {int} -- If not None, only the 'last' most recent ratings are kept (ring buffer) (default: {None})
+        """
+        if last is not None:
+            if last < 1:
+                raise ValueError(
+                    "A history keeps at least 1 rating, got last={}".format(last)
+                )
+            capacity = last
+        self._values = np.empty(max(capacity, 1), dtype=dtype)
+        self._start = 0
+        self._size = 0
+        # Total number of ratings appended since the creation, including the ones dropped by the ring buffer
+        self.nb_appended = 0
+        self.last = last
+
+    def append(self, elo):
+        if self.last is not None:
+            self._values[(self._start + self._size) % self.last] = elo
+            if self._size == self.last:
+                self._start = (self._start + 1) % self.last
+            else:
+                self._size += 1
+        else:
+            if self._size == len(self._values):
+                grown = np.empty(2 * len(self._values), dtype=self._values.dtype)
+                grown[: self._size] = self._values
+                self._values = grown
+            self._values[self._size] = elo
+            self._size += 1
+        self.nb_appended += 1
+
+    def extend(self, values):
+        """Appends several ratings at once, e.g. the history restored from a checkpoint"""
+        values = np.asarray(values)
+        if self.last is not None:
+            for elo in values:
+                self.append(elo)
+            return
+        end = self._size + len(values)
+        if end > len(self._values):
+            grown = np.empty(max(2 * len(self._values), end), dtype=self._values.dtype)
+            grown[: self._size] = self._values[: self._size]
+            self._values = grown
+        self._values[self._size : end] = values
+        self._size = end
+        self.nb_appended += len(values)
+
+    def __len__(self):
+        return self._size
+
+    def _ordered(self):
+        """Returns the stored ratings from the oldest to the most recent, without copying when possible"""
+        if self._start + self._size <= len(self._values):
+            return self._values[self._start : self._start + self._size]
+        return np.concatenate(
+            (
+                self._values[self._start :],
+                self._values[: self._size - (len(self._values) - self._start)],
+            )
+        )
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._ordered()[index].copy()
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("RatingHistory index out of range")
+        return self._values[(self._start + index) % len(self._values)].item()
+
+    def __iter__(self):
+        return iter(self._ordered().tolist())
+
+    def __array__(self, dtype=None, copy=None):
+        values = self._ordered()
+        if dtype is not None:
+            return values.astype(dtype)
+        return values.copy()
+
+    def view(self):
+        """Returns the stored ratings from the oldest to the most recent without copying them when possible. Without
+        'last' the stored ratings never change, so the view stays valid while more ratings are appended
+        """
+        return self._ordered()
+
+    def first_game_index(self):
+        """Returns the index (in all the appended ratings) of the oldest stored rating"""
+        return self.nb_appended - self._size
+
+    @property
+    def nbytes(self):
+        return self._values.nbytes
+
+    def __repr__(self):
+        return "RatingHistory({}, dtype={}, last={})".format(
+            self._ordered().tolist(), self._values.dtype, self.last
+        )
@@ -0,0 +1,301 @@
+"""
+Leaderboard of a population: ranks, top players and percentile tiers, kept up to date while the elo ratings change.
+
+The elo ratings are counted in buckets of 'resolution' points, from the highest to the lowest, and the counts are
+summed by a Fenwick tree. The number of players above a rating, the rating below which a given fraction of the players
+is, and so the rank of a player or the boundaries of the tiers, are answered in O(log(number of buckets)). Moving one
+player (Player.update) costs O(log(number of buckets)) too, and moving many players at once (the array engines) only
+touches the counts of the buckets that changed, without sorting anything.
+
+The players are also kept sorted by bucket, the players of bucket b being order[prefix(b):prefix(b + 1)], so the best
+players are read from the start of that order without looking at the others. A moved player is swapped along the
+non-empty buckets between their old and new ones; after add or update the order is sorted again, once, by the next
+call that needs it.
+
+The tiers are defined like in elo_hell.py, by the top percentage of players they start at (Iron IV is the top 98.84%,
+Challenger the top 0.021%).
+"""
+
+import numpy as np
+
+# Top percentage of the players at or above each tier, see the docstring of elo_hell.py
+LOL_TIERS = (
+    ("Iron IV", 98.84),
+    ("Iron III", 98.4),
+    ("Iron II", 97.2),
+    ("Iron I", 95.0),
+    ("Bronze IV", 91.3),
+    ("Bronze III", 85.7),
+    ("Bronze II", 81.3),
+    ("Bronze I", 75.5),
+    ("Silver IV", 68.2),
+    ("Silver III", 57.2),
+    ("Silver II", 47.9),
+    ("Silver I", 38.9),
+    ("Gold IV", 31.7),
+    ("Gold III", 22.4),
+    ("Gold II", 16.7),
+    ("Gold I", 12.1),
+    ("Platinum IV", 9.1),
+    ("Platinum III", 6.0),
+    ("Platinum II", 4.2),
+    ("Platinum I", 3.0),
+    ("Diamond IV", 2.1),
+    ("Diamond III", 0.85),
+    ("Diamond II", 0.60),
+    ("Diamond I", 0.28),
+    ("Master", 0.099),
+    ("GrandMaster", 0.069),
+    ("Challenger", 0.021),
+)
+
+
+class FenwickTree(object):
+    """
+    Prefix sums of an array of counts with O(log n) updates
+    """
+
+    def __init__(self, counts):
+        self.counts = np.array(counts, dtype=np.int64)
+        self.size = len(self.counts)
+        # The highest power of two not above the size, where the searches start
+        self.top_bit = 1 << (self.size.bit_length() - 1) if self.size else 0
+        self.rebuild()
+
+    def rebuild(self):
+        """Recomputes the tree from self.counts in O(n), after the counts were changed directly"""
+        prefix = np.concatenate(([0], np.cumsum(self.counts)))
+        # tree[i] (1-based) sums the counts from i - lowbit(i) + 1 to i
+        i = np.arange(1, self.size + 1)
+        # A list: the single updates and queries below read it one node at a time
+        self.tree = [0] + (prefix[i] - prefix[i - (i & -i)]).tolist()
+
+    def add(self, position, value):
+        self.counts[position] += value
+        tree = self.tree
+        i = int(position) + 1
+        while i <= self.size:
+            tree[i] += value
+            i += i & -i
+
+    def prefix(self, end):
+        """Returns the sum of the counts before 'end' (excluded)"""
+        tree = self.tree
+        total = 0
+        i = int(end)
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def search(self, target):
+        """Returns the smallest position such that the sum of the counts up to it (included) reaches 'target',
+        self.size if the total is lower"""
+        tree = self.tree
+        position = 0
+        bit = self.top_bit
+        while bit:
+            if position + bit <= self.size and tree[position + bit] < target:
+                position += bit
+                target -= tree[position]
+            bit >>= 1
+        return position
+
+
+class Leaderboard(object):
+    """
+    Ranks and tiers of a population of players, updated incrementally
+    """
+
+    def __init__(self, elo=(), low=0, high=4000, resolution=1.0):
+        """
+        Keyword Arguments:
+            elo {np.ndarray} -- Elo of the players already there, player i being elo[i]. More players can be added
+            with add (default: {()})
+            low {float} -- Lowest elo told apart from the others, lower ratings share the lowest bucket (default: {0})
+            high {float} -- Same for the highest elo (default: {4000})
+            resolution {float} -- Width of a bucket in elo points: the ranks and the tier boundaries are exact up to
+            the resolution, players of the same bucket share a rank (default: {1.0})
+        """
+        self.low = float(low)
+        self.resolution = float(resolution)
+        self.nb_buckets = int(np.ceil((high - low) / resolution)) + 1
+        elo = np.asarray(elo, dtype=float)
+        self.elo = np.empty(max(len(elo), 16))
+        self.bucket = np.empty(len(self.elo), dtype=np.int64)
+        self.nb_players = len(elo)
+        self.elo[: len(elo)] = elo
+        self.bucket[: len(elo)] = self.buckets(elo)
+        self.tree = FenwickTree(
+            np.bincount(self.bucket[: len(elo)], minlength=self.nb_buckets)
+        )
+        # Players sorted by bucket and the position of each player in that order, None when they must be sorted again
+        self.order = None
+        self.slot = None
+
+    def __len__(self):
+        return self.nb_players
+
+    def buckets(self, elo):
+        """Bucket of each rating, 0 for the highest ones"""
+        position = np.floor((np.asarray(elo, dtype=float) - self.low) / self.resolution)
+        position = np.clip(position, 0, self.nb_buckets - 1).astype(np.int64)
+        return self.nb_buckets - 1 - position
+
+    def _bucket(self, elo):
+        position = int((elo - self.low) // self.resolution)
+        return self.nb_buckets - 1 - min(max(position, 0), self.nb_buckets - 1)
+
+    def _elo_of(self, bucket):
+        """Lowest elo of a bucket"""
+        return self.low + (self.nb_buckets - 1 - bucket) * self.resolution
+
+    def add(self, elo):
+        """Adds a player and returns their index in the leaderboard"""
+        if self.nb_players == len(self.elo):
+            self.elo = np.concatenate((self.elo, np.empty(len(self.elo))))
+            self.bucket = np.concatenate((self.bucket, np.empty_like(self.bucket)))
+        player = self.nb_players
+        self.nb_players += 1
+        self.elo[player] = elo
+        self.bucket[player] = self._bucket(elo)
+        self.tree.add(self.bucket[player], 1)
+        self.order = None
+        return player
+
+    def move(self, player, elo):
+        """Updates the elo of one player in O(log(number of buckets)) plus the swaps of the order by bucket, e.g.
+        after Player.update"""
+        self.elo[player] = elo
+        bucket = self._bucket(elo)
+        old = self.bucket[player]
+        if bucket != old:
+            if self.order is not None:
+                self._reorder(player, old, bucket)
+            self.bucket[player] = bucket
+            self.tree.add(old, -1)
+            self.tree.add(bucket, 1)
+
+    def _reorder(self, player, old, new):
+        """Moves a player from bucket 'old' to bucket 'new' in the order, before the counts are updated: the player
+        is swapped with the first (moving up) or last (moving down) player of their bucket and of every non-empty
+        bucket in between, O(number of buckets in between) in the worst case"""
+        if new < old:
+            # Buckets old - 1 to new + 1
+            counts = self.tree.counts[new + 1 : old][::-1]
+            start = self.tree.prefix(old)
+            ends = start - np.cumsum(counts)[counts > 0]
+        else:
+            # Buckets old + 1 to new - 1
+            counts = self.tree.counts[old + 1 : new]
+            start = self.tree.prefix(old + 1) - 1
+            ends = start + np.cumsum(counts)[counts > 0]
+        # The swaps rotate the player and the players at the ends of the buckets by one position
+        positions = np.concatenate(([self.slot[player], start], ends))
+        if positions[0] == positions[1]:
+            positions = positions[1:]
+        moved = self.order[positions[1:]]
+        self.order[positions[:-1]] = moved
+        self.order[positions[-1]] = player
+        self.slot[moved] = positions[:-1]
+        self.slot[player] = positions[-1]
+
+    def _sorted_order(self):
+        if self.order is None:
+            self.order = np.argsort(self.bucket[: self.nb_players], kind="stable")
+            self.slot = np.empty(len(self.bucket), dtype=np.int64)
+            self.slot[self.order] = np.arange(self.nb_players)
+        return self.order
+
+    def update(self, elo, players=None):
+        """Updates the elo of many players at once, e.g. after a round of the array engines: the players who
+        changed bucket are counted in one pass and the tree is rebuilt in O(number of buckets).
+
+        Arguments:
+            elo {np.ndarray} -- New elo of 'players', or of every player if 'players' is None
+
+        Keyword Arguments:
+            players {np.ndarray} -- Indices of the players that played (default: {None})
+        """
+        if players is None:
+            players = slice(0, self.nb_players)
+        elo = np.asarray(elo, dtype=float)
+        buckets = self.buckets(elo)
+        old = self.bucket[players]
+        changed = buckets != old
+        if np.any(changed):
+            counts = self.tree.counts
+            counts -= np.bincount(old[changed], minlength=self.nb_buckets)
+            counts += np.bincount(buckets[changed], minlength=self.nb_buckets)
+            self.tree.rebuild()
+            self.order = None
+        self.elo[players] = elo
+        self.bucket[players] = buckets
+
+    def count_above(self, elo):
+        """Returns the number of players whose bucket is above the bucket of 'elo'"""
+        return self.tree.prefix(self._bucket(elo))
+
+    def rank(self, player):
+        """Returns the rank of a player, 1 for the best. Players of the same bucket share the best rank"""
+        return self.tree.prefix(self.bucket[player]) + 1
+
+    def top_percent(self, player):
+        """Returns the top percentage of the players a player is in, e.g. 5 for the best 5%"""
+        return 100.0 * self.rank(player) / self.nb_players
+
+    def _boundary_bucket(self, top_percent):
+        count = max(int(np.ceil(top_percent / 100.0 * self.nb_players)), 1)
+        return min(self.tree.search(count), self.nb_buckets - 1)
+
+    def boundary(self, top_percent):
+        """Returns the lowest elo of the best 'top_percent' % of the players: the floor of a tier"""
+        return self._elo_of(self._boundary_bucket(top_percent))
+
+    def top(self, k=10):
+        """Returns the indices of the 'k' best players, best first.
+
+        The bucket of the k-th player is found in O(log(number of buckets)), then only the players at or above it
+        are read from the start of the order by bucket and sorted by their exact elo. The first call after add or
+        update sorts the players by bucket again, in O(n).
+        """
+        k = min(k, self.nb_players)
+        if k == 0:
+            return np.empty(0, dtype=np.int64)
+        last = self.tree.search(k)
+        # Sorted by index first, so that the players of equal elo are ranked by index
+        candidates = np.sort(self._sorted_order()[: self.tree.prefix(last + 1)])
+        best = np.argsort(-self.elo[candidates], kind="stable")[:k]
+        return candidates[best]
+
+    def tier(self, player, tiers=LOL_TIERS):
+        """Returns the name of the tier of a player: the best tier whose top percentage they are in. The players
+        below the lowest tier are counted in it"""
+        top_percent = self.top_percent(player)
+        name = tiers[0][0]
+        for tier_name, tier_percent in tiers:
+            if top_percent <= tier_percent:
+                name = tier_name
+        return name
+
+    def tiers(self, tiers=LOL_TIERS):
+        """Returns the floor elo and the number of players of each tier, in O(number of tiers * log(number of
+        buckets)), from the lowest tier to the highest.
+
+        Returns:
+            list -- (name, floor elo, number of players) of each tier. The floors are bucket boundaries, so the
+            populations can differ a bit from the percentages when many players share a bucket
+        """
+        rows = []
+        # Number of players at or above the floor of the tier above
+        above = 0
+        for name, top_percent in reversed(tiers):
+            bucket = self._boundary_bucket(top_percent)
+            at_or_above = self.tree.prefix(bucket + 1)
+            rows.append((name, self._elo_of(bucket), at_or_above - above))
+            above = at_or_above
+        rows.reverse()
+        # The players below the lowest floor are in the lowest tier
+        name, floor, count = rows[0]
+        rows[0] = (name, floor, count + self.nb_players - above)
+        return rows
@@ -0,0 +1,352 @@
+"""
+Live display of elo histories, decoupled from the simulation.
+
+The simulation runs in a background process and pushes blocks of new elo ratings through a bounded queue. The
+renderer takes everything available at most once per frame, appends it to preallocated line buffers and redraws only
+the lines with blitting. The axes (and the cached background) are only redrawn when the data leaves the current
+limits, so the cost of a frame doesn't grow with the length of the run and the simulation never waits for the
+display.
+"""
+
+import sys
+import time
+import queue
+import multiprocessing
+import numpy as np
+import decimate
+import profiling
+
+# Sent through the queue at the end of the simulation, with the number of rows, the duration and the measures of the
+# profiler (see profiling.py)
+_DONE = "done"
+
+
+def _produce(make_blocks, args, blocks_queue, stop_event, send_interval):
+    profiler = profiling.active()
+    if profiler is not None:
+        # Forked with a copy of the profiler of the display: the measures of the simulation are sent back at the end
+        profiler.restart("simulation process")
+    start = time.perf_counter()
+    last_send = start
+    nb_rows = 0
+    pending = []
+    for block in make_blocks(*args):
+        if stop_event.is_set():
+            return
+        pending.append(block)
+        nb_rows += len(block)
+        now = time.perf_counter()
+        if now - last_send < send_interval:
+            continue
+        try:
+            blocks_queue.put_nowait(np.concatenate(pending))
+            pending = []
+            last_send = now
+        except queue.Full:
+            pass
+    duration = time.perf_counter() - start
+    if pending:
+        blocks_queue.put(np.concatenate(pending))
+    profile = None
+    if profiler is not None:
+        profiler.close()
+        profile = (profiler.phases, profiler.counters)
+    blocks_queue.put((_DONE, nb_rows, duration, profile))
+
+
+class SimulationProducer(object):
+    """
+    Runs a generator of (new rows x players) blocks of elo ratings in a separate process and pushes the blocks into
+    a bounded queue.
+
+    When the queue is full the blocks are merged locally instead of blocking, so a slow display slows down the
+    refresh rate, not the simulation. Being a process, the simulation doesn't share the GIL with the display either.
+    """
+
+    def __init__(self, make_blocks, args=(), max_queued=8, send_interval=0.01):
+        """
+        Arguments:
+            make_blocks {function} -- Module level function returning an iterator of blocks
+
+        Keyword Arguments:
+            args {tuple} -- Arguments of make_blocks (default: {()})
+            max_queued {int} -- Size of the queue (default: {8})
+            send_interval {float} -- The blocks are merged and sent at most once every 'send_interval' seconds,
+            which keeps the cost of the queue negligible (default: {0.01})
+        """
+        self.queue = multiprocessing.Queue(max_queued)
+        self.stop_event = multiprocessing.Event()
+        self.process = multiprocessing.Process(
+            target=_produce,
+            args=(make_blocks, args, self.queue, self.stop_event, send_interval),
+            daemon=True,
+        )
+        self.nb_rows = 0
+        self.duration = None
+
+    def start(self):
+        self.process.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class LiveRenderer(object):
+    """
+    One subplot per player, updated incrementally with blitting
+    """
+
+    def __init__(
+        self,
+        names,
+        first_row,
+        y_limits=(1250, 1750),
+        history_last=None,
+        max_points=4000,
+        first_game=0,
+    ):
+        """
+        Arguments:
+            names {list} -- Name of each player, used as legend
+            first_row {np.ndarray} -- Elo of each player before the first game
+
+        Keyword Arguments:
+            y_limits {tuple} -- Initial y limits of every subplot (default: {(1250, 1750)})
+            history_last {int} -- If not None, only the last 'history_last' ratings are kept and displayed
+            (default: {None})
+            max_points {int} -- Each line is drawn with about 'max_points' points at most, keeping the lowest and
+            highest elo of every bucket of games. 0 draws every rating (default: {4000})
+            first_game {int} -- Number of games already played before 'first_row', e.g. when resuming from a
+            checkpoint (default: {0})
+        """
+        import matplotlib.pyplot as plt
+
+        self.plt = plt
+        self.names = names
+        self.history_last = history_last
+        nb_players = len(names)
+        plt.ion()
+        plt.rcParams["figure.figsize"] = (20, 16)
+        self.figure, axes = plt.subplots(nb_players, squeeze=False)
+        self.axes = axes[:, 0]
+        self.x = np.empty(1024)
+        self.y = np.empty((1024, nb_players))
+        self.x[0] = first_game
+        self.y[0] = first_row
+        # The displayed ratings are x[start:size] and y[start:size]
+        self.start = 0
+        self.size = 1
+        self.nb_rows = first_game + 1
+        self.max_points = max_points
+        # Lowest and highest elo of each player since the start, kept up to date by append
+        self.low = np.array(first_row, dtype=float)
+        self.high = np.array(first_row, dtype=float)
+        self.decimator = None
+        if max_points and history_last is None:
+            # The whole history is displayed: its decimation is maintained incrementally
+            self.decimator = decimate.MinMaxDecimator(nb_players, max_points)
+            self.decimator.append(self.x[:1], self.y[:1])
+        self.lines = []
+        for l, ax in enumerate(self.axes):
+            self.lines.append(
+                ax.plot(self.x[:1], self.y[:1, l], "--", linewidth=3, animated=True)[0]
+            )
+            ax.set_xlim(0, 10)
+            ax.set_ylim(*y_limits)
+            ax.grid()
+            ax.legend([names[l]], loc=2)
+        self.backgrounds = None
+        self.nb_frames = 0
+        self.nb_full_draws = 0
+        self.figure.canvas.mpl_connect("resize_event", self._invalidate)
+        self.figure.canvas.mpl_connect("draw_event", self._invalidate)
+        plt.show(block=False)
+
+    def _invalidate(self, event=None):
+        self.backgrounds = None
+
+    def is_open(self):
+        return self.plt.fignum_exists(self.figure.number)
+
+    def append(self, rows):
+        """Appends a (new rows x players) block to the line buffers"""
+        if self.size + len(rows) > len(self.x):
+            # Moving the displayed ratings to the start of bigger buffers. With history_last the old ratings are
+            # dropped here, so the buffers never grow beyond twice the displayed window.
+            kept = self.size - self.start
+            if self.history_last is not None:
+                kept = min(kept, max(self.history_last - len(rows), 0))
+            capacity = max(len(self.x), 2 * (kept + len(rows)))
+            x = np.empty(capacity)
+            y = np.empty((capacity, self.y.shape[1]))
+            x[:kept] = self.x[self.size - kept : self.size]
+            y[:kept] = self.y[self.size - kept : self.size]
+            self.x, self.y = x, y
+            self.start = 0
+            self.size = kept
+        end = self.size + len(rows)
+        self.x[self.size : end] = np.arange(self.nb_rows, self.nb_rows + len(rows))
+        self.y[self.size : end] = rows
+        if self.decimator is not None:
+            self.decimator.append(self.x[self.size : end], rows)
+        self.size = end
+        self.nb_rows += len(rows)
+        if self.history_last is not None:
+            self.start = max(self.start, self.size - self.history_last)
+        else:
+            self.low = np.minimum(self.low, rows.min(axis=0))
+            self.high = np.maximum(self.high, rows.max(axis=0))
+
+    def _update_limits(self):
+        """Grows (or slides) the limits of the axes if the data doesn't fit anymore. Returns True if they changed"""
+        changed = False
+        x_first = self.x[self.start]
+        x_last = self.x[self.size - 1]
+        for l, ax in enumerate(self.axes):
+            x_min, x_max = ax.get_xlim()
+            if x_last > x_max or x_first > x_min + (x_max - x_min) / 2:
+                # Doubling the visible range so that this only happens log(n) times
+                width = max(10, 2 * (x_last - x_first))
+                ax.set_xlim(x_first, x_first + width)
+                changed = True
+            y_min, y_max = ax.get_ylim()
+            if self.history_last is None:
+                low, high = self.low[l], self.high[l]
+            else:
+                # The window slides, its extremes have to be searched again
+                values = self.y[self.start : self.size, l]
+                low, high = values.min(), values.max()
+            if low < y_min or high > y_max:
+                margin = 0.1 * (max(high, y_max) - min(low, y_min))
+                ax.set_ylim(min(low, y_min) - margin, max(high, y_max) + margin)
+                changed = True
+        return changed
+
+    def draw(self):
+        """Redraws the lines, and the whole figure only if the axes changed"""
+        canvas = self.figure.canvas
+        decimated = self.max_points and self.size - self.start > self.max_points
+        if decimated and self.decimator is None:
+            window = self.y[self.start : self.size]
+            kept = decimate.min_max_indices(window, self.max_points)
+        for l, line in enumerate(self.lines):
+            if not decimated:
+                line.set_data(
+                    self.x[self.start : self.size], self.y[self.start : self.size, l]
+                )
+            elif self.decimator is not None:
+                line.set_data(*self.decimator.series(l))
+            else:
+                line.set_data(
+                    self.x[self.start : self.size][kept[l]], window[kept[l], l]
+                )
+        if self._update_limits() or self.backgrounds is None:
+            canvas.draw()
+            self.backgrounds = [canvas.copy_from_bbox(ax.bbox) for ax in self.axes]
+            self.nb_full_draws += 1
+        for ax, line, background in zip(self.axes, self.lines, self.backgrounds):
+            canvas.restore_region(background)
+            ax.draw_artist(line)
+            canvas.blit(ax.bbox)
+        canvas.flush_events()
+        self.nb_frames += 1
+
+
+def run(
+    make_blocks,
+    args,
+    names,
+    first_row,
+    frame_interval=0.05,
+    history_last=None,
+    max_points=4000,
+    verbose=True,
+    first_game=0,
+    profiler=None,
+):
+    """Simulates in a background process and displays the elo histories at most once every 'frame_interval' seconds.
+
+    Arguments:
+        make_blocks {function} -- Module level function returning an iterator of (new rows x players) blocks of elo
+        ratings, e.g. one block per journey
+        args {tuple} -- Arguments of make_blocks
+        names {list} -- Name of each player
+        first_row {np.ndarray} -- Elo of each player before the first game
+
+    Keyword Arguments:
+        frame_interval {float} -- Minimum time between two frames (default: {0.05})
+        history_last {int} -- If not None, only the last 'history_last' ratings are displayed (default: {None})
+        max_points {int} -- Maximum number of points drawn per line, 0 for no limit (default: {4000})
+        verbose {bool} -- Prints the simulation and display throughputs at the end (default: {True})
+        first_game {int} -- Number of games already played before 'first_row' (default: {0})
+        profiler {profiling.Profiler} -- If not None, counts the rows received, prints a live throughput line and
+        gets the measures of the simulation process at the end (default: {None})
+
+    Returns:
+        LiveRenderer -- The renderer, with its figure still open
+    """
+    renderer = LiveRenderer(
+        names,
+        first_row,
+        history_last=history_last,
+        max_points=max_points,
+        first_game=first_game,
+    )
+    profiling.watch_canvas(renderer.figure.canvas)
+    producer = SimulationProducer(make_blocks, args)
+    start = time.perf_counter()
+    producer.start()
+    done = False
+    while not done:
+        frame_start = time.perf_counter()
+        received = False
+        # Waiting for the first block of the frame, then taking everything available
+        try:
+            block = producer.queue.get(timeout=max(frame_interval, 0.001))
+            while True:
+                if isinstance(block, tuple) and block[0] == _DONE:
+                    producer.nb_rows, producer.duration, profile = block[1:]
+                    if profiler is not None and profile is not None:
+                        profiler.merge(*profile)
+                    done = True
+                    break
+                renderer.append(block)
+                received = True
+                if profiler is not None:
+                    profiler.count("rows", len(block))
+                block = producer.queue.get_nowait()
+        except queue.Empty:
+            pass
+        if not renderer.is_open():
+            producer.stop()
+            break
+        if received or done:
+            renderer.draw()
+        else:
+            renderer.figure.canvas.flush_events()
+        if profiler is not None:
+            profiler.print_live()
+        remaining = frame_interval - (time.perf_counter() - frame_start)
+        if remaining > 0 and not done:
+            time.sleep(remaining)
+    producer.stop()
+    if profiler is not None:
+        # Ending the live line
+        print(file=sys.stderr)
+    if verbose and producer.duration is not None:
+        elapsed = time.perf_counter() - start
+        print(
+            "Simulated {} rows in {:.3f}s ({:.0f} rows/s), displayed {} frames in {:.3f}s ({:.1f} fps, {} full redraws)".format(
+                producer.nb_rows,
+                producer.duration,
+                producer.nb_rows / max(producer.duration, 1e-9),
+                renderer.nb_frames,
+                elapsed,
+                renderer.nb_frames / elapsed,
+                renderer.nb_full_draws,
+            )
+        )
+    return renderer
@@ -0,0 +1,370 @@
+"""
+Ladder simulation with rating-based matchmaking, for populations of 10^5 to 10^6 players.
+
+Instead of the round-robin of elo.py (every player against every other player, O(n^2) games per journey), each round
+the players looking for a game are paired with the player closest to them in elo, like a real ladder. The players are
+kept in a rating index (their order by elo bucket) which is updated after each round with an O(n) radix sort, so a
+round costs O(n) and all its games are applied as one array operation since no player plays twice in it.
+"""
+
+import sys
+import time
+import argparse
+import numpy as np
+import array_engine
+from expected_score import expected_scores
+
+SKILL_DISTRIBUTIONS = ("ladder", "uniform", "normal", "lognormal")
+
+
+def draw_skills(
+    nb_players,
+    distribution="ladder",
+    rng=None,
+    min_skill=10,
+    delta_skill=1,
+    mean=100.0,
+    std=20.0,
+):
+    """Returns the skill of each player.
+
+    The probability of winning a game is skill / (skill + other skill), so the skills must be positive: the normal
+    distribution is clipped at 1.
+
+    Arguments:
+        nb_players {int} -- Number of players
+
+    Keyword Arguments:
+        distribution {str} -- "ladder" (min_skill + i * delta_skill like elo.py), "uniform" (between min_skill and
+        min_skill + nb_players * delta_skill), "normal" or "lognormal" (with the given mean and standard deviation)
+        (default: {"ladder"})
+        rng {np.random.Generator} -- Source of randomness, a fresh one if None (default: {None})
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    if distribution == "ladder":
+        return min_skill + np.arange(nb_players) * float(delta_skill)
+    if distribution == "uniform":
+        return rng.uniform(min_skill, min_skill + nb_players * delta_skill, nb_players)
+    if distribution == "normal":
+        return np.maximum(rng.normal(mean, std, nb_players), 1.0)
+    if distribution == "lognormal":
+        # Parameters of the underlying normal distribution giving this mean and standard deviation
+        sigma2 = np.log(1 + (std / mean) ** 2)
+        return rng.lognormal(np.log(mean) - sigma2 / 2, np.sqrt(sigma2), nb_players)
+    raise ValueError(
+        "Unknown skill distribution {}, expected one of {}".format(
+            distribution, SKILL_DISTRIBUTIONS
+        )
+    )
+
+
+class RatingIndex(object):
+    """
+    Players sorted by elo buckets, kept up to date incrementally.
+
+    The elo ratings are rounded to buckets of 'resolution' points and the players are sorted by bucket with a stable
+    sort, starting from the previous order. Small integer keys are sorted by numpy with a radix sort, so an update
+    costs O(n) whatever the population, and the players of the same bucket stay in their previous order.
+    """
+
+    def __init__(self, elo, rng=None, resolution=1.0):
+        """
+        Arguments:
+            elo {np.ndarray} -- Elo of each player
+
+        Keyword Arguments:
+            rng {np.random.Generator} -- Used to shuffle the players once, so that the players of the same bucket
+            (everybody at the start of a season) are not ordered by index (default: {None})
+            resolution {float} -- Width of a bucket in elo points (default: {1.0})
+        """
+        self.resolution = resolution
+        self.order = np.arange(len(elo)) if rng is None else rng.permutation(len(elo))
+        self.update(elo)
+
+    def update(self, elo):
+        """Sorts the players again after their elo changed"""
+        values = elo[self.order]
+        low = values.min()
+        if (values.max() - low) / self.resolution < np.iinfo(np.uint16).max:
+            keys = ((values - low) / self.resolution).astype(np.uint16)
+        else:
+            # Too many buckets for 16 bits keys, sorting the exact ratings
+            keys = values
+        self.order = self.order[np.argsort(keys, kind="stable")]
+
+    def ranks(self):
+        """Returns the rank of each player in the index, 0 for the lowest elo"""
+        ranks = np.empty(len(self.order), dtype=np.intp)
+        ranks[self.order] = np.arange(len(self.order))
+        return ranks
+
+    def pair(self, queued=None, shift=0):
+        """Pairs the players looking for a game with their neighbour in the index.
+
+        Keyword Arguments:
+            queued {np.ndarray} -- Boolean mask of the players looking for a game, everybody if None (default: {None})
+            shift {int} -- 0 pairs the 1st and 2nd lowest elo, the 3rd and 4th... 1 leaves the lowest elo out and
+            pairs the 2nd and 3rd... Alternating it avoids always pairing the same players (default: {0})
+
+        Returns:
+            tuple -- (i, j) arrays of player indices, i[g] plays against j[g]
+        """
+        candidates = self.order if queued is None else self.order[queued[self.order]]
+        candidates = candidates[shift:]
+        nb_games = len(candidates) // 2
+        return candidates[0 : 2 * nb_games : 2], candidates[1 : 2 * nb_games : 2]
+
+
+def play_round(players, i, j, rng, divider):
+    """Plays the games (i[g], j[g]) and updates the elo ratings in place. No player may appear twice.
+
+    Same rules as Player.play_and_update: i wins if a draw between 0 and PRECISION is lower than
+    PRECISION * skill_i / (skill_i + skill_j).
+
+    Returns:
+        np.ndarray -- Result of each game for i (1 for a win, 0 for a loss)
+    """
+    skill_i = players.skill[i]
+    proba_of_wining = skill_i / (skill_i + players.skill[j])
+    rand = rng.integers(0, array_engine.PRECISION + 1, size=len(i), dtype=np.int32)
+    results = (rand < array_engine.PRECISION * proba_of_wining).astype(float)
+    elo = players.elo
+    expected = expected_scores(elo[i] - elo[j], divider)
+    delta_points = players.k_factor[i] * (results - expected)
+    elo[i] += delta_points
+    elo[j] -= delta_points
+    return results
+
+
+def simulate_matchmaking(
+    skills,
+    nb_rounds,
+    rng,
+    nb_placement_rounds=10,
+    activity=1.0,
+    divider=400,
+    starting_elo=1200,
+    k_factor_placements=100,
+    k_factor=25,
+    resolution=1.0,
+    on_round=None,
+):
+    """Simulates a ladder where each round pairs the players looking for a game by elo.
+
+    Arguments:
+        skills {np.ndarray} -- Skill of each player, see draw_skills
+        nb_rounds {int} -- Number of rounds, including the placement rounds
+        rng {np.random.Generator} -- Source of randomness
+
+    Keyword Arguments:
+        nb_placement_rounds {int} -- Number of rounds played by each player with k_factor_placements before
+        switching to k_factor. The rounds a player doesn't play don't count (default: {10})
+        activity {float} -- Probability that a player looks for a game in a given round (default: {1.0})
+        resolution {float} -- Width of the elo buckets of the rating index (default: {1.0})
+        on_round {function} -- Called after each round with (round, players, index) (default: {None})
+
+    Returns:
+        dict -- "players" (array_engine.ArrayPlayers), "rank_correlation" (Spearman correlation between the elo
+        buckets and the skills after each round, 1 when the ladder is perfectly sorted), "mean_elo_gap" (mean elo
+        difference between opponents in each round), "nb_games" (per round) and "durations" (seconds per round)
+    """
+    skills = np.asarray(skills, dtype=float)
+    nb_players = len(skills)
+    players = array_engine.ArrayPlayers([], skills, starting_elo, k_factor_placements)
+    games_played = np.zeros(nb_players, dtype=np.int32)
+    index = RatingIndex(players.elo, rng, resolution)
+    # Ranks of the skills, centered for the correlation
+    skill_ranks = np.empty(nb_players)
+    skill_ranks[np.argsort(skills, kind="stable")] = np.arange(nb_players)
+    skill_ranks -= skill_ranks.mean()
+    rank_norm = np.sqrt(np.dot(skill_ranks, skill_ranks))
+
+    rank_correlation = np.empty(nb_rounds)
+    mean_elo_gap = np.empty(nb_rounds)
+    nb_games = np.empty(nb_rounds, dtype=np.int64)
+    durations = np.empty(nb_rounds)
+    for r in range(nb_rounds):
+        start = time.perf_counter()
+        queued = None if activity >= 1 else rng.random(nb_players) < activity
+        i, j = index.pair(queued, shift=r % 2)
+        mean_elo_gap[r] = (
+            np.abs(players.elo[i] - players.elo[j]).mean() if len(i) else 0
+        )
+        play_round(players, i, j, rng, divider)
+        games_played[i] += 1
+        games_played[j] += 1
+        players.k_factor[games_played == nb_placement_rounds] = k_factor
+        index.update(players.elo)
+        elo_ranks = index.ranks() - (nb_players - 1) / 2.0
+        rank_correlation[r] = np.dot(elo_ranks, skill_ranks) / rank_norm**2
+        nb_games[r] = len(i)
+        durations[r] = time.perf_counter() - start
+        if on_round is not None:
+            on_round(r, players, index)
+    return {
+        "players": players,
+        "rank_correlation": rank_correlation,
+        "mean_elo_gap": mean_elo_gap,
+        "nb_games": nb_games,
+        "durations": durations,
+    }
+
+
+def plot_matchmaking(skills, stats, max_points=20000, rng=None):
+    """Plots the final elo vs the skill of (a sample of) the players and the rank correlation over the rounds"""
+    import matplotlib.pyplot as plt
+
+    if rng is None:
+        rng = np.random.default_rng()
+    elo = stats["players"].elo
+    shown = np.arange(len(skills))
+    if len(shown) > max_points:
+        shown = rng.choice(len(skills), max_points, replace=False)
+    figure, (left, right) = plt.subplots(1, 2, figsize=(16, 7))
+    left.scatter(skills[shown], elo[shown], s=2, alpha=0.3)
+    left.set_xlabel("Skill")
+    left.set_ylabel("Final elo")
+    left.set_title("{} of the {} players".format(len(shown), len(skills)))
+    left.grid()
+    right.plot(
+        np.arange(1, len(stats["rank_correlation"]) + 1), stats["rank_correlation"]
+    )
+    right.set_xlabel("Rounds")
+    right.set_ylabel("Rank correlation between elo and skill")
+    right.grid()
+    plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulates a ladder of many players where each round pairs the players by elo"
+    )
+    parser.add_argument("nb_players", type=int, help="Number of players to create")
+    parser.add_argument("nb_rounds", type=int, help="Number of rounds to play")
+    parser.add_argument(
+        "--placement-rounds",
+        type=int,
+        default=10,
+        help="Number of games played by each player with the placement K factor",
+    )
+    parser.add_argument(
+        "--activity",
+        type=float,
+        default=1.0,
+        help="Probability that a player looks for a game in a given round",
+    )
+    parser.add_argument(
+        "--distribution",
+        choices=SKILL_DISTRIBUTIONS,
+        default="normal",
+        help="Distribution of the skills",
+    )
+    parser.add_argument(
+        "--min-skill", type=float, default=10, help="ladder and uniform distributions"
+    )
+    parser.add_argument(
+        "--delta-skill",
+        type=float,
+        default=1,
+        help="ladder and uniform distributions",
+    )
+    parser.add_argument(
+        "--skill-mean",
+        type=float,
+        default=100,
+        help="normal and lognormal distributions",
+    )
+    parser.add_argument(
+        "--skill-std", type=float, default=20, help="normal and lognormal distributions"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--tiers",
+        action="store_true",
+        help="Follows the players in a leaderboard and prints the population and the floor elo of each tier of elo_hell.py",
+    )
+    parser.add_argument(
+        "--plot",
+        action="store_true",
+        help="Plots the final elo vs the skill and the rank correlation over the rounds",
+    )
+    args = parser.parse_args()
+    if args.nb_players < 2:
+        print("At least 2 players are needed")
+        sys.exit()
+
+    import simulation
+
+    rng = np.random.default_rng(args.seed)
+    skills = draw_skills(
+        args.nb_players,
+        args.distribution,
+        rng,
+        min_skill=args.min_skill,
+        delta_skill=args.delta_skill,
+        mean=args.skill_mean,
+        std=args.skill_std,
+    )
+    board = None
+    on_round = None
+    if args.tiers:
+        from leaderboard import Leaderboard
+
+        board = Leaderboard(np.full(args.nb_players, float(simulation.STARTING_ELO)))
+        leaderboard_time = [0.0]
+
+        def on_round(r, players, index):
+            start = time.perf_counter()
+            board.update(players.elo)
+            leaderboard_time[0] += time.perf_counter() - start
+
+    stats = simulate_matchmaking(
+        skills,
+        args.nb_rounds,
+        rng,
+        nb_placement_rounds=args.placement_rounds,
+        activity=args.activity,
+        divider=simulation.DIVIDER,
+        starting_elo=simulation.STARTING_ELO,
+        k_factor_placements=simulation.K_FACTOR_PLACEMENTS,
+        k_factor=simulation.K_FACTOR,
+        on_round=on_round,
+    )
+    for r in sorted(set([0, args.placement_rounds - 1, args.nb_rounds - 1])):
+        if 0 <= r < args.nb_rounds:
+            print(
+                "Round {}: {} games, mean elo gap between opponents {:.1f}, rank correlation elo/skill {:.4f}".format(
+                    r + 1,
+                    stats["nb_games"][r],
+                    stats["mean_elo_gap"][r],
+                    stats["rank_correlation"][r],
+                )
+            )
+    total = stats["durations"].sum()
+    print(
+        "{} games in {:.3f}s ({:.0f} games/s, {:.1f} ms per round)".format(
+            stats["nb_games"].sum(),
+            total,
+            stats["nb_games"].sum() / max(total, 1e-9),
+            1000 * total / args.nb_rounds,
+        )
+    )
+    if board is not None:
+        print(
+            "Leaderboard kept up to date in {:.1f} ms per round".format(
+                1000 * leaderboard_time[0] / args.nb_rounds
+            )
+        )
+        for name, floor, count in reversed(board.tiers()):
+            print(
+                "{:<13} from {:>7.0f} elo: {:>8} players ({:.3f}%)".format(
+                    name, floor, count, 100.0 * count / args.nb_players
+                )
+            )
+    if args.plot:
+        plot_matchmaking(skills, stats, rng=rng)
+
+
+if __name__ == "__main__":
+    main()
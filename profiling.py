@@ -0,0 +1,435 @@
+"""
+Phase timers and counters for --profile: where the time of a run goes (random draws, expected results, history
+appends, plotting, canvas draws...) and how many games, updates and frames it did.
+
+Nothing in the simulations calls the profiler. instrument() replaces the hot functions (Player.play,
+Player.expected_result, Player.update, RatingHistory.append, the array engine, the frames of live_plot...) by timed
+wrappers and returns a function putting the originals back, so a run without --profile executes exactly the same code
+as before. The coarse phases of elo.py (season, plot, show) use phase(), which does nothing without an active
+profiler.
+
+The phases nest: each one is timed inclusively and exclusively (its own time, without the phases it called), per
+call stack. The report is JSON, and the exclusive times can also be written as folded stacks ("season;play;draw 1234"
+in microseconds), the input of flamegraph.pl and speedscope. The wrappers cost about a microsecond per call, measured
+at start and reported as "overhead_per_call": phases called millions of times look slower than they are.
+"""
+
+import sys
+import json
+import time
+import functools
+import contextlib
+
+# Profiler of the current run, None when not profiling
+_active = None
+
+
+class Profiler(object):
+    """
+    Nested phase timers and counters
+    """
+
+    def __init__(self):
+        # [name, start, time spent in the children] of each running phase
+        self.stack = []
+        # Call stack (tuple of names) -> [calls, inclusive seconds, exclusive seconds]
+        self.phases = {}
+        self.counters = {}
+        self.start = time.perf_counter()
+        self._last_live = (self.start, {})
+        self.overhead_per_call = 0.0
+        self.overhead_per_call = self._calibrate()
+
+    def _calibrate(self, nb_calls=20000):
+        """Returns the time of an empty enter/exit pair, then forgets it"""
+        start = time.perf_counter()
+        for i in range(nb_calls):
+            self.enter("calibration")
+            self.exit()
+        duration = time.perf_counter() - start
+        self.phases.clear()
+        return duration / nb_calls
+
+    def enter(self, name):
+        self.stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        name, start, children = self.stack.pop()
+        duration = time.perf_counter() - start
+        key = tuple(frame[0] for frame in self.stack) + (name,)
+        totals = self.phases.get(key)
+        if totals is None:
+            totals = self.phases[key] = [0, 0.0, 0.0]
+        totals[0] += 1
+        totals[1] += duration
+        totals[2] += duration - children
+        if self.stack:
+            self.stack[-1][2] += duration
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def restart(self, root):
+        """Forgets everything measured so far and times everything that follows under the phase 'root', e.g. in
+        a process forked with a copy of the profiler"""
+        # Cleared in place: the wrappers of instrument() hold these
+        self.phases.clear()
+        self.counters.clear()
+        del self.stack[:]
+        self.enter(root)
+
+    def close(self):
+        """Ends the phases still running"""
+        while self.stack:
+            self.exit()
+
+    def merge(self, phases, counters):
+        """Adds the phases and the counters of another profiler, e.g. of another process"""
+        for key, (calls, inclusive, exclusive) in phases.items():
+            totals = self.phases.setdefault(key, [0, 0.0, 0.0])
+            totals[0] += calls
+            totals[1] += inclusive
+            totals[2] += exclusive
+        for name, value in counters.items():
+            self.count(name, value)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def totals(self):
+        """Returns name -> [calls, inclusive seconds, exclusive seconds] summed over the call stacks. The inclusive
+        time of a phase calling itself is counted once per level"""
+        totals = {}
+        for key, (calls, inclusive, exclusive) in self.phases.items():
+            total = totals.setdefault(key[-1], [0, 0.0, 0.0])
+            total[0] += calls
+            total[1] += inclusive
+            total[2] += exclusive
+        return totals
+
+    def report(self):
+        """Returns the report as JSON serializable data: "wall_seconds", "overhead_per_call", "counters" (with
+        their rate per second of wall time), "phases" (per name) and "stacks" (per call stack)
+        """
+        wall = time.perf_counter() - self.start
+        return {
+            "wall_seconds": wall,
+            "overhead_per_call": self.overhead_per_call,
+            "counters": {
+                name: {"total": value, "per_second": value / wall}
+                for name, value in self.counters.items()
+            },
+            "phases": {
+                name: {
+                    "calls": calls,
+                    "seconds": inclusive,
+                    "self_seconds": exclusive,
+                    "share": exclusive / wall,
+                }
+                for name, (calls, inclusive, exclusive) in sorted(
+                    self.totals().items(), key=lambda item: -item[1][2]
+                )
+            },
+            "stacks": [
+                {
+                    "stack": ";".join(key),
+                    "calls": calls,
+                    "seconds": inclusive,
+                    "self_seconds": exclusive,
+                }
+                for key, (calls, inclusive, exclusive) in self.phases.items()
+            ],
+        }
+
+    def folded(self):
+        """Returns the exclusive times as folded stacks in microseconds, one stack per line"""
+        return "".join(
+            "{} {}\n".format(";".join(key), int(round(exclusive * 1e6)))
+            for key, (calls, inclusive, exclusive) in self.phases.items()
+        )
+
+    def write(self, path):
+        """Writes the JSON report to 'path' and the folded stacks next to it, with the .folded extension"""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+        folded_path = (path[:-5] if path.endswith(".json") else path) + ".folded"
+        with open(folded_path, "w") as f:
+            f.write(self.folded())
+        return folded_path
+
+    def summary(self):
+        """Returns the report as a table, the phases sorted by exclusive time"""
+        report = self.report()
+        lines = [
+            "{:.3f}s of wall time, about {:.2f} us of profiling overhead per call".format(
+                report["wall_seconds"], 1e6 * report["overhead_per_call"]
+            )
+        ]
+        for name, counter in report["counters"].items():
+            lines.append(
+                "{:<24} {:>12} ({:.0f}/s)".format(
+                    name, counter["total"], counter["per_second"]
+                )
+            )
+        lines.append(
+            "{:<24} {:>10} {:>10} {:>10} {:>7}".format(
+                "phase", "calls", "total (s)", "self (s)", "self %"
+            )
+        )
+        for name, phase in report["phases"].items():
+            lines.append(
+                "{:<24} {:>10} {:>10.3f} {:>10.3f} {:>6.1f}%".format(
+                    name,
+                    phase["calls"],
+                    phase["seconds"],
+                    phase["self_seconds"],
+                    100 * phase["share"],
+                )
+            )
+        return "\n".join(lines)
+
+    def print_live(self, interval=1.0, file=sys.stderr):
+        """Prints the rate of every counter since the previous line, at most once every 'interval' seconds, on a
+        single line that is rewritten"""
+        now = time.perf_counter()
+        last_time, last_counters = self._last_live
+        if now - last_time < interval:
+            return
+        elapsed = now - last_time
+        rates = [
+            "{} {:.0f}/s".format(name, (value - last_counters.get(name, 0)) / elapsed)
+            for name, value in self.counters.items()
+        ]
+        draw = self.totals().get("frame draw")
+        if draw is not None and draw[0]:
+            rates.append("{:.1f} ms/frame".format(1000 * draw[1] / draw[0]))
+        print("\r" + ", ".join(rates) + "   ", end="", file=file, flush=True)
+        self._last_live = (now, dict(self.counters))
+
+
+def active():
+    """Returns the profiler of the current run, None when not profiling"""
+    return _active
+
+
+def phase(name):
+    """Times a coarse phase with the active profiler, does nothing without one"""
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.phase(name)
+
+
+def _timed(profiler, name, function, counter=None):
+    enter = profiler.enter
+    exit = profiler.exit
+    counters = profiler.counters
+
+    if counter is None:
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            enter(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                exit()
+
+    else:
+
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            counters[counter] = counters.get(counter, 0) + 1
+            enter(name)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                exit()
+
+    return timed
+
+
+def _timed_journeys(profiler, function):
+    """play_journeys, counting the games it played (it can stop before 'nb_journeys')"""
+
+    @functools.wraps(function)
+    def timed(
+        players, schedule, nb_journeys, rng, divider, history, start=0, *args, **kwargs
+    ):
+        profiler.enter("play_journeys")
+        try:
+            end = function(
+                players,
+                schedule,
+                nb_journeys,
+                rng,
+                divider,
+                history,
+                start,
+                *args,
+                **kwargs
+            )
+        finally:
+            profiler.exit()
+        profiler.count("games", (end - start) // (len(players) - 1) * schedule.nb_games)
+        return end
+
+    return timed
+
+
+def _timed_kernel_journeys(profiler, function):
+    """play_kernel_journeys, counting the games it played"""
+
+    @functools.wraps(function)
+    def timed(
+        kernel,
+        state,
+        skills,
+        schedule,
+        nb_journeys,
+        rng,
+        history=None,
+        start=0,
+        *args,
+        **kwargs
+    ):
+        profiler.enter("play_kernel_journeys")
+        try:
+            end = function(
+                kernel,
+                state,
+                skills,
+                schedule,
+                nb_journeys,
+                rng,
+                history,
+                start,
+                *args,
+                **kwargs
+            )
+        finally:
+            profiler.exit()
+        profiler.count("games", (end - start) // (len(skills) - 1) * schedule.nb_games)
+        return end
+
+    return timed
+
+
+def _timed_elohell(profiler, function):
+    @functools.wraps(function)
+    def timed(nb_players, nb_placement, nb_games, *args, **kwargs):
+        with profiler.phase("simulate_elohell"):
+            result = function(nb_players, nb_placement, nb_games, *args, **kwargs)
+        profiler.count("games", nb_players * nb_games)
+        return result
+
+    return timed
+
+
+def instrument(profiler):
+    """Makes 'profiler' the active profiler and replaces the hot functions by timed wrappers.
+
+    Returns:
+        function -- Puts the original functions back and deactivates the profiler
+    """
+    global _active
+    import simulation
+    import array_engine
+    import history
+    import convergence
+    import live_plot
+    import rating_kernels
+
+    replaced = []
+
+    def replace(owner, attribute, wrapper):
+        replaced.append((owner, attribute, owner.__dict__[attribute]))
+        setattr(owner, attribute, wrapper)
+
+    Player = simulation.Player
+    replace(Player, "play", _timed(profiler, "play", Player.play, counter="games"))
+    replace(
+        Player,
+        "play_forced_winrate",
+        _timed(profiler, "play", Player.play_forced_winrate, counter="games"),
+    )
+    replace(
+        Player,
+        "play_and_update",
+        _timed(profiler, "play_and_update", Player.play_and_update),
+    )
+    replace(
+        Player,
+        "expected_result",
+        _timed(profiler, "expected_result", Player.expected_result),
+    )
+    replace(
+        Player, "update", _timed(profiler, "update", Player.update, counter="updates")
+    )
+    replace(simulation, "draw", _timed(profiler, "rng draw", simulation.draw))
+    replace(
+        history.RatingHistory,
+        "append",
+        _timed(profiler, "history append", history.RatingHistory.append),
+    )
+    replace(
+        array_engine,
+        "play_journeys",
+        _timed_journeys(profiler, array_engine.play_journeys),
+    )
+    replace(
+        array_engine,
+        "play_kernel_journeys",
+        _timed_kernel_journeys(profiler, array_engine.play_kernel_journeys),
+    )
+    replace(
+        rating_kernels.RatingKernel,
+        "update",
+        _timed(profiler, "kernel update", rating_kernels.RatingKernel.update),
+    )
+    replace(
+        array_engine,
+        "simulate_elohell",
+        _timed_elohell(profiler, array_engine.simulate_elohell),
+    )
+    replace(
+        array_engine,
+        "expected_scores",
+        _timed(profiler, "expected_scores", array_engine.expected_scores),
+    )
+    replace(
+        convergence.ConvergenceTracker,
+        "update",
+        _timed(profiler, "convergence", convergence.ConvergenceTracker.update),
+    )
+    replace(
+        live_plot.LiveRenderer,
+        "append",
+        _timed(profiler, "frame append", live_plot.LiveRenderer.append),
+    )
+    replace(
+        live_plot.LiveRenderer,
+        "draw",
+        _timed(profiler, "frame draw", live_plot.LiveRenderer.draw, counter="frames"),
+    )
+    _active = profiler
+
+    def restore():
+        global _active
+        for owner, attribute, original in reversed(replaced):
+            setattr(owner, attribute, original)
+        _active = None
+
+    return restore
+
+
+def watch_canvas(canvas):
+    """Times the full draws of a matplotlib canvas ("canvas.draw") with the active profiler, if any"""
+    if _active is not None and "draw" not in canvas.__dict__:
+        canvas.draw = _timed(
+            _active, "canvas.draw", canvas.draw, counter="canvas draws"
+        )
@@ -0,0 +1,111 @@
+"""
+Streaming quantiles of many independent streams at once, in a fixed amount of memory.
+
+P2Quantiles keeps the P² estimates (Jain and Chlamtac, "The P² algorithm for dynamic calculation of quantiles and
+histograms without storing observations", 1985) of a few quantiles for every element of an array: e.g. the elo of every
+player at every journey, one observation per simulated season. Each quantile of each stream is tracked by 5 markers
+(their heights and positions) moved after every observation with a parabolic interpolation, so the memory only
+depends on the number of streams and quantiles, never on the number of observations. The updates are array
+operations over all the streams.
+
+The estimates are exact up to 5 observations. After a few thousand, the central quantiles are typically within a
+hundredth of a standard deviation of the exact ones, while the tails (5%, 95%) converge more slowly and can stay off
+by about a tenth of a standard deviation.
+"""
+
+import numpy as np
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class P2Quantiles(object):
+    """
+    P² estimates of several quantiles of every element of an array of streams
+    """
+
+    def __init__(self, shape, percentiles=PERCENTILES):
+        """
+        Arguments:
+            shape {tuple} -- Shape of the array of streams, one observation per stream at a time
+
+        Keyword Arguments:
+            percentiles {tuple} -- Percentiles to estimate, between 0 and 100 (default: {PERCENTILES})
+        """
+        self.shape = tuple(shape)
+        self.percentiles = tuple(percentiles)
+        p = np.array(self.percentiles, dtype=float) / 100
+        # Growth of the desired positions of the 5 markers per observation, for each percentile
+        increments = np.stack(
+            [np.zeros_like(p), p / 2, p, (1 + p) / 2, np.ones_like(p)], axis=-1
+        )
+        self.increments = increments.reshape((len(p),) + (1,) * len(self.shape) + (5,))
+        # Heights and positions (1 for the lowest observation) of the markers: percentiles x streams x 5
+        self.heights = np.empty((len(p),) + self.shape + (5,))
+        self.positions = np.empty((len(p),) + self.shape + (5,))
+        # The first 5 observations, kept until the markers can be placed
+        self.first = np.empty((5,) + self.shape)
+        self.count = 0
+
+    def add(self, values):
+        """Adds one observation to every stream.
+
+        Arguments:
+            values {np.ndarray} -- Array of the shape of the streams
+        """
+        values = np.asarray(values, dtype=float)
+        if self.count < 5:
+            self.first[self.count] = values
+            self.count += 1
+            if self.count == 5:
+                self.heights[:] = np.moveaxis(np.sort(self.first, axis=0), 0, -1)
+                self.positions[:] = np.arange(1, 6)
+            return
+        q = self.heights
+        n = self.positions
+        x = values[np.newaxis]
+        np.minimum(q[..., 0], x, out=q[..., 0])
+        np.maximum(q[..., 4], x, out=q[..., 4])
+        # Every marker above the new observation moves one position up
+        n[..., 1:4] += x[..., np.newaxis] < q[..., 1:4]
+        n[..., 4] += 1
+        self.count += 1
+        desired = 1 + (self.count - 1) * self.increments
+        for i in (1, 2, 3):
+            qi = q[..., i]
+            ni = n[..., i]
+            d = desired[..., i] - ni
+            up = (d >= 1) & (n[..., i + 1] - ni > 1)
+            down = (d <= -1) & (n[..., i - 1] - ni < -1)
+            move = up | down
+            if not move.any():
+                continue
+            step = np.where(up, 1.0, -1.0)
+            q_below = q[..., i - 1]
+            q_above = q[..., i + 1]
+            n_below = n[..., i - 1]
+            n_above = n[..., i + 1]
+            parabolic = qi + step / (n_above - n_below) * (
+                (ni - n_below + step) * (q_above - qi) / (n_above - ni)
+                + (n_above - ni - step) * (qi - q_below) / (ni - n_below)
+            )
+            # When the parabola would break the order of the markers
+            linear = qi + step * (np.where(up, q_above, q_below) - qi) / (
+                np.where(up, n_above, n_below) - ni
+            )
+            ordered = (q_below < parabolic) & (parabolic < q_above)
+            q[..., i] = np.where(move, np.where(ordered, parabolic, linear), qi)
+            n[..., i] = ni + np.where(move, step, 0.0)
+
+    def add_batch(self, values):
+        """Adds the observations values[0], values[1]... one after the other"""
+        for observation in values:
+            self.add(observation)
+
+    def quantiles(self):
+        """Returns the estimates as a (percentiles x streams) array, NaN before the first observation"""
+        if self.count == 0:
+            return np.full((len(self.percentiles),) + self.shape, np.nan)
+        if self.count <= 5:
+            # The markers only hold the 5 observations, not their percentiles
+            return np.percentile(self.first[: self.count], self.percentiles, axis=0)
+        return self.heights[..., 2].copy()
@@ -0,0 +1,575 @@
+"""
+Rating systems as array operations on batches of games, so that Elo, Glicko-2 and a TrueSkill-style system all run at
+vectorized speed in the same drivers: array_engine.play_kernel_journeys for the round-robin seasons of elo.py
+(--kernel) and replay.KernelRatings for real match logs (replay.py --kernel).
+
+A kernel keeps the state of the players in a dict of arrays (new_state) and updates it in place from a batch of games
+given as arrays: the first players, the second players and the results of the first players (1 for a win, 0 for a
+loss, 0.5 for a draw). The games of a batch must not share any player: the drivers group the games in such levels
+(array_engine.conflict_free_levels), which gives the same ratings as applying the games one by one.
+
+EloKernel is the update of Player.update with a schedule of K factors by number of games played: with the K factors
+of elo.py it gives exactly the histories of the numpy engine. Glicko2Kernel and TrueSkillKernel treat every game as
+its own rating period, the usual choice for online play: a player's deviation grows before each game, not with the
+time spent without playing.
+
+python rating_kernels.py compares the kernels side by side on the same games: throughput in both drivers, rank
+correlation between the final ratings and the skills, and how well each kernel predicted the games before playing them.
+"""
+
+import math
+import time
+import argparse
+import statistics
+import numpy as np
+from expected_score import expected_scores
+
+# Glicko-2 ratings are stored on the Glicko scale divided by this, 400 / ln(10)
+GLICKO2_SCALE = 173.7178
+
+
+class RatingKernel(object):
+    """
+    Base class of the rating kernels
+    """
+
+    name = None
+
+    def initial_values(self):
+        """Returns the value of a new player in each array of the state: name -> number"""
+        raise NotImplementedError
+
+    def new_state(self, nb_players):
+        """Returns the state of 'nb_players' new players, a dict of arrays. "nb_games" counts the games of each
+        player in every kernel"""
+        values = dict(self.initial_values(), nb_games=np.int64(0))
+        return {
+            name: np.full(nb_players, value, dtype=np.asarray(value).dtype)
+            for name, value in values.items()
+        }
+
+    def grow(self, state, nb_players):
+        """Returns the state with new players added at the end until it holds 'nb_players' players"""
+        new = self.new_state(nb_players - len(state["nb_games"]))
+        return {name: np.concatenate((state[name], new[name])) for name in state}
+
+    def ratings(self, state, players=slice(None)):
+        """Returns the displayed ratings of 'players' (all of them by default)"""
+        raise NotImplementedError
+
+    def expected(self, state, i, j):
+        """Returns the expected results of the players 'i' against the players 'j' (arrays of indices)"""
+        raise NotImplementedError
+
+    def _update(self, state, i, j, results):
+        raise NotImplementedError
+
+    def update(self, state, i, j, results):
+        """Applies a batch of games, in place.
+
+        Arguments:
+            state {dict} -- State of the players, see new_state
+            i {np.ndarray} -- Indices of the first players
+            j {np.ndarray} -- Indices of the second players, no player appears twice in 'i' and 'j'
+            results {np.ndarray} -- Results of the first players
+        """
+        self._update(state, i, j, results)
+        nb_games = state["nb_games"]
+        nb_games[i] += 1
+        nb_games[j] += 1
+
+
+class EloKernel(RatingKernel):
+    """
+    Elo ratings with a K factor depending on the number of games played, like the placement games of elo.py
+    """
+
+    name = "elo"
+
+    def __init__(self, stages=((0, 25.0),), divider=400, starting_elo=1200, exact=True):
+        """
+        Keyword Arguments:
+            stages {list} -- (first game, K factor) pairs sorted by first game, the first one starting at 0. A
+            player uses the K factor of the last stage they reached (default: {((0, 25.0),)})
+            divider {float} -- Elo divider (default: {400})
+            starting_elo {float} -- Elo of a new player (default: {1200})
+            exact {bool} -- Computes the expected results with the rounding of Player.expected_result, bit for bit
+            the same ratings as the Player path, instead of numpy's faster power (default: {True})
+        """
+        self.stage_starts = np.array([first for first, k in stages], dtype=np.int64)
+        self.stage_k_factors = np.array([k for first, k in stages], dtype=float)
+        if len(stages) == 0 or self.stage_starts[0] != 0:
+            raise ValueError(
+                "the first stage must start at game 0, got {}".format(stages)
+            )
+        self.divider = divider
+        self.starting_elo = float(starting_elo)
+        self.exact = exact
+
+    def initial_values(self):
+        return {"elo": self.starting_elo}
+
+    def ratings(self, state, players=slice(None)):
+        return state["elo"][players]
+
+    def k_factors(self, nb_games):
+        """Returns the K factors of players having played 'nb_games' games"""
+        if len(self.stage_k_factors) == 1:
+            return self.stage_k_factors[0]
+        stage = np.searchsorted(self.stage_starts, nb_games, side="right") - 1
+        return self.stage_k_factors[stage]
+
+    def expected(self, state, i, j):
+        elo = state["elo"]
+        return expected_scores(elo[i] - elo[j], self.divider, exact=self.exact)
+
+    def _update(self, state, i, j, results):
+        elo = state["elo"]
+        nb_games = state["nb_games"]
+        # Same operations as Player.update, each player with their own K factor
+        delta = results - self.expected(state, i, j)
+        elo[i] = elo[i] + self.k_factors(nb_games[i]) * delta
+        elo[j] = elo[j] - self.k_factors(nb_games[j]) * delta
+
+
+def _g(phi):
+    return 1 / np.sqrt(1 + 3 * phi**2 / math.pi**2)
+
+
+class Glicko2Kernel(RatingKernel):
+    """
+    Glicko-2 ratings (Glickman, "Example of the Glicko-2 system"), one rating period per game
+    """
+
+    name = "glicko2"
+
+    def __init__(
+        self,
+        starting_rating=1500,
+        starting_deviation=350,
+        starting_volatility=0.06,
+        tau=0.5,
+        epsilon=1e-6,
+    ):
+        """
+        Keyword Arguments:
+            starting_rating {float} -- Rating of a new player (default: {1500})
+            starting_deviation {float} -- Rating deviation of a new player (default: {350})
+            starting_volatility {float} -- Volatility of a new player (default: {0.06})
+            tau {float} -- Constrains the changes of volatility, between 0.3 and 1.2 (default: {0.5})
+            epsilon {float} -- Tolerance of the volatility iteration (default: {1e-6})
+        """
+        self.starting_rating = float(starting_rating)
+        self.starting_deviation = float(starting_deviation)
+        self.starting_volatility = float(starting_volatility)
+        self.tau = tau
+        self.epsilon = epsilon
+
+    def initial_values(self):
+        # mu is relative to the starting rating, only the differences matter
+        return {
+            "mu": 0.0,
+            "phi": self.starting_deviation / GLICKO2_SCALE,
+            "sigma": self.starting_volatility,
+        }
+
+    def ratings(self, state, players=slice(None)):
+        return self.starting_rating + GLICKO2_SCALE * state["mu"][players]
+
+    def deviations(self, state, players=slice(None)):
+        """Returns the rating deviations of 'players' on the Glicko scale"""
+        return GLICKO2_SCALE * state["phi"][players]
+
+    def expected(self, state, i, j):
+        mu = state["mu"]
+        phi = state["phi"]
+        # Both deviations widen the expected result
+        g = _g(np.sqrt(phi[i] ** 2 + phi[j] ** 2))
+        return 1 / (1 + np.exp(-g * (mu[i] - mu[j])))
+
+    def _volatility(self, phi, sigma, v, delta):
+        """Step 5 of Glickman's paper for arrays: the new volatilities by the Illinois algorithm"""
+        a = np.log(sigma**2)
+        tau = self.tau
+        delta2 = delta**2
+        base = phi**2 + v
+
+        def f(x):
+            ex = np.exp(x)
+            return ex * (delta2 - base - ex) / (2 * (base + ex) ** 2) - (x - a) / tau**2
+
+        low = delta2 <= base
+        B = np.where(low, a - tau, np.log(np.where(low, 1.0, delta2 - base)))
+        below = low & (f(B) < 0)
+        while below.any():
+            B[below] -= tau
+            below &= f(B) < 0
+        A = a
+        fA = f(A)
+        fB = f(B)
+        active = np.abs(B - A) > self.epsilon
+        for iteration in range(100):
+            if not active.any():
+                break
+            with np.errstate(divide="ignore", invalid="ignore"):
+                C = A + (A - B) * fA / (fB - fA)
+            fC = f(C)
+            swap = active & (fC * fB <= 0)
+            halve = active & ~swap
+            A = np.where(swap, B, A)
+            fA = np.where(swap, fB, np.where(halve, fA / 2, fA))
+            B = np.where(active, C, B)
+            fB = np.where(active, fC, fB)
+            active &= np.abs(B - A) > self.epsilon
+        return np.exp(A / 2)
+
+    def _update(self, state, i, j, results):
+        mu = state["mu"]
+        phi = state["phi"]
+        sigma = state["sigma"]
+        # Both sides of every game at once, from the ratings before the game
+        players = np.concatenate((i, j))
+        opponents = np.concatenate((j, i))
+        scores = np.concatenate((results, 1 - results))
+        mu_p = mu[players]
+        phi_p = phi[players]
+        g = _g(phi[opponents])
+        expected = 1 / (1 + np.exp(-g * (mu_p - mu[opponents])))
+        v = 1 / (g**2 * expected * (1 - expected))
+        new_sigma = self._volatility(
+            phi_p, sigma[players], v, v * g * (scores - expected)
+        )
+        new_phi = 1 / np.sqrt(1 / (phi_p**2 + new_sigma**2) + 1 / v)
+        mu[players] = mu_p + new_phi**2 * g * (scores - expected)
+        phi[players] = new_phi
+        sigma[players] = new_sigma
+
+
+def _normal_pdf(x):
+    return np.exp(-0.5 * x**2) * (1 / math.sqrt(2 * math.pi))
+
+
+def _normal_cdf(x):
+    """Standard normal distribution function, with a relative error below 1.2e-7 even far in the tails (erfc of
+    Numerical Recipes, numpy has no erf)"""
+    z = np.abs(x) / math.sqrt(2)
+    t = 1 / (1 + 0.5 * z)
+    poly = -0.82215223 + t * 0.17087277
+    for coefficient in (
+        1.48851587,
+        -1.13520398,
+        0.27886807,
+        -0.18628806,
+        0.09678418,
+        0.37409196,
+        1.00002368,
+        -1.26551223,
+    ):
+        poly = coefficient + t * poly
+    erfc = t * np.exp(-z * z + poly)
+    return np.where(x >= 0, 1 - 0.5 * erfc, 0.5 * erfc)
+
+
+class TrueSkillKernel(RatingKernel):
+    """
+    TrueSkill-style ratings for one against one games (Herbrich et al., the Gaussian updates of a single match with a
+    draw margin), one rating period per game
+    """
+
+    name = "trueskill"
+
+    def __init__(
+        self,
+        mu=25.0,
+        sigma=25.0 / 3,
+        beta=25.0 / 6,
+        tau=25.0 / 300,
+        draw_probability=0.1,
+    ):
+        """
+        Keyword Arguments:
+            mu {float} -- Mean skill of a new player (default: {25.0})
+            sigma {float} -- Standard deviation of the skill of a new player (default: {25.0 / 3})
+            beta {float} -- Standard deviation of the performance of a player in a game (default: {25.0 / 6})
+            tau {float} -- Added to the standard deviation of the players before each game, so they can still move
+            (default: {25.0 / 300})
+            draw_probability {float} -- Probability of a draw between equal players, sets the draw margin
+            (default: {0.1})
+        """
+        self.mu = float(mu)
+        self.sigma = float(sigma)
+        self.beta = beta
+        self.tau = tau
+        self.draw_margin = (
+            statistics.NormalDist().inv_cdf((draw_probability + 1) / 2)
+            * math.sqrt(2)
+            * beta
+        )
+
+    def initial_values(self):
+        return {"mu": self.mu, "variance": self.sigma**2}
+
+    def ratings(self, state, players=slice(None)):
+        """Returns the mean skills of 'players', mu - 3 sigma is the usual conservative rating"""
+        return state["mu"][players]
+
+    def expected(self, state, i, j):
+        mu = state["mu"]
+        variance = state["variance"]
+        c = np.sqrt(2 * self.beta**2 + variance[i] + variance[j])
+        difference = mu[i] - mu[j]
+        # P(win) + P(draw) / 2
+        return 0.5 * (
+            _normal_cdf((difference - self.draw_margin) / c)
+            + _normal_cdf((difference + self.draw_margin) / c)
+        )
+
+    def _update(self, state, i, j, results):
+        mu = state["mu"]
+        variance = state["variance"]
+        variance_i = variance[i] + self.tau**2
+        variance_j = variance[j] + self.tau**2
+        c = np.sqrt(2 * self.beta**2 + variance_i + variance_j)
+        # A loss of i is a win of j: the updates are the same with the difference of means negated
+        sign = np.where(results >= 0.5, 1.0, -1.0)
+        t = sign * (mu[i] - mu[j]) / c
+        e = self.draw_margin / c
+        cdf = _normal_cdf(t - e)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            v = np.where(cdf > 1e-300, _normal_pdf(t - e) / cdf, e - t)
+        w = v * (v + t - e)
+        draws = results == 0.5
+        if draws.any():
+            td = t[draws]
+            ed = e[draws]
+            probability = _normal_cdf(ed - td) - _normal_cdf(-ed - td)
+            v[draws] = (_normal_pdf(-ed - td) - _normal_pdf(ed - td)) / probability
+            w[draws] = (
+                v[draws] ** 2
+                + ((ed - td) * _normal_pdf(ed - td) + (ed + td) * _normal_pdf(ed + td))
+                / probability
+            )
+        mu[i] = mu[i] + sign * variance_i / c * v
+        mu[j] = mu[j] - sign * variance_j / c * v
+        variance[i] = variance_i * (1 - variance_i / c**2 * w)
+        variance[j] = variance_j * (1 - variance_j / c**2 * w)
+
+
+KERNELS = {
+    kernel.name: kernel for kernel in (EloKernel, Glicko2Kernel, TrueSkillKernel)
+}
+
+
+class PredictionScore(object):
+    """
+    How well the expected results of a kernel predicted the games, accumulated batch by batch
+    """
+
+    def __init__(self):
+        self.nb_games = 0
+        self.brier = 0.0
+        self.log_loss = 0.0
+        self.correct = 0.0
+
+    def add(self, expected, results):
+        """Adds a batch of games, 'expected' being computed before the games were applied"""
+        expected = np.clip(expected, 1e-15, 1 - 1e-15)
+        self.nb_games += len(results)
+        self.brier += float(np.sum((expected - results) ** 2))
+        self.log_loss -= float(
+            np.sum(results * np.log(expected) + (1 - results) * np.log(1 - expected))
+        )
+        # Draws and even predictions count for half
+        self.correct += float(
+            np.sum(np.where(expected == 0.5, 0.5, (expected > 0.5) == (results > 0.5)))
+        )
+
+    def report(self):
+        """Returns the mean "brier" score, "log_loss" and "accuracy" (fraction of winners predicted)"""
+        nb_games = max(self.nb_games, 1)
+        return {
+            "brier": self.brier / nb_games,
+            "log_loss": self.log_loss / nb_games,
+            "accuracy": self.correct / nb_games,
+        }
+
+
+def compare_seasons(kernels, skills, nb_journeys, seed=None):
+    """Plays the same round-robin season with every kernel: the results of the games only depend on the skills and
+    the seed, so every kernel sees exactly the same games.
+
+    Arguments:
+        kernels {dict} -- Label -> RatingKernel
+        skills {list} -- Skill of each player
+        nb_journeys {int} -- Number of journeys
+
+    Returns:
+        dict -- Label -> {"games_per_second", "spearman" (final ratings against the skills), "brier", "log_loss",
+        "accuracy", "ratings"}
+    """
+    import array_engine
+    from convergence import spearman
+
+    schedule = array_engine.RoundRobinSchedule(len(skills))
+    nb_games = nb_journeys * schedule.nb_games
+    results = {}
+    for label, kernel in kernels.items():
+        state = kernel.new_state(len(skills))
+        start = time.perf_counter()
+        array_engine.play_kernel_journeys(
+            kernel, state, skills, schedule, nb_journeys, np.random.default_rng(seed)
+        )
+        duration = time.perf_counter() - start
+        # Same games again, predicting each one before applying it
+        scored = kernel.new_state(len(skills))
+        predictions = PredictionScore()
+        array_engine.play_kernel_journeys(
+            kernel,
+            scored,
+            skills,
+            schedule,
+            nb_journeys,
+            np.random.default_rng(seed),
+            predictions=predictions,
+        )
+        ratings = kernel.ratings(state)
+        results[label] = dict(
+            predictions.report(),
+            games_per_second=nb_games / max(duration, 1e-9),
+            spearman=float(spearman(skills, ratings)),
+            ratings=ratings,
+        )
+    return results
+
+
+def random_log(nb_matches, skills, rng):
+    """Returns the matches of a random match log between players of the given skills: (first players, second players,
+    results) as lists, the players being their index"""
+    nb_players = len(skills)
+    skills = np.asarray(skills, dtype=float)
+    first = rng.integers(0, nb_players, size=nb_matches)
+    # Never against themselves
+    second = (first + rng.integers(1, nb_players, size=nb_matches)) % nb_players
+    proba_of_wining = skills[first] / (skills[first] + skills[second])
+    results = (rng.random(nb_matches) < proba_of_wining).astype(float)
+    return first.tolist(), second.tolist(), results.tolist()
+
+
+def compare_replays(kernels, skills, nb_matches, seed=None, chunk_size=100000):
+    """Replays the same random match log with replay.StreamingElo (the scalar loop) and with every kernel in
+    replay.KernelRatings
+
+    Returns:
+        dict -- Label -> {"matches_per_second", "spearman", "ratings"}, "scalar elo" being StreamingElo
+    """
+    import replay
+    from convergence import spearman
+
+    first, second, results = random_log(nb_matches, skills, np.random.default_rng(seed))
+    nb_players = len(skills)
+    ratings = {"scalar elo": replay.StreamingElo()}
+    for label, kernel in kernels.items():
+        ratings[label] = replay.KernelRatings(kernel)
+    comparison = {}
+    for label, rating in ratings.items():
+        # Every player first, so that the dense indices are the players themselves
+        rating.indices(range(nb_players))
+        start = time.perf_counter()
+        for chunk in range(0, nb_matches, chunk_size):
+            end = chunk + chunk_size
+            rating.play(first[chunk:end], second[chunk:end], results[chunk:end])
+        duration = time.perf_counter() - start
+        comparison[label] = {
+            "matches_per_second": nb_matches / max(duration, 1e-9),
+            "spearman": float(spearman(skills, rating.elo)),
+            "ratings": rating.elo,
+        }
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares the rating kernels on the same round-robin season and the same match log"
+    )
+    parser.add_argument("--players", type=int, default=50, help="Players of the season")
+    parser.add_argument("--journeys", type=int, default=20)
+    parser.add_argument(
+        "--log-players", type=int, default=10000, help="Players of the match log"
+    )
+    parser.add_argument("--log-matches", type=int, default=1000000)
+    parser.add_argument(
+        "--distribution",
+        choices=["ladder", "uniform", "normal", "lognormal"],
+        default="normal",
+        help="Distribution of the skills, see matchmaking.draw_skills",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import matchmaking
+    import simulation
+
+    kernels = {
+        "elo": EloKernel(
+            [(0, simulation.K_FACTOR)], simulation.DIVIDER, simulation.STARTING_ELO
+        ),
+        "elo (numpy power)": EloKernel(
+            [(0, simulation.K_FACTOR)],
+            simulation.DIVIDER,
+            simulation.STARTING_ELO,
+            exact=False,
+        ),
+        "glicko2": Glicko2Kernel(),
+        "trueskill": TrueSkillKernel(),
+    }
+    rng = np.random.default_rng(args.seed)
+    skills = matchmaking.draw_skills(args.players, args.distribution, rng)
+    seasons = compare_seasons(kernels, skills, args.journeys, args.seed)
+    print(
+        "Round-robin season, {} players, {} journeys:".format(
+            args.players, args.journeys
+        )
+    )
+    print(
+        "{:<20} {:>12} {:>9} {:>7} {:>9} {:>9}".format(
+            "kernel", "games/s", "spearman", "brier", "log loss", "accuracy"
+        )
+    )
+    for label, result in seasons.items():
+        print(
+            "{:<20} {:>12.0f} {:>9.3f} {:>7.4f} {:>9.4f} {:>9.3f}".format(
+                label,
+                result["games_per_second"],
+                result["spearman"],
+                result["brier"],
+                result["log_loss"],
+                result["accuracy"],
+            )
+        )
+
+    log_skills = matchmaking.draw_skills(args.log_players, args.distribution, rng)
+    replays = compare_replays(kernels, log_skills, args.log_matches, args.seed)
+    print(
+        "\nReplay of {} random matches between {} players:".format(
+            args.log_matches, args.log_players
+        )
+    )
+    print("{:<20} {:>12} {:>9}".format("kernel", "matches/s", "spearman"))
+    for label, result in replays.items():
+        print(
+            "{:<20} {:>12.0f} {:>9.3f}".format(
+                label, result["matches_per_second"], result["spearman"]
+            )
+        )
+    difference = np.max(
+        np.abs(replays["elo"]["ratings"] - replays["scalar elo"]["ratings"])
+    )
+    print(
+        "\nLargest difference between the elo kernel and the scalar loop: {}".format(
+            difference
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
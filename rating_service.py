@@ -0,0 +1,519 @@
+"""
+Local rating service: game servers post the results of their matches and read the ratings over TCP.
+
+The protocol is one JSON object per line, answered by one JSON line, in the order of the requests of the connection
+(a client can send many requests before reading the answers). A connection reads its own writes: a lookup sees every
+result sent before it on the same connection.
+- {"op": "result", "a": id, "b": id, "result": 1} -- result of player a against player b (1, 0 or 0.5), answered
+  {"ok": true} once it is applied. Ids are strings or integers
+- {"op": "rating", "id": id} -- answered {"elo": ..., "games": ...}
+- {"op": "expected", "a": id, "b": id} -- probability of player a beating player b (Player.expected_result),
+  answered {"expected": ...}
+- {"op": "stats"} -- latencies and throughput of the service, see RatingService.stats
+Errors are answered {"error": "..."}.
+
+The results are queued and applied in micro-batches, in the order they arrived, by StreamingElo.play (replay.py):
+the same updates as Player.update, on an array-backed store. A batch is applied once 'batch_size' results are queued
+or 'max_delay' seconds after the first one. A lookup is answered once the answers to the earlier requests of its
+connection are written, from the ratings at that time: it waits for the batch of a result sent just before it, but
+not for anything when its connection has no result pending.
+
+The load generator plays the matches of a ladder of simulated players (skills from matchmaking.draw_skills, results
+from Player.play) and posts them with lookups in between, from several connections.
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+from replay import StreamingElo
+
+DEFAULT_PORT = 8765
+
+
+class LatencyRecorder(object):
+    """
+    Keeps the last 'capacity' latencies and their percentiles
+    """
+
+    def __init__(self, capacity=100000):
+        self.values = np.empty(capacity)
+        self.count = 0
+
+    def add(self, seconds):
+        self.values[self.count % len(self.values)] = seconds
+        self.count += 1
+
+    def percentiles_ms(self, percentiles=(50, 99)):
+        """Returns the percentiles in milliseconds, None if nothing was recorded"""
+        count = min(self.count, len(self.values))
+        if count == 0:
+            return [None] * len(percentiles)
+        return (np.percentile(self.values[:count], percentiles) * 1000).tolist()
+
+
+def _bad_request(error):
+    return {"error": "bad request: {!r}".format(error)}
+
+
+def _player_id(value):
+    """Returns 'value' if it can be the id of a player (a string or an integer), raises TypeError otherwise"""
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise TypeError(
+            "a player id must be a string or an integer, got {!r}".format(value)
+        )
+    return value
+
+
+class RatingService(object):
+    """
+    Queues the results posted by the clients, applies them in micro-batches and answers the lookups
+    """
+
+    def __init__(self, ratings=None, batch_size=1024, max_delay=0.002):
+        """
+        Keyword Arguments:
+            ratings {StreamingElo} -- Ratings to serve and update, new default ones if None (default: {None})
+            batch_size {int} -- A batch is applied as soon as this many results are queued (default: {1024})
+            max_delay {float} -- Maximum time in seconds a result waits for its batch (default: {0.002})
+        """
+        if ratings is None:
+            ratings = StreamingElo()
+        self.ratings = ratings
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        # (player a, player b, result, future) of the results waiting for the next batch
+        self.pending = []
+        self._flush_handle = None
+        self.result_latency = LatencyRecorder()
+        self.lookup_latency = LatencyRecorder()
+        self.nb_updates = 0
+        self.nb_lookups = 0
+        self.nb_batches = 0
+        self.nb_connections = 0
+        self.first_batch = None
+        self.last_batch = None
+
+    def submit(self, player_a, player_b, result):
+        """Queues a result and returns a future set once it is applied"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((player_a, player_b, result, future))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_delay, self.flush)
+        return future
+
+    def flush(self):
+        """Applies the queued results as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        player_a, player_b, results, futures = zip(*batch)
+        try:
+            self.ratings.play(player_a, player_b, results)
+        except Exception as error:
+            # The ratings are left as they were: every result of the batch is answered with the error
+            for future in futures:
+                if not future.done():
+                    future.set_result({"error": "batch failed: {!r}".format(error)})
+            return
+        now = time.perf_counter()
+        if self.first_batch is None:
+            self.first_batch = now
+        self.last_batch = now
+        self.nb_batches += 1
+        self.nb_updates += len(batch)
+        for future in futures:
+            if not future.done():
+                future.set_result({"ok": True})
+
+    def lookup(self, request):
+        """Answers a request that isn't a result, from the ratings of the results applied so far"""
+        try:
+            op = request.get("op")
+            if op == "rating":
+                elo, nb_games = self.ratings.rating(_player_id(request["id"]))
+                return {"elo": elo, "games": nb_games}
+            if op == "expected":
+                return {
+                    "expected": self.ratings.expected_result(
+                        _player_id(request["a"]), _player_id(request["b"])
+                    )
+                }
+            if op == "stats":
+                return self.stats()
+            return {"error": "unknown op {!r}".format(op)}
+        except (KeyError, TypeError, AttributeError) as error:
+            return _bad_request(error)
+
+    def dispatch(self, line):
+        """Parses a request line and returns (kind, value): ("result", future of the answer) for a result,
+        ("lookup", request) for a lookup, answered later by lookup, or ("error", answer) for a bad request
+        """
+        try:
+            request = json.loads(line)
+            if request.get("op") == "result":
+                result = float(request["result"])
+                if result not in (0.0, 0.5, 1.0):
+                    return "error", {"error": "result must be 0, 0.5 or 1"}
+                return "result", self.submit(
+                    _player_id(request["a"]), _player_id(request["b"]), result
+                )
+            return "lookup", request
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            return "error", _bad_request(error)
+
+    async def handle(self, reader, writer):
+        """Serves a connection: its requests are read while the answers to the previous ones are written"""
+        answers = asyncio.Queue()
+        sender = asyncio.ensure_future(self._send(answers, writer))
+        self.nb_connections += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                received = time.perf_counter()
+                kind, value = self.dispatch(line)
+                answers.put_nowait((kind, value, received))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            answers.put_nowait(None)
+            try:
+                await sender
+            except asyncio.CancelledError:
+                # The service is stopping
+                pass
+            writer.close()
+            self.nb_connections -= 1
+
+    async def _send(self, answers, writer):
+        try:
+            while True:
+                item = await answers.get()
+                if item is None:
+                    break
+                kind, answer, received = item
+                if kind == "result":
+                    answer = await answer
+                elif kind == "lookup":
+                    # Evaluated only now, after the earlier results of the connection are applied
+                    answer = self.lookup(answer)
+                writer.write(json.dumps(answer).encode() + b"\n")
+                if kind == "result":
+                    self.result_latency.add(time.perf_counter() - received)
+                else:
+                    self.nb_lookups += 1
+                    self.lookup_latency.add(time.perf_counter() - received)
+                # Waiting for the socket only when nothing else is ready to be written
+                if answers.empty():
+                    await writer.drain()
+        except ConnectionError:
+            pass
+
+    def stats(self):
+        """Returns the counters and the latencies (from the request read to the answer written, in ms) of the
+        service. "updates_per_second" is the number of results applied per second since the first batch
+        """
+        result_p50, result_p99 = self.result_latency.percentiles_ms()
+        lookup_p50, lookup_p99 = self.lookup_latency.percentiles_ms()
+        duration = 0.0
+        if self.first_batch is not None:
+            duration = self.last_batch - self.first_batch
+        return {
+            "players": len(self.ratings),
+            "updates": self.nb_updates,
+            "lookups": self.nb_lookups,
+            "batches": self.nb_batches,
+            "mean_batch": self.nb_updates / max(self.nb_batches, 1),
+            "updates_per_second": self.nb_updates / duration if duration > 0 else None,
+            "result_p50_ms": result_p50,
+            "result_p99_ms": result_p99,
+            "lookup_p50_ms": lookup_p50,
+            "lookup_p99_ms": lookup_p99,
+        }
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """Starts listening and returns the asyncio server, port 0 picks a free port"""
+        return await asyncio.start_server(self.handle, host, port)
+
+
+async def generate_load(
+    host="127.0.0.1",
+    port=DEFAULT_PORT,
+    nb_players=1000,
+    duration=10.0,
+    connections=16,
+    pipeline=32,
+    lookup_ratio=0.2,
+    distribution="ladder",
+    seed=None,
+):
+    """Posts the results of simulated matches, and lookups, to a rating service for 'duration' seconds.
+
+    Each connection sends 'pipeline' requests, then reads their answers, and so on. A match is between two players
+    drawn at random and its result is drawn by Player.play, from the skills of the players.
+
+    Keyword Arguments:
+        host {str} -- Address of the service (default: {"127.0.0.1"})
+        port {int} -- Port of the service (default: {DEFAULT_PORT})
+        nb_players {int} -- Number of simulated players (default: {1000})
+        duration {float} -- Duration of the load in seconds (default: {10.0})
+        connections {int} -- Number of concurrent connections (default: {16})
+        pipeline {int} -- Number of requests sent before reading their answers (default: {32})
+        lookup_ratio {float} -- Fraction of the requests that are lookups, half "rating" and half "expected"
+        (default: {0.2})
+        distribution {str} -- Skill distribution, see matchmaking.draw_skills (default: {"ladder"})
+        seed {int} -- Seed of the matches (default: {None})
+
+    Returns:
+        dict -- "updates" and "lookups" answered, "errors", "duration" (seconds), "updates_per_second" and the
+        p50/p99 latencies seen by the clients (from the sending of a pipeline to the reading of each answer, in ms)
+    """
+    import simulation
+    import matchmaking
+
+    seeds = np.random.SeedSequence(seed).spawn(connections + 1)
+    skills = matchmaking.draw_skills(
+        nb_players, distribution, np.random.default_rng(seeds[0])
+    )
+    players = [simulation.Player(i, skill) for i, skill in enumerate(skills.tolist())]
+    result_latency = LatencyRecorder()
+    lookup_latency = LatencyRecorder()
+    counts = {"updates": 0, "lookups": 0, "errors": 0}
+    end = time.perf_counter() + duration
+
+    def request(rng):
+        i, j = rng.integers(nb_players, size=2).tolist()
+        while i == j:
+            j = int(rng.integers(nb_players))
+        draw = rng.random()
+        if draw >= lookup_ratio:
+            result = players[i].play(players[j], rng)
+            return {"op": "result", "a": i, "b": j, "result": result}, True
+        if draw < lookup_ratio / 2:
+            return {"op": "rating", "id": i}, False
+        return {"op": "expected", "a": i, "b": j}, False
+
+    async def client(rng):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while time.perf_counter() < end:
+                requests = [request(rng) for _ in range(pipeline)]
+                writer.write(
+                    b"".join(json.dumps(r).encode() + b"\n" for r, _ in requests)
+                )
+                sent = time.perf_counter()
+                await writer.drain()
+                for _, is_result in requests:
+                    answer = json.loads(await reader.readline())
+                    latency = time.perf_counter() - sent
+                    if "error" in answer:
+                        counts["errors"] += 1
+                    elif is_result:
+                        counts["updates"] += 1
+                        result_latency.add(latency)
+                    else:
+                        counts["lookups"] += 1
+                        lookup_latency.add(latency)
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(np.random.default_rng(s)) for s in seeds[1:]])
+    elapsed = time.perf_counter() - start
+    result_p50, result_p99 = result_latency.percentiles_ms()
+    lookup_p50, lookup_p99 = lookup_latency.percentiles_ms()
+    return dict(
+        counts,
+        duration=elapsed,
+        updates_per_second=counts["updates"] / elapsed,
+        result_p50_ms=result_p50,
+        result_p99_ms=result_p99,
+        lookup_p50_ms=lookup_p50,
+        lookup_p99_ms=lookup_p99,
+    )
+
+
+async def request_stats(host="127.0.0.1", port=DEFAULT_PORT):
+    """Returns the stats of a running service"""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(b'{"op": "stats"}\n')
+    answer = json.loads(await reader.readline())
+    writer.close()
+    return answer
+
+
+def format_stats(stats):
+    def ms(value):
+        return "-" if value is None else "{:.2f}".format(value)
+
+    return "{} updates ({} /s), {} lookups, results p50/p99 {}/{} ms, lookups p50/p99 {}/{} ms".format(
+        stats["updates"],
+        (
+            "-"
+            if stats["updates_per_second"] is None
+            else "{:.0f}".format(stats["updates_per_second"])
+        ),
+        stats["lookups"],
+        ms(stats["result_p50_ms"]),
+        ms(stats["result_p99_ms"]),
+        ms(stats["lookup_p50_ms"]),
+        ms(stats["lookup_p99_ms"]),
+    )
+
+
+async def serve(host, port, batch_size, max_delay, report_interval):
+    import simulation
+
+    service = RatingService(
+        StreamingElo(simulation.STARTING_ELO, simulation.K_FACTOR, simulation.DIVIDER),
+        batch_size,
+        max_delay,
+    )
+    server = await service.start(host, port)
+    print(
+        "Serving on {}:{}".format(host, server.sockets[0].getsockname()[1]),
+        flush=True,
+    )
+    try:
+        async with server:
+            while True:
+                await asyncio.sleep(report_interval)
+                if service.nb_updates or service.nb_lookups:
+                    print(format_stats(service.stats()), flush=True)
+    finally:
+        service.flush()
+        print(format_stats(service.stats()))
+
+
+async def bench(args):
+    """Runs the service and the load generator in the same process"""
+    import simulation
+
+    service = RatingService(
+        StreamingElo(simulation.STARTING_ELO, simulation.K_FACTOR, simulation.DIVIDER),
+        args.batch_size,
+        args.max_delay,
+    )
+    server = await service.start(args.host, 0)
+    async with server:
+        load = await generate_load(
+            args.host,
+            server.sockets[0].getsockname()[1],
+            args.players,
+            args.duration,
+            args.connections,
+            args.pipeline,
+            args.lookup_ratio,
+            seed=args.seed,
+        )
+        # Letting the service see the connections closed before stopping it
+        while service.nb_connections:
+            await asyncio.sleep(0.01)
+    return load, service.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local rating service with micro-batched updates, and its load generator"
+    )
+    parser.add_argument(
+        "mode",
+        choices=["serve", "load", "bench"],
+        help="serve: runs the service, load: sends simulated matches to a running service, bench: both in one process",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1024,
+        help="Maximum number of results applied as one batch",
+    )
+    parser.add_argument(
+        "--max-delay",
+        type=float,
+        default=0.002,
+        help="Maximum time in seconds a result waits for its batch",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=5.0,
+        help="serve: prints the stats every REPORT_INTERVAL seconds",
+    )
+    parser.add_argument(
+        "--players", type=int, default=1000, help="Number of simulated players"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="Duration of the load in seconds"
+    )
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument(
+        "--pipeline",
+        type=int,
+        default=32,
+        help="Number of requests a connection sends before reading their answers",
+    )
+    parser.add_argument(
+        "--lookup-ratio",
+        type=float,
+        default=0.2,
+        help="Fraction of the requests that are rating or expected-result lookups",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        if args.mode == "serve":
+            asyncio.run(
+                serve(
+                    args.host,
+                    args.port,
+                    args.batch_size,
+                    args.max_delay,
+                    args.report_interval,
+                )
+            )
+        elif args.mode == "load":
+            load = asyncio.run(
+                generate_load(
+                    args.host,
+                    args.port,
+                    args.players,
+                    args.duration,
+                    args.connections,
+                    args.pipeline,
+                    args.lookup_ratio,
+                    seed=args.seed,
+                )
+            )
+            print("Clients: " + format_stats(load))
+            print(
+                "Service: "
+                + format_stats(asyncio.run(request_stats(args.host, args.port)))
+            )
+        else:
+            load, stats = asyncio.run(bench(args))
+            print("Clients: " + format_stats(load))
+            print("Service: " + format_stats(stats))
+            print(
+                "{} batches of {:.1f} results on average".format(
+                    stats["batches"], stats["mean_batch"]
+                )
+            )
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,571 @@
+"""
+Replays real match logs through the Elo update of elo.py, for histories of tens of millions of matches.
+
+A match log is a CSV file with a header, or a JSON lines file, with one match per row: the ids of both players, the
+result of the first player (1 for a win, 0 for a loss, 0.5 for a draw) and optionally a timestamp. Gzipped logs
+(.gz) are read directly.
+
+The log is read in chunks and the player ids are mapped to dense indices on the fly, so the memory used only grows
+with the number of players: a few bytes per player for the ratings and the number of games, plus the id mapping.
+The matches are applied one after the other in the order they occurred, with the same update as Player.update, in a
+tight loop over compact arrays: about ten million matches per minute, reading included. Snapshots of the ratings can
+be taken every N matches.
+"""
+
+import os
+import csv
+import gzip
+import json
+import math
+import time
+import array
+import itertools
+import argparse
+import numpy as np
+from expected_score import expected_score
+
+DEFAULT_COLUMNS = ("player_a", "player_b", "result", "timestamp")
+
+
+def _open_log(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", newline="")
+    return open(path, newline="")
+
+
+def log_format(path):
+    """Returns "jsonl" or "csv" depending on the extension of the log"""
+    name = path[:-3] if path.endswith(".gz") else path
+    if os.path.splitext(name)[1].lower() in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    return "csv"
+
+
+def _parse_results(values, path, first_line):
+    """Converts the results of a chunk to floats, checking that they are between 0 and 1"""
+    try:
+        results = np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        results = None
+    if results is None or not np.all((results >= 0) & (results <= 1)):
+        # Looking for the faulty row, only when there is one
+        for line, value in enumerate(values, first_line):
+            try:
+                result = float(value)
+            except (TypeError, ValueError):
+                result = None
+            if result is None or not 0 <= result <= 1:
+                raise ValueError(
+                    "{}:{}: the result must be between 0 and 1, got {!r}".format(
+                        path, line, value
+                    )
+                )
+    return results.tolist()
+
+
+def _parse_timestamps(values):
+    timestamps = np.asarray(values)
+    if timestamps.dtype.kind in "US":
+        try:
+            timestamps = timestamps.astype(float)
+        except ValueError:
+            # Kept as strings, e.g. ISO 8601 dates which sort like the dates themselves
+            pass
+    return timestamps
+
+
+def read_matches(path, chunk_size=100000, columns=DEFAULT_COLUMNS, file_format=None):
+    """Reads a match log and yields it chunk by chunk.
+
+    Arguments:
+        path {str} -- CSV (with a header) or JSON lines file, optionally gzipped
+
+    Keyword Arguments:
+        chunk_size {int} -- Number of matches per chunk (default: {100000})
+        columns {tuple} -- Names of the columns (CSV) or keys (JSON lines) holding the first player, the second
+        player, the result of the first player and the timestamp. The timestamp is optional (default: {DEFAULT_COLUMNS})
+        file_format {str} -- "csv" or "jsonl", guessed from the extension if None (default: {None})
+
+    Yields:
+        tuple -- (ids of the first players, ids of the second players, results, timestamps) where the ids are
+        lists of strings (CSV) or of JSON values, the results a list of floats and the timestamps an array, or None
+        if the log has no timestamp
+    """
+    if file_format is None:
+        file_format = log_format(path)
+    column_time = columns[3] if len(columns) > 3 else None
+    with _open_log(path) as f:
+        if file_format == "csv":
+            reader = csv.reader(f)
+            header = next(reader)
+            missing = [c for c in columns[:3] if c not in header]
+            if missing:
+                raise ValueError(
+                    "{}: no column {} in the header {}".format(path, missing, header)
+                )
+            fields = [header.index(c) for c in columns[:3]]
+            if column_time in header:
+                fields.append(header.index(column_time))
+            # The first line of a CSV file is its header
+            line = 2
+        else:
+            reader = (json.loads(record) for record in f if record.strip())
+            fields = list(columns)
+            line = 1
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                return
+            if file_format == "jsonl" and line == 1 and column_time not in rows[0]:
+                fields = fields[:3]
+            # One pass per column instead of one per match
+            player_a = [row[fields[0]] for row in rows]
+            player_b = [row[fields[1]] for row in rows]
+            results = _parse_results([row[fields[2]] for row in rows], path, line)
+            timestamps = None
+            if len(fields) > 3:
+                timestamps = _parse_timestamps([row[fields[3]] for row in rows])
+            yield player_a, player_b, results, timestamps
+            line += len(rows)
+
+
+def _dense_indices(index, ids):
+    """Returns the dense index of each id, adding the new ones to 'index' (id -> index). If an id can't be a key of
+    'index', the ids added by this call are removed before the error is raised"""
+    nb_known = len(index)
+    setdefault = index.setdefault
+    try:
+        return [setdefault(player, len(index)) for player in ids]
+    except TypeError:
+        for player in list(itertools.islice(reversed(index), len(index) - nb_known)):
+            del index[player]
+        raise
+
+
+def _split_indices(ratings, player_a, player_b):
+    """Returns the dense indices of player_a and player_b, all of them or none added to the ratings"""
+    player_a = list(player_a)
+    indices = ratings.indices(player_a + list(player_b))
+    return indices[: len(player_a)], indices[len(player_a) :]
+
+
+class StreamingElo(object):
+    """
+    Elo ratings of players discovered while reading a log, stored in compact arrays indexed by dense integers
+    """
+
+    def __init__(
+        self,
+        starting_elo=1200,
+        k_factor=25,
+        divider=400,
+        k_factor_placements=None,
+        nb_placement_games=0,
+    ):
+        """
+        Keyword Arguments:
+            starting_elo {float} -- Elo of a player in their first match (default: {1200})
+            k_factor {float} -- K factor after the placement games (default: {25})
+            divider {float} -- Elo divider (default: {400})
+            k_factor_placements {float} -- K factor of the first 'nb_placement_games' games of each player, None for
+            no placement games (default: {None})
+            nb_placement_games {int} -- Number of placement games (default: {0})
+        """
+        self.starting_elo = float(starting_elo)
+        self.k_factor = float(k_factor)
+        self.divider = float(divider)
+        if k_factor_placements is None:
+            k_factor_placements = k_factor
+            nb_placement_games = 0
+        self.k_factor_placements = float(k_factor_placements)
+        self.nb_placement_games = nb_placement_games
+        # id -> dense index, in the order the players appeared
+        self.index = {}
+        self._elo = array.array("d")
+        self._nb_games = array.array("q")
+        self.nb_matches = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def indices(self, ids):
+        """Returns the dense index of each id, adding the new players. Raises TypeError, without adding anyone, if
+        an id isn't hashable"""
+        index = self.index
+        indices = _dense_indices(index, ids)
+        new = len(index) - len(self._elo)
+        if new:
+            self._elo.extend(array.array("d", [self.starting_elo]) * new)
+            self._nb_games.extend(array.array("q", [0]) * new)
+        return indices
+
+    def play(self, player_a, player_b, results):
+        """Applies matches in order. Each player uses their own K factor, so this is exactly Player.update when
+        both players have the same K factor.
+
+        Arguments:
+            player_a {list} -- Ids of the first players
+            player_b {list} -- Ids of the second players
+            results {list} -- Results of the first players: 1 for a win, 0 for a loss, 0.5 for a draw
+        """
+        # Before anything is changed, so that an invalid id leaves the ratings as they were
+        first, second = _split_indices(self, player_a, player_b)
+        # Everything used in the loop is local: this loop is the whole cost of a replay
+        elo = self._elo
+        nb_games = self._nb_games
+        divider = self.divider
+        k_factor = self.k_factor
+        k_factor_placements = self.k_factor_placements
+        nb_placement_games = self.nb_placement_games
+        pow = math.pow
+        for i, j, result in zip(first, second, results):
+            elo_i = elo[i]
+            elo_j = elo[j]
+            delta = result - 1.0 / (1 + pow(10, (elo_j - elo_i) / divider))
+            games_i = nb_games[i]
+            games_j = nb_games[j]
+            elo[i] = (
+                elo_i
+                + (k_factor_placements if games_i < nb_placement_games else k_factor)
+                * delta
+            )
+            elo[j] = (
+                elo_j
+                - (k_factor_placements if games_j < nb_placement_games else k_factor)
+                * delta
+            )
+            nb_games[i] = games_i + 1
+            nb_games[j] = games_j + 1
+        self.nb_matches += len(results)
+
+    def rating(self, player):
+        """Returns the (elo, nb_games) of a player, without adding them: a new player has the starting elo"""
+        i = self.index.get(player)
+        if i is None:
+            return self.starting_elo, 0
+        return self._elo[i], self._nb_games[i]
+
+    def expected_result(self, player_a, player_b):
+        """Returns the expected result of player_a against player_b, like Player.expected_result"""
+        return expected_score(
+            self.rating(player_a)[0] - self.rating(player_b)[0], self.divider
+        )
+
+    @property
+    def ids(self):
+        """Ids of the players, in the order of their dense index"""
+        return list(self.index)
+
+    @property
+    def elo(self):
+        """Copy of the ratings as an array, in the order of self.ids"""
+        return np.array(self._elo)
+
+    @property
+    def nb_games(self):
+        return np.array(self._nb_games)
+
+    def snapshot(self):
+        """Returns a copy of the ratings: "matches" (number of matches applied so far), "ids", "elo" and
+        "nb_games" """
+        return {
+            "matches": self.nb_matches,
+            "ids": self.ids,
+            "elo": self.elo,
+            "nb_games": self.nb_games,
+        }
+
+    def top(self, n=10, min_games=0):
+        """Returns the (id, elo, nb_games) of the 'n' best players having played at least 'min_games' games"""
+        elo = self.elo
+        nb_games = self.nb_games
+        candidates = np.flatnonzero(nb_games >= min_games)
+        best = candidates[np.argsort(-elo[candidates], kind="stable")[:n]]
+        ids = self.ids
+        return [(ids[p], float(elo[p]), int(nb_games[p])) for p in best]
+
+
+class KernelRatings(StreamingElo):
+    """
+    StreamingElo with any rating kernel of rating_kernels.py instead of the elo update. The matches of a chunk are
+    grouped in levels of matches without a common player (array_engine.conflict_free_levels) and each level is applied
+    as one batch, which gives the same ratings as applying the matches one after the other. Batches get wider with
+    the number of players: logs of a few players are faster with StreamingElo.
+    """
+
+    def __init__(self, kernel):
+        """
+        Arguments:
+            kernel {rating_kernels.RatingKernel} -- The rating system
+        """
+        self.kernel = kernel
+        self.state = kernel.new_state(0)
+        self.index = {}
+        self.nb_matches = 0
+
+    def indices(self, ids):
+        index = self.index
+        indices = _dense_indices(index, ids)
+        if len(index) > len(self.state["nb_games"]):
+            self.state = self.kernel.grow(self.state, len(index))
+        return indices
+
+    def play(self, player_a, player_b, results):
+        """Applies matches in order, see StreamingElo.play"""
+        import array_engine
+
+        # Before anything is changed, so that an invalid id leaves the ratings as they were
+        first, second = _split_indices(self, player_a, player_b)
+        levels = array_engine.conflict_free_levels(first, second, len(self.index))
+        first = np.array(first, dtype=np.intp)
+        second = np.array(second, dtype=np.intp)
+        results = np.asarray(results, dtype=float)
+        for level in levels:
+            self.kernel.update(self.state, first[level], second[level], results[level])
+        self.nb_matches += len(results)
+
+    def rating(self, player):
+        """Returns the (rating, nb_games) of a player, without adding them: a new player has the starting rating"""
+        i = self.index.get(player)
+        if i is None:
+            state = self.kernel.new_state(1)
+            i = 0
+        else:
+            state = self.state
+        return float(self.kernel.ratings(state, i)), int(state["nb_games"][i])
+
+    def expected_result(self, player_a, player_b):
+        """Returns the expected result of player_a against player_b"""
+        # The state of both players only, new players keeping the initial values
+        pair = self.kernel.new_state(2)
+        for slot, player in enumerate((player_a, player_b)):
+            p = self.index.get(player)
+            if p is not None:
+                for name in pair:
+                    pair[name][slot] = self.state[name][p]
+        return float(self.kernel.expected(pair, np.array([0]), np.array([1]))[0])
+
+    @property
+    def elo(self):
+        """Copy of the displayed ratings of the kernel, in the order of self.ids"""
+        return np.array(self.kernel.ratings(self.state))
+
+    @property
+    def nb_games(self):
+        return self.state["nb_games"].copy()
+
+
+def replay(
+    path,
+    ratings=None,
+    chunk_size=100000,
+    columns=DEFAULT_COLUMNS,
+    file_format=None,
+    snapshot_every=None,
+    on_snapshot=None,
+):
+    """Replays a match log in chunks.
+
+    Within a chunk, the matches are sorted by timestamp if they are not already (stable sort, the order of the
+    log is kept for equal timestamps). Matches older than the last match of the previous chunks can't be moved back
+    without keeping the whole log in memory: they are applied when they are read and counted as "late".
+
+    Arguments:
+        path {str} -- Match log, see read_matches
+
+    Keyword Arguments:
+        ratings {StreamingElo} -- Ratings to update, e.g. with other K factors or already fed with an older log.
+        New default ones if None (default: {None})
+        chunk_size {int} -- Number of matches read at once (default: {100000})
+        columns {tuple} -- See read_matches (default: {DEFAULT_COLUMNS})
+        file_format {str} -- See read_matches (default: {None})
+        snapshot_every {int} -- Calls on_snapshot every 'snapshot_every' matches, None for no snapshots
+        (default: {None})
+        on_snapshot {function} -- Called with ratings.snapshot() (default: {None})
+
+    Returns:
+        tuple -- (ratings, stats) where stats has "matches", "players", "late" (matches older than the previous
+        chunks), "reordered" (chunks sorted by timestamp) and "duration" (seconds)
+    """
+    if ratings is None:
+        ratings = StreamingElo()
+    start = time.perf_counter()
+    nb_matches = 0
+    late = 0
+    reordered = 0
+    last_timestamp = None
+    next_snapshot = snapshot_every
+    for player_a, player_b, results, timestamps in read_matches(
+        path, chunk_size, columns, file_format
+    ):
+        if timestamps is not None and len(timestamps) > 1:
+            if np.any(timestamps[1:] < timestamps[:-1]):
+                order = np.argsort(timestamps, kind="stable")
+                player_a = [player_a[m] for m in order]
+                player_b = [player_b[m] for m in order]
+                results = [results[m] for m in order]
+                timestamps = timestamps[order]
+                reordered += 1
+            if last_timestamp is not None:
+                late += int(np.sum(timestamps < last_timestamp))
+            last_timestamp = timestamps[-1]
+        # Cutting the chunk where the snapshots are due
+        done = 0
+        while done < len(results):
+            end = len(results)
+            if next_snapshot is not None:
+                end = min(end, done + next_snapshot - nb_matches)
+            ratings.play(player_a[done:end], player_b[done:end], results[done:end])
+            nb_matches += end - done
+            done = end
+            if next_snapshot is not None and nb_matches == next_snapshot:
+                if on_snapshot is not None:
+                    on_snapshot(ratings.snapshot())
+                next_snapshot += snapshot_every
+    return ratings, {
+        "matches": nb_matches,
+        "players": len(ratings),
+        "late": late,
+        "reordered": reordered,
+        "duration": time.perf_counter() - start,
+    }
+
+
+def write_snapshot(path, snapshot):
+    """Writes a snapshot (see StreamingElo.snapshot) as a CSV file: id, elo and number of games of each player"""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "elo", "nb_games"])
+        writer.writerows(
+            zip(
+                snapshot["ids"], snapshot["elo"].tolist(), snapshot["nb_games"].tolist()
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Computes the elo ratings of real players by replaying a log of their matches"
+    )
+    parser.add_argument(
+        "log", help="CSV (with a header) or JSON lines file, optionally gzipped"
+    )
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        default=list(DEFAULT_COLUMNS),
+        help="Columns of the first player, the second player, the result of the first player and (optionally) the timestamp",
+    )
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    parser.add_argument(
+        "--k-factor", type=float, default=None, help="K factor (25 like elo.py)"
+    )
+    parser.add_argument(
+        "--k-factor-placements",
+        type=float,
+        default=None,
+        help="K factor of the placement games (100 like elo.py)",
+    )
+    parser.add_argument(
+        "--placement-games",
+        type=int,
+        default=0,
+        help="Number of games of each player played with the placement K factor",
+    )
+    parser.add_argument(
+        "--kernel",
+        choices=["elo", "glicko2", "trueskill"],
+        default=None,
+        help="Replays with a rating kernel of rating_kernels.py instead of the scalar elo loop. The elo kernel uses the K factors above",
+    )
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        default=None,
+        help="Writes the ratings every SNAPSHOT_EVERY matches...",
+    )
+    parser.add_argument(
+        "--snapshot-prefix",
+        default="snapshot",
+        help="... to SNAPSHOT_PREFIX_<matches>.csv",
+    )
+    parser.add_argument(
+        "--output", default=None, help="Writes the final ratings to this CSV file"
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of best players to print"
+    )
+    parser.add_argument(
+        "--min-games",
+        type=int,
+        default=0,
+        help="Only players with this many games are printed",
+    )
+    args = parser.parse_args()
+    if len(args.columns) not in (3, 4):
+        parser.error("--columns takes 3 or 4 names")
+
+    import simulation
+    import rating_kernels
+
+    k_factor = simulation.K_FACTOR if args.k_factor is None else args.k_factor
+    k_factor_placements = (
+        simulation.K_FACTOR_PLACEMENTS
+        if args.k_factor_placements is None
+        else args.k_factor_placements
+    )
+    if args.kernel is None:
+        ratings = StreamingElo(
+            simulation.STARTING_ELO,
+            k_factor,
+            simulation.DIVIDER,
+            k_factor_placements,
+            args.placement_games,
+        )
+    elif args.kernel == "elo":
+        stages = [(0, k_factor)]
+        if args.placement_games > 0:
+            stages = [(0, k_factor_placements), (args.placement_games, k_factor)]
+        ratings = KernelRatings(
+            rating_kernels.EloKernel(
+                stages, simulation.DIVIDER, simulation.STARTING_ELO
+            )
+        )
+    else:
+        ratings = KernelRatings(rating_kernels.KERNELS[args.kernel]())
+    ratings, stats = replay(
+        args.log,
+        ratings,
+        chunk_size=args.chunk_size,
+        columns=args.columns,
+        file_format=args.format,
+        snapshot_every=args.snapshot_every,
+        on_snapshot=lambda snapshot: write_snapshot(
+            "{}_{}.csv".format(args.snapshot_prefix, snapshot["matches"]), snapshot
+        ),
+    )
+    print(
+        "{} matches between {} players in {:.3f}s ({:.0f} matches/s)".format(
+            stats["matches"],
+            stats["players"],
+            stats["duration"],
+            stats["matches"] / max(stats["duration"], 1e-9),
+        )
+    )
+    if stats["late"] or stats["reordered"]:
+        print(
+            "{} chunks sorted by timestamp, {} matches older than the previous chunks applied late".format(
+                stats["reordered"], stats["late"]
+            )
+        )
+    for rank, (player, elo, nb_games) in enumerate(
+        ratings.top(args.top, args.min_games)
+    ):
+        print("{:>4}. {}: {:.1f} ({} games)".format(rank + 1, player, elo, nb_games))
+    if args.output:
+        write_snapshot(args.output, ratings.snapshot())
+
+
+if __name__ == "__main__":
+    main()
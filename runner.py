@@ -0,0 +1,250 @@
+"""
+Runs independent simulations (elo seasons, elo hell games, tennis duels) on a pool of processes.
+
+Each task gets its own random stream, spawned from a master np.random.SeedSequence, and the results are merged in
+task order. The work is split into tasks independently of the number of workers, so the same master seed gives bit
+identical aggregates whether the tasks run on 1 core or on 32.
+"""
+
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+def season_task(
+    rng, nb_players, nb_games, nb_placement, min_skill, delta_skill, nb_seasons
+):
+    """Simulates 'nb_seasons' round-robin seasons with the settings of elo.py and returns their final elo ratings
+    as a (seasons x players) matrix"""
+    import simulation
+    import array_engine
+
+    skills = [min_skill + i * delta_skill for i in range(nb_players)]
+    stats = array_engine.simulate_replicates(
+        skills,
+        simulation.replicate_stages(nb_players, nb_games, nb_placement),
+        nb_seasons,
+        rng,
+        simulation.DIVIDER,
+        simulation.STARTING_ELO,
+    )
+    return stats["final"]
+
+
+def merge_seasons(results, percentiles=(5, 25, 50, 75, 95)):
+    """Merges the results of season_task into per-player statistics of the final elo ratings"""
+    final = np.concatenate(results)
+    return {
+        "nb_seasons": len(final),
+        "mean": final.mean(axis=0),
+        "std": final.std(axis=0),
+        "percentiles": np.percentile(final, percentiles, axis=0),
+        # Skills are increasing with the index of the player
+        "correct_order": np.mean(np.all(np.diff(final, axis=1) > 0, axis=1)),
+    }
+
+
+def elo_hell_task(rng, nb_games, proba_of_inter):
+    """Plays 'nb_games' elo hell games and returns the number of wins"""
+    import elo_hell
+
+    nb_wins = 0
+    for i in range(nb_games):
+        nb_wins += elo_hell.create_team_and_play(proba_of_inter, rng=rng)
+    return nb_wins
+
+
+def merge_counts(results):
+    return {"total": sum(results), "per_task": np.array(results)}
+
+
+def tennis_task(rng, proba_of_win, nb_matchs, nb_points_per_match):
+    """Plays 'nb_matchs' tennis matchs and returns the number of matchs won by player A"""
+    import tennis
+
+    return tennis.simulate_duel(
+        proba_of_win, nb_matchs, nb_points_per_match, rng=rng, verbose=False
+    )
+
+
+def _run_task(task, seed, args):
+    start = time.perf_counter()
+    result = task(np.random.default_rng(seed), *args)
+    return result, time.perf_counter() - start
+
+
+def run_parallel(task, tasks_args, seed=None, nb_workers=None, seeds=None):
+    """Runs task(rng, *args) for every args of 'tasks_args' on a pool of processes.
+
+    Task k always gets the k-th stream spawned from the master seed, whatever the worker that runs it, and the results
+    are returned in task order.
+
+    Arguments:
+        task {function} -- Module level function taking a np.random.Generator followed by the task arguments
+        tasks_args {list} -- One tuple of arguments per task (e.g. one per chunk of seasons or per sweep point)
+
+    Keyword Arguments:
+        seed {int} -- Master seed, None for a fresh one (default: {None})
+        nb_workers {int} -- Number of processes, os.cpu_count() if None. 1 runs everything in this process
+        (default: {None})
+        seeds {list} -- One seed (or np.random.SeedSequence) per task, overriding the streams spawned from 'seed'.
+        Used when the stream of a task must not depend on its position, e.g. cached sweep points (default: {None})
+
+    Returns:
+        tuple -- (results, timings) where timings holds the wall time, the time spent in the tasks and the
+        efficiency (time spent in the tasks / (wall time * nb_workers))
+    """
+    if nb_workers is None:
+        nb_workers = os.cpu_count()
+    if seeds is None:
+        seeds = np.random.SeedSequence(seed).spawn(len(tasks_args))
+    start = time.perf_counter()
+    if nb_workers == 1:
+        outputs = [_run_task(task, s, args) for s, args in zip(seeds, tasks_args)]
+    else:
+        with ProcessPoolExecutor(nb_workers) as pool:
+            outputs = list(pool.map(_run_task, [task] * len(seeds), seeds, tasks_args))
+    wall_time = time.perf_counter() - start
+    busy_time = sum(duration for result, duration in outputs)
+    timings = {
+        "nb_workers": nb_workers,
+        "wall_time": wall_time,
+        "busy_time": busy_time,
+        "efficiency": busy_time / (wall_time * nb_workers),
+    }
+    return [result for result, duration in outputs], timings
+
+
+def _same_aggregates(a, b):
+    return all(np.array_equal(a[key], b[key]) for key in a)
+
+
+def scaling_report(task, tasks_args, merge, seed, worker_counts):
+    """Runs the same tasks with each number of workers of 'worker_counts', checks that the merged aggregates are
+    identical and prints the speedup and the efficiency per core compared to the first run.
+
+    Returns:
+        list -- One dict per number of workers with its timings, speedup and efficiency per core
+    """
+    report = []
+    reference = None
+    for nb_workers in worker_counts:
+        results, timings = run_parallel(task, tasks_args, seed, nb_workers)
+        aggregates = merge(results)
+        if reference is None:
+            reference = (aggregates, timings["wall_time"], nb_workers)
+        identical = _same_aggregates(reference[0], aggregates)
+        speedup = reference[1] / timings["wall_time"]
+        timings["speedup"] = speedup
+        timings["efficiency_per_core"] = speedup * reference[2] / nb_workers
+        timings["identical"] = identical
+        report.append(timings)
+        print(
+            "{:3d} workers: {:8.3f}s, speedup {:6.2f}, efficiency per core {:5.1f}%, identical aggregates: {}".format(
+                nb_workers,
+                timings["wall_time"],
+                speedup,
+                100 * timings["efficiency_per_core"],
+                identical,
+            )
+        )
+    return report
+
+
+def _split(total, nb_tasks):
+    """Splits 'total' into 'nb_tasks' nearly equal chunks, fewer when 'total' is smaller, so that no chunk is empty"""
+    nb_tasks = min(nb_tasks, total)
+    return [total // nb_tasks + (k < total % nb_tasks) for k in range(nb_tasks)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs elo seasons, elo hell games or tennis duels on all cores with reproducible random streams"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of processes (all cores)"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Master seed")
+    parser.add_argument(
+        "--tasks",
+        type=int,
+        default=64,
+        help="Number of tasks the work is split into. The results only depend on this and on the seed",
+    )
+    parser.add_argument(
+        "--scaling",
+        action="store_true",
+        help="Runs with 1, 2, 4, ... workers and reports the scaling efficiency per core",
+    )
+    subparsers = parser.add_subparsers(dest="simulation", required=True)
+
+    seasons = subparsers.add_parser("seasons", help="Round-robin seasons of elo.py")
+    seasons.add_argument("nb_players", type=int)
+    seasons.add_argument("nb_games", type=int)
+    seasons.add_argument("nb_placements", type=int)
+    seasons.add_argument("min_skill", type=int)
+    seasons.add_argument("delta_skill", type=int)
+    seasons.add_argument("--seasons", type=int, default=10000)
+
+    elohell = subparsers.add_parser("elohell", help="Games of elo_hell.py")
+    elohell.add_argument("--games", type=int, default=1000000)
+    elohell.add_argument("--proba-of-inter", type=float, default=0.1)
+
+    duels = subparsers.add_parser("tennis", help="Duels of tennis.py")
+    duels.add_argument("--proba-of-win", type=float, default=0.51)
+    duels.add_argument("--matchs", type=int, default=1000)
+    duels.add_argument("--points", type=int, default=1001)
+
+    args = parser.parse_args()
+    if args.tasks < 1:
+        parser.error("--tasks must be positive")
+    for name in ("seasons", "games", "matchs"):
+        if getattr(args, name, 1) < 1:
+            parser.error("--{} must be positive".format(name))
+
+    if args.simulation == "seasons":
+        task = season_task
+        merge = merge_seasons
+        tasks_args = [
+            (
+                args.nb_players,
+                args.nb_games,
+                args.nb_placements,
+                args.min_skill,
+                args.delta_skill,
+                n,
+            )
+            for n in _split(args.seasons, args.tasks)
+        ]
+    elif args.simulation == "elohell":
+        task = elo_hell_task
+        merge = merge_counts
+        tasks_args = [(n, args.proba_of_inter) for n in _split(args.games, args.tasks)]
+    else:
+        task = tennis_task
+        merge = merge_counts
+        tasks_args = [
+            (args.proba_of_win, n, args.points) for n in _split(args.matchs, args.tasks)
+        ]
+
+    if args.scaling:
+        max_workers = args.workers or os.cpu_count()
+        worker_counts = [1]
+        while worker_counts[-1] * 2 < max_workers:
+            worker_counts.append(worker_counts[-1] * 2)
+        if max_workers > 1:
+            worker_counts.append(max_workers)
+        scaling_report(task, tasks_args, merge, args.seed, worker_counts)
+    else:
+        results, timings = run_parallel(task, tasks_args, args.seed, args.workers)
+        print(merge(results))
+        print(
+            "{} tasks on {} workers in {:.3f}s, efficiency {:.1f}%".format(
+                len(tasks_args),
+                timings["nb_workers"],
+                timings["wall_time"],
+                100 * timings["efficiency"],
+            )
+        )
@@ -0,0 +1,735 @@
+"""
+Simulation and rating logic of elo.py, without any plotting.
+
+Everything needed to play seasons lives here and only imports numpy and the other simulation modules, so batch runs
+and worker processes (runner.py, sweep.py) start quickly. elo.py adds the plots and the command line on top of it.
+"""
+
+import os
+import sys
+import math
+import random
+import numpy as np
+import array_engine
+import checkpoint
+import elo_hell
+from convergence import ConvergenceTracker
+from expected_score import expected_score
+from history import RatingHistory
+from trajectories import TrajectoryWriter
+
+# FIDE (chess) use K=40 for placement games and K=20 afterwads (or k=10 for high elo): https://en.wikipedia.org/wiki/Elo_rating_system
+# LOL (season 2) seems to use K=100 for placement games and K=25 afterwards: https://leagueoflegends.fandom.com/wiki/Elo_rating_system
+# BoardGameArena uses K = 60, then K=40, then K=20 after the end of placement games: https://boardgamearena.com/faq?anchor=faq_account_elo
+K_FACTOR_PLACEMENTS = 100
+K_FACTOR = 25
+DIVIDER = 400
+STARTING_ELO = 1200
+FORCED_WINRATE = elo_hell.exact_winrate(elo_hell.PROBA_OF_INTER)
+"""
+FORCED_WINRATE (~0.536) is the theoretical winrate of a player in elo hell, calculated by elo_hell.py.
+Elo hell is here defined as: 
+- Any other player has a probability of ruining the game of 0.1 (a.k.a. inter) in a 5vs5 game
+- If both teams have an equal number of inters, then the probability of wining the game is 0.5
+"""
+
+
+def draw(precision, rng=None):
+    """Returns a random integer between 0 and precision (both included)
+
+    Arguments:
+        precision {int} -- Highest possible value
+
+    Keyword Arguments:
+        rng {np.random.Generator} -- Source of randomness, the global random module is used if None (default: {None})
+    """
+    if rng is None:
+        return random.randint(0, precision)
+    return int(rng.integers(0, precision + 1))
+
+
+class Player(object):
+    """
+    Represents a player, its skill and its current elo points
+    """
+
+    def __init__(
+        self,
+        name,
+        skill,
+        elo=STARTING_ELO,
+        k_factor=K_FACTOR_PLACEMENTS,
+        is_inter=False,
+        elo_history=None,
+        leaderboard=None,
+    ):
+        """
+        Keyword Arguments:
+            elo_history {list or RatingHistory} -- Empty container that will receive the elo ratings of the player,
+            a list if None. A RatingHistory sized for the season is much more compact (default: {None})
+            leaderboard {Leaderboard} -- If not None, the player joins this leaderboard (see leaderboard.py), which
+            follows their elo after every update (default: {None})
+        """
+        self.name = name
+        self.skill = skill
+        self.elo = elo
+        self.k_factor = k_factor
+        if elo_history is None:
+            elo_history = []
+        self.elo_history = elo_history
+        self.elo_history.append(elo)
+        self.is_inter = is_inter
+        self.leaderboard = leaderboard
+        if leaderboard is not None:
+            self.leaderboard_index = leaderboard.add(elo)
+
+    def __repr__(self):
+        s = "Player name : {}, actual skill = {} elo rating {}".format(
+            self.name, self.skill, self.elo
+        )
+        return s
+
+    def expected_result(self, other):
+        """Returns the expected value of the match against an other player (0 means a guaranteed loss, 1 means a guaranteed win)
+
+        Arguments:
+            other {Player} -- The second player
+        """
+        return expected_score(self.elo - other.elo, DIVIDER)
+
+    def play(self, other, rng=None):
+        """Returns the result (0 if loss, 1 if won) of a game against an other player
+
+        Arguments:
+            other {Player} -- The second player
+
+        Keyword Arguments:
+            rng {np.random.Generator} -- Source of randomness, the global random module is used if None (default: {None})
+        """
+        proba_of_wining = float(self.skill) / (self.skill + other.skill)
+        precision = array_engine.PRECISION
+        rand = draw(precision, rng)
+        if rand >= precision * proba_of_wining:
+            # Loss
+            return 0
+        return 1
+
+    def play_forced_winrate(self, winrate, rng=None):
+        proba_of_wining = winrate
+        precision = array_engine.PRECISION
+        rand = draw(precision, rng)
+        if rand >= precision * proba_of_wining:
+            # Loss
+            return 0
+        return 1
+
+    def play_and_update(
+        self,
+        other,
+        elohell=False,
+        forced_win_rate=FORCED_WINRATE,
+        verbose=False,
+        rng=None,
+    ):
+        """Plays against an other player and updates both elo ratings depending on the output of the match
+
+        Arguments:
+            other {Player} -- Other player
+
+        Keyword Arguments:
+            elohell {bool} -- If true, a fixed winrate will be used instead (default: {False})
+            forced_win_rate {[type]} -- Only used if elohell==True (default: {FORCED_WINRATE})
+            verbose {bool} -- More prints (default: {False})
+            rng {np.random.Generator} -- Source of randomness, the global random module is used if None (default: {None})
+        """
+        if not (elohell):
+            result = self.play(other, rng=rng)
+        else:
+            result = self.play_forced_winrate(forced_win_rate, rng=rng)
+        self.update(other, result, verbose=verbose)
+
+    def update(self, other, result, verbose=False):
+        """Updates this player's ELO and the 'other' player's ELO depending on the 'result' of a game.
+
+        Arguments:
+            other {Player} -- Other player
+            result {Float} -- Result of the game. 1.0 for a win against the 'other' player, 0.0 for a loss,
+            0.5 for a draw.
+
+        Keyword Arguments:
+            elohell {bool} -- If true, a fixed winrate will be used instead (default: {False})
+            forced_win_rate {[type]} -- Only used if elohell==True (default: {FORCED_WINRATE})
+            verbose {bool} -- More prints (default: {False})
+        """
+        expected = self.expected_result(other)
+        delta_points = self.k_factor * (result - expected)
+        self.elo = self.elo + delta_points
+        self.elo_history.append(self.elo)
+        other.elo = other.elo - delta_points
+        other.elo_history.append(other.elo)
+        if self.leaderboard is not None:
+            self.leaderboard.move(self.leaderboard_index, self.elo)
+        if other.leaderboard is not None:
+            other.leaderboard.move(other.leaderboard_index, other.elo)
+
+        if verbose:
+            print(
+                "{} vs {}. Expected by skill={}, expected by elo={}, result={}, delta_points={}".format(
+                    self.name,
+                    other.name,
+                    float(self.skill) / (self.skill + other.skill),
+                    expected,
+                    result,
+                    delta_points,
+                )
+            )
+
+
+def play_season(
+    nb_players,
+    nb_games,
+    nb_placement,
+    min_skill,
+    delta_skill,
+    elohell=False,
+    verbose=False,
+    engine="player",
+    seed=None,
+    history_dtype=np.float64,
+    trajectory_file=None,
+    convergence_threshold=0.95,
+    convergence_window=10,
+    stop_when_converged=False,
+    kendall=False,
+    checkpoint_file=None,
+    checkpoint_interval=60.0,
+    resume=False,
+    expected_table=None,
+    kernel=None,
+):
+    """Simulates a season and returns every player's elo history, without plotting anything
+
+    Keyword Arguments:
+        engine {str} -- "player" plays every game with Player objects, "numpy" uses the array-backed engine of
+        array_engine.py. Both give the same histories for the same seed (default: {"player"})
+        seed {int} -- Seed of the random generator, None for a fresh one (default: {None})
+        history_dtype {np.dtype} -- Type used to store the elo histories, np.float32 halves the memory
+        (default: {np.float64})
+        trajectory_file {str} -- If not None, the histories are written to this memory-mapped file during the
+        simulation instead of being kept in memory (numpy engine only, see trajectories.py) (default: {None})
+        convergence_threshold {float} -- The season has converged when the Spearman correlation between the skills
+        and the elo ratings stays at or above this value... (default: {0.95})
+        convergence_window {int} -- ... for this many journeys (default: {10})
+        stop_when_converged {bool} -- Stops the season as soon as it converged (default: {False})
+        kendall {bool} -- Also computes Kendall's tau after each journey, O(players^2) per journey (default: {False})
+        checkpoint_file {str} -- If not None, the state of the season is saved to this file every
+        'checkpoint_interval' seconds and on Ctrl-C, and removed at the end of the season (see checkpoint.py). Not
+        in elohell mode. With a trajectory file the histories are not saved, the file is reopened (default: {None})
+        checkpoint_interval {float} -- Minimum time in seconds between two checkpoints (default: {60.0})
+        resume {bool} -- Continues the season saved in 'checkpoint_file' if it exists, with either engine. The
+        histories are the same as without the interruption (default: {False})
+        expected_table {expected_score.ExpectedScoreTable} -- If not None, the numpy engine looks the expected
+        results up in this table: faster, but the histories are not exactly the ones of the player engine anymore
+        (default: {None})
+        kernel {rating_kernels.RatingKernel} -- If not None, the numpy engine rates the players with this kernel
+        (its own K factors for elo) and the histories hold its ratings. No checkpoints (default: {None})
+
+    Returns:
+        dict -- "history" (games x players matrix of elo ratings), "names", "skills", "placement_games" (where the
+        placement games end on the plot) and "metrics" (convergence metrics of convergence.py, None in elohell mode)
+    """
+    if trajectory_file is not None and engine != "numpy":
+        print("trajectory files are only written by the numpy engine, ignoring it")
+        trajectory_file = None
+    if checkpoint_file is not None and elohell:
+        print("checkpoints are not written in elohell mode, ignoring it")
+        checkpoint_file = None
+    if expected_table is not None and (engine != "numpy" or elohell):
+        print(
+            "expected score tables are only used by the numpy engine, outside of elohell mode, ignoring it"
+        )
+        expected_table = None
+    if kernel is not None and (engine != "numpy" or elohell):
+        print(
+            "rating kernels are only used by the numpy engine, outside of elohell mode, ignoring it"
+        )
+        kernel = None
+    if kernel is not None and checkpoint_file is not None:
+        print("checkpoints are not written with a rating kernel, ignoring it")
+        checkpoint_file = None
+    rng = np.random.default_rng(seed)
+    names = []
+    skills = []
+    for i in range(nb_players):
+        skill = min_skill + i * delta_skill
+        names.append("Elo of PlayerSkill(" + str(skill) + ")")
+        skills.append(skill)
+
+    normal_games = nb_games - nb_placement
+    if not (elohell):
+        # A journey consists of playing each player once. Each player will play journeys completely so the nb_games and nb_placement might not be respected
+        nb_journeys = math.ceil(nb_placement / float(nb_players - 1))
+        # No normal journeys when the placement games are more than the games
+        nb_normal_journeys = max(0, math.ceil(normal_games / float(nb_players - 1)))
+        actual_placement_games = nb_journeys * nb_players
+        placement_rows = nb_journeys * (nb_players - 1)
+        history_length = 1 + (nb_journeys + nb_normal_journeys) * (nb_players - 1)
+    else:
+        # No journeys in elohell mode, every player plays nb_games games, or all the placement games if there are more
+        nb_journeys = nb_normal_journeys = 0
+        actual_placement_games = nb_placement
+        placement_rows = nb_placement
+        history_length = 1 + max(nb_games, nb_placement)
+
+    # The state of the season at the end of a journey, see checkpoint.py. Both engines save and resume the same state.
+    settings = {
+        "nb_players": nb_players,
+        "nb_games": nb_games,
+        "nb_placement": nb_placement,
+        "min_skill": min_skill,
+        "delta_skill": delta_skill,
+        "history_dtype": np.dtype(history_dtype).str,
+        "trajectory_file": trajectory_file is not None,
+    }
+    if expected_table is not None:
+        # A season can't continue with other expected results than the ones it started with
+        settings["expected_table"] = expected_table.resolution
+    checkpointer = checkpoint.Checkpointer(
+        checkpoint_file, settings, checkpoint_interval
+    )
+    state = None
+    if resume and checkpoint_file is not None:
+        if os.path.exists(checkpoint_file):
+            state = checkpoint.load_checkpoint(checkpoint_file, settings)
+            rng = state["rng"]
+            print(
+                "Resuming from {} after {} journeys".format(
+                    checkpoint_file, state["journey"]
+                ),
+                file=sys.stderr,
+            )
+        else:
+            print(
+                "No checkpoint {}, starting the season".format(checkpoint_file),
+                file=sys.stderr,
+            )
+
+    tracker = None
+    if not (elohell):
+        # The metrics are updated after each journey, see convergence.py
+        tracker = ConvergenceTracker(
+            skills, convergence_threshold, convergence_window, kendall=kendall
+        )
+
+    if engine == "numpy":
+        writer = None
+        if trajectory_file is not None:
+            writer = TrajectoryWriter(
+                trajectory_file,
+                history_length,
+                nb_players,
+                dtype=history_dtype,
+                metadata={
+                    "names": names,
+                    "skills": skills,
+                    "nb_placement_games": placement_rows,
+                    "seed": seed,
+                },
+                resume=state is not None,
+            )
+            history = writer.data
+        else:
+            history = np.empty((history_length, nb_players), dtype=history_dtype)
+
+    row = 0
+    if state is not None:
+        row = state["row"]
+        if "history" in state:
+            saved_history = state["history"]
+        else:
+            saved_history = history[: row + 1]
+        # Same metrics as if the season had not been interrupted, exactly with float64 histories
+        for end in range(nb_players - 1, row + 1, nb_players - 1):
+            tracker.update(saved_history[end], end)
+
+    def season_state(row, elo, k_factor, history):
+        state = {
+            "journey": row // (nb_players - 1),
+            "row": row,
+            "elo": elo,
+            "k_factor": k_factor,
+            "rng": rng.bit_generator.state,
+        }
+        if trajectory_file is None:
+            state["history"] = history
+        else:
+            # The checkpoint continues from the rows of the file
+            writer.sync()
+        return state
+
+    if engine == "numpy" and elohell:
+        # Every game moves the elo by exactly +-K/2, no need for Player objects or fake opponents
+        array_engine.simulate_elohell(
+            nb_players,
+            nb_placement,
+            nb_games,
+            FORCED_WINRATE,
+            rng,
+            STARTING_ELO,
+            K_FACTOR_PLACEMENTS,
+            K_FACTOR,
+            history=history,
+        )
+        if trajectory_file is not None:
+            writer.set_rows_written(history_length)
+    elif engine == "numpy" and kernel is not None:
+        kernel_state = kernel.new_state(nb_players)
+        schedule = array_engine.RoundRobinSchedule(nb_players)
+        history[0] = kernel.ratings(kernel_state)
+
+        def on_journey(row):
+            if writer is not None:
+                writer.set_rows_written(row + 1)
+            converged = tracker.update(kernel.ratings(kernel_state), row)
+            return converged and stop_when_converged
+
+        row = array_engine.play_kernel_journeys(
+            kernel,
+            kernel_state,
+            skills,
+            schedule,
+            nb_journeys + nb_normal_journeys,
+            rng,
+            history,
+            on_journey=on_journey,
+        )
+        history = history[: row + 1]
+    elif engine == "numpy":
+        players = array_engine.ArrayPlayers(
+            names, skills, STARTING_ELO, K_FACTOR_PLACEMENTS
+        )
+        schedule = array_engine.RoundRobinSchedule(nb_players)
+        if state is None:
+            history[0] = players.elo
+        else:
+            players.elo[:] = state["elo"]
+            players.k_factor[:] = state["k_factor"]
+            if "history" in state:
+                history[: row + 1] = state["history"]
+
+        def on_journey(row):
+            if writer is not None:
+                writer.set_rows_written(row + 1)
+            converged = tracker.update(players.elo, row)
+            # The rows up to 'row' are never written again, they are saved without being copied
+            checkpointer.journey_done(
+                lambda: season_state(
+                    row,
+                    players.elo.copy(),
+                    players.k_factor.copy(),
+                    history[: row + 1],
+                )
+            )
+            return converged and stop_when_converged
+
+        with checkpointer:
+            played = row // (nb_players - 1)
+            if played < nb_journeys and not (
+                stop_when_converged and tracker.converged()
+            ):
+                row = array_engine.play_journeys(
+                    players,
+                    schedule,
+                    nb_journeys - played,
+                    rng,
+                    DIVIDER,
+                    history,
+                    start=row,
+                    on_journey=on_journey,
+                    expected_table=expected_table,
+                )
+            if not (stop_when_converged and tracker.converged()):
+                # Playing the normal games with a lower K
+                players.k_factor[:] = K_FACTOR
+                row = array_engine.play_journeys(
+                    players,
+                    schedule,
+                    nb_journeys + nb_normal_journeys - row // (nb_players - 1),
+                    rng,
+                    DIVIDER,
+                    history,
+                    start=row,
+                    on_journey=on_journey,
+                    expected_table=expected_table,
+                )
+        history = history[: row + 1]
+    else:
+        players = []
+        for p, (name, skill) in enumerate(zip(names, skills)):
+            player = Player(
+                name,
+                skill,
+                STARTING_ELO if state is None else float(state["history"][0, p]),
+                elo_history=RatingHistory(history_length, history_dtype),
+            )
+            if state is not None:
+                player.elo_history.extend(state["history"][1:, p])
+                player.elo = float(state["elo"][p])
+                player.k_factor = float(state["k_factor"][p])
+            players.append(player)
+        if not (elohell):
+            with checkpointer:
+                for journey in range(
+                    row // (nb_players - 1), nb_journeys + nb_normal_journeys
+                ):
+                    if stop_when_converged and tracker.converged():
+                        break
+                    if journey == nb_journeys:
+                        # Playing the normal games with a lower K
+                        for p in players:
+                            p.k_factor = K_FACTOR
+                    for i in range(nb_players):
+                        # Each player will play against each other the same amount of times
+                        player1 = players[i]
+                        for j in range(nb_players):
+                            if j <= i:
+                                continue
+                            player2 = players[j]
+                            player1.play_and_update(player2, verbose=verbose, rng=rng)
+                    row += nb_players - 1
+                    tracker.update([p.elo for p in players], row)
+                    # The histories only grow, their views are copied by the thread writing the checkpoint
+                    checkpointer.journey_done(
+                        lambda: season_state(
+                            row,
+                            np.array([p.elo for p in players]),
+                            np.array([p.k_factor for p in players]),
+                            [p.elo_history.view() for p in players],
+                        )
+                    )
+        else:
+            for mode in range(2):
+                # Playing the placement games with a high K (mode==0) then playing the normal games with a lower K (mode==1)
+                # In elohell mode players don't play against each other, they have a fixed winrate and play each 'actual_games' games against oponents of the same elo they are actually in
+                for p in players:
+                    for i in range(nb_placement if mode == 0 else normal_games):
+                        p.play_and_update(
+                            Player("FakePlayer", 10, elo=p.elo),
+                            elohell=elohell,
+                            forced_win_rate=FORCED_WINRATE,
+                            verbose=verbose,
+                            rng=rng,
+                        )
+                # Playing the normal games with a lower K
+                for p in players:
+                    p.k_factor = K_FACTOR
+        history = np.array([p.elo_history for p in players]).T
+    if trajectory_file is not None:
+        writer.close()
+    checkpointer.discard()
+
+    return {
+        "history": history,
+        "names": names,
+        "skills": skills,
+        "placement_games": actual_placement_games,
+        "metrics": None if tracker is None else tracker.metrics(),
+    }
+
+
+def replicate_stages(nb_players, nb_games, nb_placement):
+    """Returns the (number of journeys, K factor) stages of a season, the same journeys as play_season"""
+    nb_journeys = math.ceil(nb_placement / float(nb_players - 1))
+    nb_normal_journeys = max(
+        0, math.ceil((nb_games - nb_placement) / float(nb_players - 1))
+    )
+    return [(nb_journeys, K_FACTOR_PLACEMENTS), (nb_normal_journeys, K_FACTOR)]
+
+
+def play_replicates(
+    nb_players,
+    nb_games,
+    nb_placement,
+    min_skill,
+    delta_skill,
+    nb_replicates,
+    seed=None,
+    convergence_threshold=0.95,
+    convergence_window=10,
+    stop_when_converged=False,
+    expected_table=None,
+):
+    """Simulates 'nb_replicates' independent seasons at once, without plotting anything (see play_season for the
+    convergence settings and the expected score table)
+
+    Returns:
+        dict -- "stats" (statistics computed by array_engine.simulate_replicates), "skills", "placement_journeys",
+        "placement_games" and "metrics" (convergence metrics of convergence.py, one value per season)
+    """
+    rng = np.random.default_rng(seed)
+    skills = [min_skill + i * delta_skill for i in range(nb_players)]
+    stages = replicate_stages(nb_players, nb_games, nb_placement)
+    nb_journeys = stages[0][0]
+    tracker = ConvergenceTracker(skills, convergence_threshold, convergence_window)
+    stats = array_engine.simulate_replicates(
+        skills,
+        stages,
+        nb_replicates,
+        rng,
+        DIVIDER,
+        STARTING_ELO,
+        tracker=tracker,
+        stop_when_converged=stop_when_converged,
+        expected_table=expected_table,
+    )
+    return {
+        "stats": stats,
+        "skills": skills,
+        "placement_journeys": nb_journeys,
+        "placement_games": nb_journeys * (nb_players - 1),
+        "metrics": tracker.metrics(),
+    }
+
+
+def dynamic_settings(nb_players, nb_games, min_skill, delta_skill):
+    """Settings saved with the checkpoints of the dynamic mode, see dynamic_journeys"""
+    return {
+        "mode": "dynamic",
+        "nb_players": nb_players,
+        "nb_games": nb_games,
+        "min_skill": min_skill,
+        "delta_skill": delta_skill,
+    }
+
+
+def load_dynamic_checkpoint(
+    checkpoint_file, nb_players, nb_games, min_skill, delta_skill
+):
+    """Returns the state saved by dynamic_journeys in 'checkpoint_file', None if there is no such file"""
+    if not os.path.exists(checkpoint_file):
+        print(
+            "No checkpoint {}, starting from the first game".format(checkpoint_file),
+            file=sys.stderr,
+        )
+        return None
+    state = checkpoint.load_checkpoint(
+        checkpoint_file,
+        dynamic_settings(nb_players, nb_games, min_skill, delta_skill),
+    )
+    print(
+        "Resuming from {} after {} journeys".format(checkpoint_file, state["journey"]),
+        file=sys.stderr,
+    )
+    return state
+
+
+def dynamic_journeys(
+    nb_players,
+    nb_games,
+    min_skill,
+    delta_skill,
+    rng,
+    engine="player",
+    checkpoint_file=None,
+    checkpoint_interval=60.0,
+    state=None,
+):
+    """Plays the games of the dynamic mode journey by journey and yields, after each journey, the
+    (nb_players - 1) x nb_players block of new elo ratings
+
+    Keyword Arguments:
+        engine {str} -- "player" or "numpy", same results for the same rng. Player objects are faster for a handful
+        of players, the numpy engine for dozens of players and more (default: {"player"})
+        checkpoint_file {str} -- If not None, the ratings, the K factors, the journey index and the random state are
+        saved to this file every 'checkpoint_interval' seconds (see checkpoint.py). The histories are not kept by
+        the dynamic mode, so they are not saved either (default: {None})
+        checkpoint_interval {float} -- Minimum time in seconds between two checkpoints (default: {60.0})
+        state {dict} -- State returned by load_dynamic_checkpoint: the games continue from there with its random
+        generator instead of 'rng' (default: {None})
+    """
+    names = []
+    skills = []
+    for i in range(nb_players):
+        skill = min_skill + i * delta_skill
+        names.append("Elo of PlayerSkill(" + str(skill) + ")")
+        skills.append(skill)
+    # A journey consists of playing each player once. Each player will play journeys completely so the nb_games and nb_placement might not be respected
+    nb_journeys = math.ceil(nb_games / float(nb_players - 1))
+    first_journey = 0
+    if state is not None:
+        rng = state["rng"]
+        first_journey = state["journey"]
+    checkpointer = checkpoint.Checkpointer(
+        checkpoint_file,
+        dynamic_settings(nb_players, nb_games, min_skill, delta_skill),
+        checkpoint_interval,
+    )
+
+    def journey_state(journey, elo, k_factor):
+        return {
+            "journey": journey,
+            "row": journey * (nb_players - 1),
+            "elo": elo,
+            "k_factor": k_factor,
+            "rng": rng.bit_generator.state,
+        }
+
+    # Waiting for the checkpoint being written even if the consumer stops early
+    try:
+        if engine == "numpy":
+            # Playing the normal games with a lower K
+            players = array_engine.ArrayPlayers(
+                names, skills, STARTING_ELO, K_FACTOR_PLACEMENTS / 2.0
+            )
+            if state is not None:
+                players.elo[:] = state["elo"]
+                players.k_factor[:] = state["k_factor"]
+            schedule = array_engine.RoundRobinSchedule(nb_players)
+            block = np.empty((nb_players, nb_players))
+            for journey in range(first_journey, nb_journeys):
+                block[0] = players.elo
+                array_engine.play_journeys(players, schedule, 1, rng, DIVIDER, block)
+                checkpointer.journey_done(
+                    lambda: journey_state(
+                        journey + 1, players.elo.copy(), players.k_factor.copy()
+                    )
+                )
+                yield block[1:].copy()
+        else:
+            # Only the ratings of the last journey are needed
+            players = [
+                Player(
+                    name,
+                    skill,
+                    STARTING_ELO,
+                    elo_history=RatingHistory(last=nb_players - 1),
+                )
+                for name, skill in zip(names, skills)
+            ]
+            # Playing the normal games with a lower K
+            for p in players:
+                p.k_factor = p.k_factor / 2.0
+            if state is not None:
+                for p, elo, k_factor in zip(players, state["elo"], state["k_factor"]):
+                    p.elo = float(elo)
+                    p.k_factor = float(k_factor)
+            for journey in range(first_journey, nb_journeys):
+                for i in range(nb_players):
+                    # Each player will play against each other the same amount of times
+                    player1 = players[i]
+                    for j in range(nb_players):
+                        if j <= i:
+                            continue
+                        player2 = players[j]
+                        player1.play_and_update(player2, rng=rng)
+                checkpointer.journey_done(
+                    lambda: journey_state(
+                        journey + 1,
+                        np.array([p.elo for p in players]),
+                        np.array([p.k_factor for p in players]),
+                    )
+                )
+                yield np.array([p.elo_history for p in players]).T
+    finally:
+        checkpointer.wait()
+    checkpointer.discard()
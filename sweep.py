@@ -0,0 +1,395 @@
+"""
+Parameter sweep over rating configurations: K factor schedules, divider and starting elo.
+
+A configuration is a list of stages (number of games, K factor) played one after the other, e.g. LoL's 100 then 25,
+FIDE's 40 then 20 or BoardGameArena's 60, 40 then 20, plus the divider and the starting elo. Every configuration is
+played on the same round-robin seasons (array_engine.simulate_replicates) and summarized by its convergence
+(convergence.py) and its error against the true elo gaps implied by the skills.
+
+The points run on a pool of processes (runner.run_parallel) and each result is cached on disk under a hash of the
+configuration, the season settings and the seed, so re-running a partly changed sweep only computes the new points.
+The random stream of a point only depends on that hash and on the master seed, not on the other points of the sweep.
+"""
+
+import os
+import csv
+import json
+import math
+import time
+import hashlib
+import argparse
+import itertools
+import numpy as np
+import runner
+
+# Changing the way the points are simulated or summarized must invalidate the cache
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = ".sweep_cache"
+
+# See the comments at the top of elo.py
+PRESETS = {
+    "lol": {"stages": [[10, 100], [None, 25]], "divider": 400, "starting_elo": 1200},
+    "fide": {"stages": [[30, 40], [None, 20]], "divider": 400, "starting_elo": 1200},
+    "bga": {
+        "stages": [[10, 60], [10, 40], [None, 20]],
+        "divider": 400,
+        "starting_elo": 1200,
+    },
+}
+
+
+def make_config(stages, divider=400, starting_elo=1200, name=None):
+    """Returns a rating configuration.
+
+    Arguments:
+        stages {list} -- [nb_games, k_factor] pairs, nb_games None for the last stage means until the end of the
+        season
+
+    Keyword Arguments:
+        name {str} -- Label of the configuration in the table, built from the stages if None (default: {None})
+    """
+    stages = [[games, float(k)] for games, k in stages]
+    if name is None:
+        name = "K " + "->".join("{:g}".format(k) for games, k in stages)
+        name += " D{:g}".format(divider)
+    return {
+        "name": name,
+        "stages": stages,
+        "divider": float(divider),
+        "starting_elo": float(starting_elo),
+    }
+
+
+def grid(k_placements, k_factors, placement_games, dividers=(400,), starting_elo=1200):
+    """Returns every two-stage configuration (placement games with one K, then the rest of the season with another)
+    of the cartesian product of the values"""
+    return [
+        make_config([[games, kp], [None, k]], divider, starting_elo)
+        for kp, k, games, divider in itertools.product(
+            k_placements, k_factors, placement_games, dividers
+        )
+    ]
+
+
+def point_key(config, season, seed):
+    """Returns the hash identifying a point of the sweep, its results and its random stream"""
+    description = json.dumps(
+        {
+            "version": CACHE_VERSION,
+            "stages": config["stages"],
+            "divider": config["divider"],
+            "starting_elo": config["starting_elo"],
+            "season": season,
+            "seed": seed,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def _journey_stages(config, nb_players, nb_games):
+    """Converts the (games, K) stages into (journeys, K) stages of a season of 'nb_games' games. A stage plays whole
+    journeys, so the next stages only get the games left after the ones it actually played
+    """
+    stages = []
+    remaining = nb_games
+    for games, k_factor in config["stages"]:
+        games = remaining if games is None else min(games, remaining)
+        nb_journeys = int(math.ceil(games / float(nb_players - 1)))
+        stages.append((nb_journeys, k_factor))
+        remaining = max(remaining - nb_journeys * (nb_players - 1), 0)
+    return stages
+
+
+def point_task(rng, config, season):
+    """Plays the seasons of one point of the sweep and returns its metrics (see run_sweep)"""
+    import array_engine
+    from convergence import ConvergenceTracker
+
+    nb_players = season["nb_players"]
+    skills = season["min_skill"] + np.arange(nb_players) * float(season["delta_skill"])
+    tracker = ConvergenceTracker(skills, season["threshold"], season["window"])
+    stats = array_engine.simulate_replicates(
+        skills,
+        _journey_stages(config, nb_players, season["nb_games"]),
+        season["nb_seasons"],
+        rng,
+        config["divider"],
+        config["starting_elo"],
+        percentiles=(50,),
+        tracker=tracker,
+        stop_when_converged=season["stop_when_converged"],
+    )
+    # Elo ratings matching the skills: skill_i / (skill_i + skill_j) = 1 / (1 + 10^((elo_j - elo_i) / divider)).
+    # The sum of the elo ratings never changes, which fixes the constant.
+    true_elo = config["divider"] * np.log10(skills)
+    true_elo += config["starting_elo"] - true_elo.mean()
+    error = stats["final"] - true_elo
+    metrics = tracker.metrics()
+    converged_at = metrics["converged_at"]
+    converged = converged_at[converged_at >= 0]
+    return {
+        "games": int(metrics["games"][-1]),
+        "fraction_converged": float(np.mean(converged_at >= 0)),
+        "games_to_convergence": float(np.median(converged)) if len(converged) else None,
+        "final_spearman": float(np.mean(metrics["spearman"][-1])),
+        "correct_order": float(stats["correct_order"][-1]),
+        "rmse": float(np.sqrt(np.mean(error**2))),
+        "final_rolling_std": float(np.mean(metrics["rolling_std"][-1])),
+    }
+
+
+def _write_point(path, point):
+    """Writes a cached point to a temporary file first, so that an interrupted sweep never leaves a truncated one"""
+    temporary = path + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(point, f)
+    os.replace(temporary, path)
+
+
+def run_sweep(
+    configs,
+    season,
+    seed=0,
+    cache_dir=DEFAULT_CACHE_DIR,
+    nb_workers=None,
+    verbose=True,
+):
+    """Runs every configuration on the same seasons, reusing the cached points.
+
+    Arguments:
+        configs {list} -- Rating configurations, see make_config, grid and PRESETS
+        season {dict} -- Settings shared by every point: nb_players, nb_games, min_skill, delta_skill, nb_seasons,
+        threshold and window (convergence criterion, see convergence.py) and stop_when_converged
+
+    Keyword Arguments:
+        seed {int} -- Master seed (default: {0})
+        cache_dir {str} -- Directory of the cached points, None disables the cache (default: {DEFAULT_CACHE_DIR})
+        nb_workers {int} -- Number of processes, all cores if None (default: {None})
+
+    Returns:
+        list -- One row per configuration, in order: the name and the settings of the configuration followed by
+        "games" (played per player), "fraction_converged", "games_to_convergence" (median over the converged
+        seasons), "final_spearman", "correct_order" (fraction of seasons ranking every player right at the end),
+        "rmse" (final elo vs the elo implied by the skills), "final_rolling_std" and "cached"
+    """
+    if season["min_skill"] <= 0 or (
+        season["min_skill"] + (season["nb_players"] - 1) * season["delta_skill"] <= 0
+    ):
+        raise ValueError(
+            "The skills must be positive, got min_skill={} and delta_skill={}".format(
+                season["min_skill"], season["delta_skill"]
+            )
+        )
+    keys = [point_key(config, season, seed) for config in configs]
+    results = {}
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for key in set(keys):
+            path = os.path.join(cache_dir, key + ".json")
+            if os.path.exists(path):
+                try:
+                    with open(path) as f:
+                        results[key] = json.load(f)["metrics"]
+                except (ValueError, KeyError):
+                    # Left by an interrupted sweep before the writes were atomic: computed again
+                    pass
+    cached = set(results)
+    missing = [
+        (key, config)
+        for k, (key, config) in enumerate(zip(keys, configs))
+        if key not in results and key not in keys[:k]
+    ]
+    if missing:
+        start = time.perf_counter()
+        # The stream of a point comes from its hash, so it doesn't depend on the other points
+        seeds = [
+            np.random.SeedSequence(
+                [seed] + [int(key[i : i + 8], 16) for i in range(0, 32, 8)]
+            )
+            for key, config in missing
+        ]
+        outputs, timings = runner.run_parallel(
+            point_task,
+            [(config, season) for key, config in missing],
+            nb_workers=nb_workers,
+            seeds=seeds,
+        )
+        for (key, config), metrics in zip(missing, outputs):
+            results[key] = metrics
+            if cache_dir is not None:
+                _write_point(
+                    os.path.join(cache_dir, key + ".json"),
+                    {
+                        "config": config,
+                        "season": season,
+                        "seed": seed,
+                        "metrics": metrics,
+                    },
+                )
+        if verbose:
+            print(
+                "Computed {} points in {:.3f}s on {} workers, {} points reused (cached or identical)".format(
+                    len(missing),
+                    time.perf_counter() - start,
+                    timings["nb_workers"],
+                    len(configs) - len(missing),
+                )
+            )
+    elif verbose:
+        print("All the {} points come from the cache".format(len(configs)))
+
+    table = []
+    for key, config in zip(keys, configs):
+        row = {
+            "name": config["name"],
+            "stages": json.dumps(config["stages"]),
+            "divider": config["divider"],
+            "starting_elo": config["starting_elo"],
+        }
+        row.update(results[key])
+        row["cached"] = key in cached
+        table.append(row)
+    return table
+
+
+def print_table(table):
+    print(
+        "{:<28} {:>7} {:>10} {:>13} {:>9} {:>8} {:>8} {:>8}".format(
+            "configuration",
+            "games",
+            "converged",
+            "games needed",
+            "spearman",
+            "order",
+            "rmse",
+            "std",
+        )
+    )
+    for row in table:
+        print(
+            "{:<28} {:>7} {:>9.1f}% {:>13} {:>9.4f} {:>7.1f}% {:>8.1f} {:>8.1f}".format(
+                row["name"][:28],
+                row["games"],
+                100 * row["fraction_converged"],
+                (
+                    "-"
+                    if row["games_to_convergence"] is None
+                    else "{:.0f}".format(row["games_to_convergence"])
+                ),
+                row["final_spearman"],
+                100 * row["correct_order"],
+                row["rmse"],
+                row["final_rolling_std"],
+            )
+        )
+
+
+def write_csv(table, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(table[0].keys()))
+        writer.writeheader()
+        writer.writerows(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compares K factor schedules and dividers on the same round-robin seasons, on all cores, with cached results"
+    )
+    parser.add_argument("nb_players", type=int, help="Number of players to create")
+    parser.add_argument(
+        "nb_games", type=int, help="Number of games each player will play"
+    )
+    parser.add_argument("min_skill", type=int, help="Skill of the worst player")
+    parser.add_argument("delta_skill", type=int, help="Skill gap between players")
+    parser.add_argument(
+        "--seasons", type=int, default=1000, help="Number of seasons per point"
+    )
+    parser.add_argument(
+        "--presets",
+        nargs="*",
+        choices=sorted(PRESETS),
+        default=sorted(PRESETS),
+        help="Schedules of real rating systems to include",
+    )
+    parser.add_argument(
+        "--k-placements",
+        type=float,
+        nargs="*",
+        default=[],
+        help="Grid: K factors of the placement games",
+    )
+    parser.add_argument(
+        "--k-factors",
+        type=float,
+        nargs="*",
+        default=[],
+        help="Grid: K factors after the placement games",
+    )
+    parser.add_argument(
+        "--placement-games",
+        type=int,
+        nargs="*",
+        default=[10],
+        help="Grid: numbers of placement games",
+    )
+    parser.add_argument(
+        "--dividers", type=float, nargs="*", default=[400], help="Grid: dividers"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.9,
+        help="A season has converged when its Spearman correlation stays above this value...",
+    )
+    parser.add_argument(
+        "--window", type=int, default=10, help="... for this many journeys"
+    )
+    parser.add_argument(
+        "--stop-when-converged",
+        action="store_true",
+        help="Stops the seasons of a point once all of them converged",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Master seed")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of processes (all cores)"
+    )
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument(
+        "--no-cache", action="store_true", help="Computes every point again"
+    )
+    parser.add_argument(
+        "--csv", default=None, help="Also writes the table to this file"
+    )
+    args = parser.parse_args()
+    if (
+        args.min_skill <= 0
+        or args.min_skill + (args.nb_players - 1) * args.delta_skill <= 0
+    ):
+        parser.error("the skills must be positive")
+
+    configs = [make_config(name=name, **PRESETS[name]) for name in args.presets]
+    if args.k_placements and args.k_factors:
+        configs += grid(
+            args.k_placements, args.k_factors, args.placement_games, args.dividers
+        )
+    season = {
+        "nb_players": args.nb_players,
+        "nb_games": args.nb_games,
+        "min_skill": args.min_skill,
+        "delta_skill": args.delta_skill,
+        "nb_seasons": args.seasons,
+        "threshold": args.threshold,
+        "window": args.window,
+        "stop_when_converged": args.stop_when_converged,
+    }
+    table = run_sweep(
+        configs,
+        season,
+        seed=args.seed,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        nb_workers=args.workers,
+    )
+    print_table(table)
+    if args.csv:
+        write_csv(table, args.csv)
@@ -0,0 +1,281 @@
+"""
+5v5 team games with the inter model of elo_hell.py, thousands of games at a time.
+
+Every round, the players looking for a game are sorted by elo (matchmaking.RatingIndex), cut into groups of 10
+neighbours and each group is split into two teams of close average elo. The expected result of a team comes from the
+average elo of its members, the actual result from the inters: each player is an inter with their own probability, the
+team with fewer inters wins and a coin decides when both teams have as many. Every member of a team gets the elo
+update of their team, with their own K factor.
+
+All the games of a round are independent (nobody plays twice in a round), so they are drawn and applied as a few array
+operations on (games x team size) matrices instead of one call per player.
+"""
+
+import sys
+import time
+import argparse
+import numpy as np
+import array_engine
+import elo_hell
+from expected_score import expected_scores
+from matchmaking import RatingIndex
+
+TEAM_SIZE = 5
+
+
+def snake_draft(team_size=TEAM_SIZE):
+    """Returns the positions (in a group of 2 * team_size players sorted by elo) of the members of each team.
+
+    The players are picked A, B, B, A, A, B, B, A... so both teams get the same number of players from the bottom
+    and the top of the group.
+    """
+    positions = np.arange(2 * team_size)
+    in_a = np.isin(positions % 4, (0, 3))
+    return positions[in_a], positions[~in_a]
+
+
+def form_teams(index, queued=None, team_size=TEAM_SIZE, shift=0):
+    """Groups the players looking for a game by 2 * team_size neighbours in the rating index and splits each group
+    into two teams.
+
+    Arguments:
+        index {RatingIndex} -- Players sorted by elo
+
+    Keyword Arguments:
+        queued {np.ndarray} -- Boolean mask of the players looking for a game, everybody if None (default: {None})
+        team_size {int} -- Number of players per team (default: {TEAM_SIZE})
+        shift {int} -- Number of players left out at the bottom of the index, changing it every round changes the
+        groups (default: {0})
+
+    Returns:
+        tuple -- (team_a, team_b), two (games x team_size) matrices of player indices
+    """
+    candidates = index.order if queued is None else index.order[queued[index.order]]
+    candidates = candidates[shift:]
+    group_size = 2 * team_size
+    nb_games = len(candidates) // group_size
+    groups = candidates[: nb_games * group_size].reshape(nb_games, group_size)
+    positions_a, positions_b = snake_draft(team_size)
+    return groups[:, positions_a], groups[:, positions_b]
+
+
+def play_team_games(players, proba_of_inter, team_a, team_b, rng, divider):
+    """Plays the games team_a[g] vs team_b[g] and updates the elo of every member in place. No player may appear
+    twice.
+
+    Arguments:
+        players {array_engine.ArrayPlayers} -- The players
+        proba_of_inter {np.ndarray} -- Probability of each player being an inter in a game
+        team_a {np.ndarray} -- (games x team size) matrix of player indices
+        team_b {np.ndarray} -- (games x team size) matrix of player indices
+        rng {np.random.Generator} -- Source of randomness
+        divider {float} -- Elo divider (400 in the usual formula)
+
+    Returns:
+        np.ndarray -- Result of each game for team A (1 for a win, 0 for a loss)
+    """
+    nb_games, team_size = team_a.shape
+    members = np.concatenate((team_a, team_b), axis=1)
+    # Same test as elo_hell.randomize_is_inter: an inter if rand < precision * proba_of_inter
+    rand = rng.integers(
+        0, array_engine.PRECISION + 1, size=members.shape, dtype=np.int32
+    )
+    inters = rand < array_engine.PRECISION * proba_of_inter[members]
+    nb_inters_a = np.count_nonzero(inters[:, :team_size], axis=1)
+    nb_inters_b = np.count_nonzero(inters[:, team_size:], axis=1)
+    coin_flips = rng.integers(0, 2, size=nb_games, dtype=np.int32)
+    results = np.where(
+        nb_inters_a == nb_inters_b, coin_flips, nb_inters_a < nb_inters_b
+    ).astype(float)
+
+    elo = players.elo
+    team_elo_a = elo[team_a].mean(axis=1)
+    team_elo_b = elo[team_b].mean(axis=1)
+    expected = expected_scores(team_elo_a - team_elo_b, divider)
+    surprise = (results - expected)[:, np.newaxis]
+    elo[team_a] += players.k_factor[team_a] * surprise
+    elo[team_b] -= players.k_factor[team_b] * surprise
+    return results
+
+
+def simulate_team_ladder(
+    proba_of_inter,
+    nb_rounds,
+    rng,
+    team_size=TEAM_SIZE,
+    nb_placement_games=10,
+    activity=1.0,
+    divider=400,
+    starting_elo=elo_hell.STARTING_ELO,
+    k_factor_placements=elo_hell.K_FACTOR_PLACEMENTS,
+    k_factor=elo_hell.K_FACTOR,
+    on_round=None,
+):
+    """Simulates a ladder of team games where each round puts the players looking for a game in teams by elo.
+
+    Arguments:
+        proba_of_inter {np.ndarray} -- Probability of each player being an inter in a game
+        nb_rounds {int} -- Number of rounds, including the placement games
+        rng {np.random.Generator} -- Source of randomness
+
+    Keyword Arguments:
+        team_size {int} -- Number of players per team (default: {TEAM_SIZE})
+        nb_placement_games {int} -- Number of games played by each player with k_factor_placements before
+        switching to k_factor (default: {10})
+        activity {float} -- Probability that a player looks for a game in a given round (default: {1.0})
+        on_round {function} -- Called after each round with (round, players) (default: {None})
+
+    Returns:
+        dict -- "players" (array_engine.ArrayPlayers, the skill of a player is their probability of not being an
+        inter), "nb_games" and "nb_wins" per player, "mean_team_gap" (mean elo difference between the two teams of
+        each round) and "durations" (seconds per round)
+    """
+    proba_of_inter = np.asarray(proba_of_inter, dtype=float)
+    nb_players = len(proba_of_inter)
+    players = array_engine.ArrayPlayers(
+        [], 1 - proba_of_inter, starting_elo, k_factor_placements
+    )
+    index = RatingIndex(players.elo, rng)
+    nb_games = np.zeros(nb_players, dtype=np.int32)
+    nb_wins = np.zeros(nb_players, dtype=np.int32)
+    mean_team_gap = np.empty(nb_rounds)
+    durations = np.empty(nb_rounds)
+    for r in range(nb_rounds):
+        start = time.perf_counter()
+        queued = None if activity >= 1 else rng.random(nb_players) < activity
+        shift = int(rng.integers(0, 2 * team_size))
+        team_a, team_b = form_teams(index, queued, team_size, shift)
+        elo = players.elo
+        mean_team_gap[r] = (
+            np.abs(elo[team_a].mean(axis=1) - elo[team_b].mean(axis=1)).mean()
+            if len(team_a)
+            else 0
+        )
+        results = play_team_games(players, proba_of_inter, team_a, team_b, rng, divider)
+        nb_games[team_a] += 1
+        nb_games[team_b] += 1
+        nb_wins[team_a] += (results == 1)[:, np.newaxis]
+        nb_wins[team_b] += (results == 0)[:, np.newaxis]
+        players.k_factor[nb_games == nb_placement_games] = k_factor
+        index.update(players.elo)
+        durations[r] = time.perf_counter() - start
+        if on_round is not None:
+            on_round(r, players)
+    return {
+        "players": players,
+        "nb_games": nb_games,
+        "nb_wins": nb_wins,
+        "mean_team_gap": mean_team_gap,
+        "durations": durations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Simulates 5v5 games between many players, with the inter model of elo_hell.py"
+    )
+    parser.add_argument("nb_players", type=int, help="Number of players to create")
+    parser.add_argument("nb_rounds", type=int, help="Number of rounds to play")
+    parser.add_argument(
+        "--proba-of-inter",
+        type=float,
+        default=elo_hell.PROBA_OF_INTER,
+        help="Average probability of a player being an inter in a game",
+    )
+    parser.add_argument(
+        "--spread",
+        type=float,
+        default=0.0,
+        help="The probability of inter of each player is drawn uniformly within +-SPREAD of the average",
+    )
+    parser.add_argument(
+        "--heroes",
+        type=int,
+        default=1,
+        help="Number of players who are never inters, followed separately",
+    )
+    parser.add_argument("--team-size", type=int, default=TEAM_SIZE)
+    parser.add_argument(
+        "--activity",
+        type=float,
+        default=1.0,
+        help="Probability that a player looks for a game in a given round",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--plot",
+        action="store_true",
+        help="Plots the distribution of the final elo ratings and the elo of the heroes",
+    )
+    args = parser.parse_args()
+    if args.nb_players < 2 * args.team_size:
+        print("At least {} players are needed".format(2 * args.team_size))
+        sys.exit()
+
+    rng = np.random.default_rng(args.seed)
+    proba_of_inter = np.clip(
+        rng.uniform(
+            args.proba_of_inter - args.spread,
+            args.proba_of_inter + args.spread,
+            args.nb_players,
+        ),
+        0,
+        1,
+    )
+    heroes = np.arange(min(args.heroes, args.nb_players))
+    proba_of_inter[heroes] = 0
+    hero_elo = []
+    stats = simulate_team_ladder(
+        proba_of_inter,
+        args.nb_rounds,
+        rng,
+        team_size=args.team_size,
+        activity=args.activity,
+        on_round=lambda r, players: hero_elo.append(players.elo[heroes].mean()),
+    )
+    total = stats["durations"].sum()
+    nb_games = stats["nb_games"].sum() // (2 * args.team_size)
+    print(
+        "{} games of {}v{} in {:.3f}s ({:.0f} games/s, {:.1f} ms per round)".format(
+            nb_games,
+            args.team_size,
+            args.team_size,
+            total,
+            nb_games / max(total, 1e-9),
+            1000 * total / args.nb_rounds,
+        )
+    )
+    elo = stats["players"].elo
+    print(
+        "Final elo: mean {:.1f}, std {:.1f}, mean elo gap between teams {:.1f}".format(
+            elo.mean(), elo.std(), stats["mean_team_gap"][-1]
+        )
+    )
+    if len(heroes):
+        print(
+            "Heroes: winrate {:.4f} (elo hell model: {:.4f} against players of equal skill), final elo {:.1f}".format(
+                stats["nb_wins"][heroes].sum()
+                / float(max(stats["nb_games"][heroes].sum(), 1)),
+                elo_hell.exact_winrate(
+                    args.proba_of_inter, args.team_size - 1, args.team_size
+                ),
+                elo[heroes].mean(),
+            )
+        )
+    if args.plot:
+        import matplotlib.pyplot as plt
+
+        figure, (left, right) = plt.subplots(1, 2, figsize=(16, 7))
+        left.hist(elo, bins=100)
+        left.set_xlabel("Final elo")
+        left.set_ylabel("Players")
+        left.grid()
+        right.plot(np.arange(1, len(hero_elo) + 1), hero_elo)
+        right.set_xlabel("Rounds")
+        right.set_ylabel("Mean elo of the heroes")
+        right.grid()
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,19 @@
 import sys
 import os
-import matplotlib
 import math
 import random
 import argparse
-import matplotlib.pyplot as plt
 import numpy as np
 import time
+import binomial
 
 
-def randomize_is_winner(proba_of_win):
+def randomize_is_winner(proba_of_win, rng=None):
     precision = 10000
-    rand = random.randint(0, precision)
+    if rng is None:
+        rand = random.randint(0, precision)
+    else:
+        rand = rng.integers(0, precision + 1)
     if rand >= precision * proba_of_win:
         # Lost
         return 0
@@ -19,40 +21,138 @@ def randomize_is_winner(proba_of_win):
     return 1
 
 
-def simulate_duel(proba_of_win, nb_matchs, nb_points_per_match):
+def simulate_duel(proba_of_win, nb_matchs, nb_points_per_match, rng=None, verbose=True):
     match_wins = 0
     for i in range(nb_matchs):
         nb_points = 0
         for j in range(nb_points_per_match):
-            nb_points += randomize_is_winner(proba_of_win)
+            nb_points += randomize_is_winner(proba_of_win, rng)
         if nb_points > nb_points_per_match / 2:
             match_wins += 1
-    print(
-        "Player A won {} matchs over {} matchs ({} points played per match)".format(
-            match_wins, nb_matchs, nb_points_per_match
+    if verbose:
+        print(
+            "Player A won {} matchs over {} matchs ({} points played per match)".format(
+                match_wins, nb_matchs, nb_points_per_match
+            )
+        )
+    return match_wins
+
+
+def match_win_probability(proba_of_win, nb_points_per_match):
+    """Returns the exact probability that player A wins a match, i.e. wins strictly more than half of the points.
+
+    Arguments:
+        proba_of_win {float or np.ndarray} -- Probability of player A winning any point
+        nb_points_per_match {int} -- Number of points played per match. Nobody wins a match of 0 points
+    """
+    if nb_points_per_match < 0:
+        raise ValueError(
+            "The number of points per match can't be negative, got {}".format(
+                nb_points_per_match
+            )
         )
+    if nb_points_per_match == 0:
+        # Like simulate_duel and sample_duel: 0 points won is not more than half of 0
+        probability = np.zeros(np.shape(proba_of_win))
+        if np.ndim(proba_of_win) == 0:
+            return float(probability)
+        return probability
+    log_pmf = binomial.log_pmf(nb_points_per_match, proba_of_win)
+    # Summed in log space to stay accurate when the probabilities are tiny
+    probability = np.exp(
+        binomial.log_sum_exp(log_pmf[..., nb_points_per_match // 2 + 1 :])
     )
+    if np.ndim(proba_of_win) == 0:
+        return float(probability)
+    return probability
+
+
+def sample_duel(proba_of_win, nb_matchs, nb_points_per_match, rng=None):
+    """Same as simulate_duel but draws the number of points won in each match from a binomial distribution,
+    so millions of matchs only cost a few milliseconds. Returns the number of matchs won by player A.
+
+    Keyword Arguments:
+        rng {np.random.Generator} -- Source of randomness, a fresh one if None (default: {None})
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    nb_points = rng.binomial(nb_points_per_match, proba_of_win, nb_matchs)
+    return int(np.count_nonzero(nb_points > nb_points_per_match / 2))
+
+
+def win_probability_curve(probas_of_win, points_per_match):
+    """Returns the exact probability of winning a match for every probability of winning a point and every number
+    of points per match, as a (points per match x probabilities) matrix"""
+    probas_of_win = np.asarray(probas_of_win, dtype=float)
+    return np.array([match_win_probability(probas_of_win, n) for n in points_per_match])
+
+
+def plot_win_probability_curve(probas_of_win, points_per_match):
+    import matplotlib.pyplot as plt
+
+    curve = win_probability_curve(probas_of_win, points_per_match)
+    plt.figure(figsize=(10, 6))
+    for probas, proba_of_win in zip(curve.T, probas_of_win):
+        plt.plot(
+            points_per_match,
+            probas,
+            label="{:.3f} to win a point".format(proba_of_win),
+        )
+    plt.xscale("log")
+    plt.xlabel("Points per match")
+    plt.ylabel("Probability of winning the match")
+    plt.title("Probability of winning a match vs points per match")
+    plt.grid(True, which="both", linestyle="-", linewidth=0.5)
+    plt.legend()
+    plt.show()
 
 
 def main():
-    proba_of_win = 0.51
+    parser = argparse.ArgumentParser(
+        description="How often does the best player win a match when each point is nearly a coin flip?"
+    )
+    parser.add_argument(
+        "--proba-of-win",
+        type=float,
+        default=0.51,
+        help="Probability of player A winning any point",
+    )
+    parser.add_argument(
+        "--per-point",
+        action="store_true",
+        help="Also plays 100 matchs point by point, like the first version of this program",
+    )
+    parser.add_argument(
+        "--curve",
+        action="store_true",
+        help="Plots the probability of winning a match vs the number of points per match for several edges",
+    )
+    args = parser.parse_args()
+
+    proba_of_win = args.proba_of_win
     print(
         "Player A has a probability of {} to win any point during the match".format(
             proba_of_win
         )
     )
-    # 101 points played per match
-    simulate_duel(proba_of_win, 100, 101)
-    simulate_duel(proba_of_win, 100, 101)
-    simulate_duel(proba_of_win, 100, 101)
-    # 1001 points played per match
-    simulate_duel(proba_of_win, 100, 1001)
-    simulate_duel(proba_of_win, 100, 1001)
-    simulate_duel(proba_of_win, 100, 1001)
-    # 10001 points played per match
-    simulate_duel(proba_of_win, 100, 10001)
-    simulate_duel(proba_of_win, 100, 10001)
-    simulate_duel(proba_of_win, 100, 10001)
+    nb_matchs = 1000000
+    for nb_points_per_match in (101, 1001, 10001):
+        match_wins = sample_duel(proba_of_win, nb_matchs, nb_points_per_match)
+        print(
+            "{} points per match: exact probability of winning a match {:.4f}, won {} matchs over {}".format(
+                nb_points_per_match,
+                match_win_probability(proba_of_win, nb_points_per_match),
+                match_wins,
+                nb_matchs,
+            )
+        )
+        if args.per_point:
+            simulate_duel(proba_of_win, 100, nb_points_per_match)
+    if args.curve:
+        plot_win_probability_curve(
+            [0.501, 0.505, 0.51, 0.52, 0.55],
+            np.unique(np.logspace(0, 5, 200).astype(int)),
+        )
 
 
 if __name__ == "__main__":
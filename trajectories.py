@@ -0,0 +1,245 @@
+"""
+Memory-mapped storage of elo trajectories, for runs too large to keep every history in RAM.
+
+A trajectory file holds a (games x players) matrix of elo ratings behind a small header:
+- 8 bytes: magic number
+- 8 bytes: length of the JSON metadata
+- 8 bytes: number of rows already written, updated during the simulation
+- the JSON metadata (shape, dtype, names, settings of the run...), padded so that the matrix starts on a page boundary
+- the matrix, row by row
+
+The engines write their rows straight into the mapped matrix, and the file can be reopened without reading it, so
+a multi-gigabyte run can be inspected a few rows or a few players at a time.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+MAGIC = b"ELOTRAJ1"
+ALIGNMENT = 4096
+_ROWS_WRITTEN_OFFSET = len(MAGIC) + 8
+
+
+class TrajectoryWriter(object):
+    """
+    Creates a trajectory file and exposes its matrix as a writable np.memmap
+    """
+
+    def __init__(
+        self,
+        path,
+        nb_rows,
+        nb_players,
+        dtype=np.float32,
+        metadata=None,
+        resume=False,
+        sync_interval=1.0,
+    ):
+        """
+        Arguments:
+            path {str} -- File to create (overwritten if it exists)
+            nb_rows {int} -- Number of rows of the matrix, i.e. 1 + the number of games of each player
+            nb_players {int} -- Number of columns of the matrix
+
+        Keyword Arguments:
+            dtype {np.dtype} -- Type of the stored ratings (default: {np.float32})
+            metadata {dict} -- Anything JSON serializable describing the run (default: {None})
+            resume {bool} -- Reopens the existing file and keeps its rows instead of creating it again, e.g. to
+            resume a run from a checkpoint. Its shape and dtype must match (default: {False})
+            sync_interval {float} -- Minimum time in seconds between two flushes of the rows and updates of the
+            number of rows written in the header, see set_rows_written (default: {1.0})
+        """
+        self.sync_interval = sync_interval
+        self.last_sync = time.perf_counter()
+        if resume:
+            self.path = path
+            self.data, _, self.rows_written = open_trajectories(path, "r+")
+            if self.data.shape != (nb_rows, nb_players) or self.data.dtype != dtype:
+                raise ValueError(
+                    "{} holds a {} matrix of {}, not {} x {} of {}".format(
+                        path,
+                        self.data.shape,
+                        self.data.dtype,
+                        nb_rows,
+                        nb_players,
+                        np.dtype(dtype),
+                    )
+                )
+            self.offset = self.data.offset
+            self._header = open(path, "r+b")
+            return
+        header = json.dumps(
+            {
+                "shape": [nb_rows, nb_players],
+                "dtype": np.dtype(dtype).str,
+                "metadata": metadata or {},
+            }
+        ).encode()
+        offset = len(MAGIC) + 16 + len(header)
+        header += b" " * (-offset % ALIGNMENT)
+        self.path = path
+        self.offset = len(MAGIC) + 16 + len(header)
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.uint64(len(header)).tobytes())
+            f.write(np.uint64(0).tobytes())
+            f.write(header)
+            # Sparse file: the space is only used once the rows are written
+            f.truncate(self.offset + nb_rows * nb_players * np.dtype(dtype).itemsize)
+        self.data = np.memmap(
+            path,
+            dtype=dtype,
+            mode="r+",
+            offset=self.offset,
+            shape=(nb_rows, nb_players),
+        )
+        self.rows_written = 0
+        self._header = open(path, "r+b")
+
+    def write(self, rows):
+        """Appends a block of rows after the rows already written"""
+        rows = np.atleast_2d(rows)
+        self.data[self.rows_written : self.rows_written + len(rows)] = rows
+        self.set_rows_written(self.rows_written + len(rows))
+
+    def set_rows_written(self, rows_written):
+        """Records that the first 'rows_written' rows are complete, e.g. when an engine wrote them through self.data.
+        They are pushed to the disk with the header at most once every 'sync_interval' seconds, and by sync and
+        close"""
+        self.rows_written = rows_written
+        if time.perf_counter() - self.last_sync >= self.sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Pushes the written rows to the disk, then the number of rows written to the header"""
+        self.data.flush()
+        self._header.seek(_ROWS_WRITTEN_OFFSET)
+        self._header.write(np.uint64(self.rows_written).tobytes())
+        self._header.flush()
+        self.last_sync = time.perf_counter()
+
+    def close(self):
+        self.sync()
+        self._header.close()
+        del self.data
+
+
+def open_trajectories(path, mode="r"):
+    """Maps a trajectory file without reading it.
+
+    Arguments:
+        path {str} -- Trajectory file
+
+    Keyword Arguments:
+        mode {str} -- "r" for read-only, "r+" to modify the ratings (default: {"r"})
+
+    Returns:
+        tuple -- (matrix, metadata, rows_written). The matrix is a (games x players) np.memmap, metadata is the dict
+        given to TrajectoryWriter, rows_written tells how many rows were complete when the file was last updated.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a trajectory file".format(path))
+        header_length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        rows_written = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = json.loads(f.read(header_length))
+    data = np.memmap(
+        path,
+        dtype=np.dtype(header["dtype"]),
+        mode=mode,
+        offset=len(MAGIC) + 16 + header_length,
+        shape=tuple(header["shape"]),
+    )
+    return data, header["metadata"], rows_written
+
+
+def summarize(data, rows_written, chunk_rows=4096):
+    """Computes the final, lowest, highest and mean elo of each player by reading the matrix one chunk of rows
+    at a time, so the memory used does not depend on the number of games"""
+    nb_players = data.shape[1]
+    lowest = np.full(nb_players, np.inf)
+    highest = np.full(nb_players, -np.inf)
+    total = np.zeros(nb_players)
+    for start in range(0, rows_written, chunk_rows):
+        chunk = np.asarray(
+            data[start : min(start + chunk_rows, rows_written)], dtype=float
+        )
+        lowest = np.minimum(lowest, chunk.min(axis=0))
+        highest = np.maximum(highest, chunk.max(axis=0))
+        total += chunk.sum(axis=0)
+    return {
+        "final": np.asarray(data[rows_written - 1], dtype=float),
+        "lowest": lowest,
+        "highest": highest,
+        "mean": total / rows_written,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Inspects a trajectory file written by elo.py --trajectory-file without loading it in memory"
+    )
+    parser.add_argument("path", help="Trajectory file")
+    parser.add_argument(
+        "--players",
+        type=int,
+        nargs="*",
+        default=None,
+        help="Index of the players to show (all of them if not given)",
+    )
+    parser.add_argument(
+        "--plot",
+        action="store_true",
+        help="Plots the trajectories, reading at most --max-points rows",
+    )
+    parser.add_argument("--max-points", type=int, default=5000)
+    args = parser.parse_args()
+
+    data, metadata, rows_written = open_trajectories(args.path)
+    print(
+        "{}: {} rows x {} players of {} ({:.1f} MB), {} rows written".format(
+            args.path,
+            data.shape[0],
+            data.shape[1],
+            data.dtype,
+            os.path.getsize(args.path) / 1e6,
+            rows_written,
+        )
+    )
+    print(json.dumps({k: v for k, v in metadata.items() if k != "names"}))
+    if rows_written == 0:
+        sys.exit()
+    summary = summarize(data, rows_written)
+    players = args.players if args.players else range(data.shape[1])
+    names = metadata.get("names")
+    for p in players:
+        print(
+            "{}: final elo {:.1f}, lowest {:.1f}, highest {:.1f}, mean {:.1f}".format(
+                names[p] if names else p,
+                summary["final"][p],
+                summary["lowest"][p],
+                summary["highest"][p],
+                summary["mean"][p],
+            )
+        )
+    if args.plot:
+        import matplotlib.pyplot as plt
+
+        # Only every 'step'-th row is read from the disk
+        step = max(1, rows_written // args.max_points)
+        games = np.arange(0, rows_written, step)
+        for p in players:
+            plt.plot(
+                games,
+                data[:rows_written:step, p],
+                label=names[p] if names else str(p),
+                linewidth=2,
+            )
+        plt.xlabel("Games")
+        plt.ylabel("Elo")
+        plt.legend(loc=1)
+        plt.show()